@@ -0,0 +1,209 @@
+"""
+Helpers for running agno agents with the shared instrumentation.
+
+Every model call in the apps goes through `run_agent`, so latency,
+tokens, tool calls, errors and cost are recorded in one place.
+"""
+import time
+import uuid
+from typing import Any, Callable, Optional
+
+from deadline_utils import check_deadline, deadline
+from json_utils import parse_model
+from ledger_utils import ledger_scope, record_run
+from metrics_utils import (AGENT_FIRST_TOKEN, REQUESTS, REQUEST_LATENCY, STRUCTURED_OUTPUTS, record_agent_run,
+                           record_error)
+from pipeline_utils import record_stage_tokens
+from trace_utils import record_agent_span, trace
+
+
+def run_agent(agent: Any, message: Any, *, app: str, agent_name: Optional[str] = None,
+              timeout: Optional[float] = None, **kwargs) -> Any:
+    """
+    Runs an agno Agent and records its metrics.
+
+    Args:
+        agent: The agno Agent to run.
+        message: The message passed to `agent.run`.
+        app: The app label for metrics ("shalaye" or "immisense").
+        agent_name: Metric label for the agent; defaults to `agent.name`.
+        timeout: Optional seconds the run may take, within the current deadline.
+        **kwargs: Passed through to `agent.run` (e.g. images).
+
+    Returns:
+        The agno RunResponse.
+
+    Raises:
+        DeadlineExceeded: If the deadline has already passed (see deadline_utils).
+    """
+    name = agent_name or agent.name
+    model = getattr(getattr(agent, "model", None), "id", None)
+    started_at, start = time.time(), time.perf_counter()
+    try:
+        with deadline(timeout):
+            check_deadline(name)
+            response = agent.run(message, **kwargs)
+    except Exception as e:
+        record_error(app, name, e)
+        record_agent_span(name, started_at, time.perf_counter() - start, message, model=model, error=e)
+        raise
+    seconds = time.perf_counter() - start
+    record_agent_run(app, name, response, seconds)
+    record_stage_tokens(response)
+    record_agent_span(name, started_at, seconds, message, response, model=model)
+    _record_cost(app, name, response, agent, seconds, images=len(kwargs.get("images") or []))
+    return response
+
+
+def run_structured(agent: Any, message: str, output_model: type, *, app: str,
+                   agent_name: Optional[str] = None, **kwargs) -> Any:
+    """
+    Runs an agent that answers with a JSON object and validates the answer.
+
+    The answer is taken as is when the agent's response_model already produced
+    an `output_model`; otherwise near-valid JSON is repaired locally. Only an
+    answer that can't be read at all costs another call, made once with the
+    parse error appended.
+
+    Args:
+        agent: The agno Agent to run.
+        message: The message passed to `agent.run`.
+        output_model: The pydantic model the answer must match.
+        app: The app label for metrics.
+        agent_name: Metric label for the agent; defaults to `agent.name`.
+        **kwargs: Passed through to `run_agent` (e.g. timeout) and `agent.run`.
+
+    Returns:
+        The validated `output_model` instance.
+
+    Raises:
+        ValueError: If the retried answer can't be read either.
+    """
+    name = agent_name or agent.name
+    response = run_agent(agent, message, app=app, agent_name=name, **kwargs)
+    try:
+        output, outcome = parse_model(response.content, output_model)
+    except ValueError as e:
+        retry = f"{message}\n\nYour previous answer could not be read ({e}). Reply with only the JSON object."
+        response = run_agent(agent, retry, app=app, agent_name=name, **kwargs)
+        try:
+            output, _ = parse_model(response.content, output_model)
+        except ValueError:
+            STRUCTURED_OUTPUTS.inc(app=app, agent=name, outcome="failed")
+            raise
+        outcome = "retried"
+    STRUCTURED_OUTPUTS.inc(app=app, agent=name, outcome=outcome)
+    return output
+
+
+def stream_agent(agent: Any, message: Any, on_content: Callable[[str], None], *, app: str,
+                 agent_name: Optional[str] = None, timeout: Optional[float] = None, **kwargs) -> Any:
+    """
+    Runs an agno Agent with streaming, passing each content chunk on as it arrives.
+
+    Args:
+        agent: The agno Agent to run.
+        message: The message passed to `agent.run`.
+        on_content: Called with each new piece of text.
+        app: The app label for metrics.
+        agent_name: Metric label for the agent; defaults to `agent.name`.
+        timeout: Optional seconds the run may take, within the current deadline.
+        **kwargs: Passed through to `agent.run`.
+
+    Returns:
+        The complete agno RunResponse, as `run_agent` would return it.
+
+    Raises:
+        DeadlineExceeded: If the deadline passes before the stream ends.
+    """
+    name = agent_name or agent.name
+    model = getattr(getattr(agent, "model", None), "id", None)
+    started_at, start = time.time(), time.perf_counter()
+    first_content = None
+    try:
+        with deadline(timeout):
+            check_deadline(name)
+            for chunk in agent.run(message, stream=True, **kwargs):
+                # A model that keeps trickling tokens would never hit an HTTP timeout.
+                check_deadline(name)
+                content = getattr(chunk, "content", None)
+                # Only content deltas; intermediate-step events carry status text.
+                if getattr(chunk, "event", "RunResponse") == "RunResponse" and isinstance(content, str) and content:
+                    if first_content is None:
+                        first_content = time.perf_counter() - start
+                        AGENT_FIRST_TOKEN.observe(first_content, app=app, agent=name)
+                    on_content(content)
+    except Exception as e:
+        record_error(app, name, e)
+        record_agent_span(name, started_at, time.perf_counter() - start, message, model=model, error=e)
+        raise
+    seconds = time.perf_counter() - start
+    # The streamed chunks are deltas; the agent keeps the assembled response.
+    response = agent.run_response
+    record_agent_run(app, name, response, seconds)
+    record_stage_tokens(response)
+    record_agent_span(name, started_at, seconds, message, response, model=model, first_content_s=first_content)
+    _record_cost(app, name, response, agent, seconds, images=len(kwargs.get("images") or []))
+    return response
+
+
+def _record_cost(app: str, name: str, response: Any, agent: Any, seconds: Optional[float], images: int = 0) -> None:
+    model = getattr(getattr(agent, "model", None), "id", None)
+    try:
+        record_run(app, name, response, model=model, latency_s=seconds, images=images)
+    except Exception as e:
+        # The ledger is bookkeeping; a locked or unwritable database must not fail the request.
+        print(f"Failed to record {name} run in the ledger: {e}")
+
+
+def streamlit_scope(flow: str, analysis_id: Optional[str] = None):
+    """
+    Returns a `ledger_scope` for the current Streamlit session.
+
+    Args:
+        flow: The flow being run (e.g. "analysis", "followup", "assessment").
+        analysis_id: The analysis the runs belong to; a new id is generated if omitted.
+    """
+    import streamlit as st
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    try:
+        user_id = st.user.get("email")
+    except Exception:
+        user_id = None
+    return ledger_scope(
+        flow=flow,
+        analysis_id=analysis_id or uuid.uuid4().hex,
+        session_id=ctx.session_id if ctx is not None else None,
+        user_id=user_id,
+    )
+
+
+class track_request:
+    """
+    Context manager counting a user-facing request, observing its latency and
+    opening its trace (see trace_utils).
+
+    Usage:
+        with track_request("shalaye", "analysis"):
+            ...
+    """
+
+    def __init__(self, app: str, flow: str):
+        self.app, self.flow = app, flow
+
+    def __enter__(self):
+        REQUESTS.inc(app=self.app, flow=self.flow)
+        self.start = time.perf_counter()
+        self.trace = trace(f"{self.app}.{self.flow}", app=self.app, flow=self.flow)
+        self.trace.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        REQUEST_LATENCY.observe(time.perf_counter() - self.start, app=self.app, flow=self.flow)
+        # st.rerun()/st.stop() raise BaseExceptions for control flow; only real errors count.
+        if isinstance(exc, Exception):
+            record_error(self.app, self.flow, exc)
+        self.trace.__exit__(exc_type, exc, tb)
+        return False
@@ -1,18 +1,38 @@
-from agno.agent import Agent
-from agno.models.google import Gemini
-from agno.tools.exa import ExaTools
-from PIL import Image
 from agent_task.agent_instructions import *
 from dotenv import load_dotenv
 import streamlit as st
-import os,tempfile,re,time 
+import os,tempfile,re,time,uuid
+from typing import TYPE_CHECKING
 from shalaye_utils import *
+from coldstart import warm_up_in_background
+from metrics_utils import record_error, start_metrics_server, track_render
+from agent_utils import run_agent, track_request, streamlit_scope
+from routing_utils import route, run_with_escalation, score_shalaye_request
+from singleflight_utils import request_fingerprint, singleflight
+from replay_utils import tool_hooks, wrap_model
+from deadline_utils import bounded_tool_call, deadline, has_time, record_timeout
+from image_utils import ImageRejected, ingest_image
+from pipeline_utils import DEGRADED_KEY
+
+# agno, google-genai, exa and PIL are heavy to import; they are only pulled in
+# when an agent or image is actually needed so the first paint stays fast.
+if TYPE_CHECKING:
+    from agno.agent import Agent
+    from image_utils import IngestedImage
 
 load_dotenv()
+start_metrics_server()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 EXA_API_KEY = os.getenv("EXA_API_KEY")
 
+# Time budget of one analysis or follow-up; web research stops early to stay within it.
+SHALAYE_DEADLINE_SECONDS = float(os.getenv("SHALAYE_DEADLINE_SECONDS", "90"))
+# The format repair call is skipped when less than this is left.
+REPAIR_MIN_SECONDS = float(os.getenv("REPAIR_MIN_SECONDS", "10"))
+# Follow-up exchanges shown by default; earlier ones sit behind a toggle.
+RECENT_CHAT_ENTRIES = 3
+
 
 st.set_page_config(
     page_title="ShalayeAI",
@@ -29,35 +49,18 @@ st.logo(
 
 
 
-def create_shalaye_agent() -> Agent:
-    """
-    Creates the ShalayeAI agent.
-
-    Args:
-        gemini_api_key: The API key for the Gemini LLM.
-        exa_api_key: The API key for the Exa search engine.
-
-    Returns:
-        An Agno Agent instance.
-    """
-    tools = [ExaTools(api_key=EXA_API_KEY)]
-
-    shalaye_agent = Agent(
-        model=Gemini(id="gemini-2.0-flash", api_key=GOOGLE_API_KEY),
-        tools=tools,
-        name="ShalayeAI",
-        description=agent_description,
-        instructions=INSTRUCTIONS,
-        markdown=True,
-    )
-    return shalaye_agent
+def create_followup_agent(model_id: str = "gemini-2.0-flash") -> "Agent":
+    from agno.agent import Agent
+    from agno.models.google import Gemini
+    from agno.tools.exa import ExaTools
+    from http_utils import gemini_client_params, pool_exa
 
-def create_followup_agent() -> Agent:
-    tools = [ExaTools(api_key=EXA_API_KEY)]
+    tools = [pool_exa(ExaTools(api_key=EXA_API_KEY))]
 
     followup_agent = Agent(
-        model=Gemini(id="gemini-2.0-flash", api_key=GOOGLE_API_KEY),
+        model=wrap_model(Gemini(id=model_id, api_key=GOOGLE_API_KEY, client_params=gemini_client_params())),
         tools=tools,
+        tool_hooks=[bounded_tool_call, *(tool_hooks() or [])],
         name="ShalayeAI",
         description=followup_agent_description,
         instructions=FOLLOWUP_INSTRUCTIONS,
@@ -65,19 +68,213 @@ def create_followup_agent() -> Agent:
     )
     return followup_agent
 
-def optimize_image(image: Image.Image) -> Image.Image:
+def create_repair_agent(model_id: str = "gemini-2.0-flash") -> "Agent":
+    """Creates a tool-less agent that only writes missing report sections."""
+    from agno.agent import Agent
+    from agno.models.google import Gemini
+    from http_utils import gemini_client_params
+
+    return Agent(
+        model=wrap_model(Gemini(id=model_id, api_key=GOOGLE_API_KEY, client_params=gemini_client_params())),
+        name="ReportRepair",
+        instructions=REPAIR_INSTRUCTIONS,
+        markdown=True,
+    )
+
+def repair_report(content: str) -> str:
     """
-    Optimizes an image for analysis by resizing and converting it to JPEG.
+    Fills in missing or malformed report sections without re-running the analysis.
 
     Args:
-        image: A PIL Image object.
+        content: The report returned by the ShalayeAI agent.
 
     Returns:
-        An optimized PIL Image object.
+        The report with the repaired sections spliced in (unchanged if nothing is missing).
+    """
+    missing = missing_report_sections(content)
+    if not missing:
+        return content
+    response = run_agent(create_repair_agent(), build_repair_prompt(content, missing), app="shalaye", agent_name="repair")
+    return splice_report_sections(content, response.content or "", missing)
+
+@st.fragment
+def show_report_sections(content: str) -> None:
+    """
+    Shows the report's lead text and summary, with every other section behind a toggle.
+
+    Streamlit sends an expander's contents even while it is closed, so toggles
+    are used instead: a section is only sent once it is opened, and the reruns
+    from the chat and suggestion buttons don't re-send the whole report. A
+    fragment, so opening a section reruns only the report.
+    """
+    with track_render("shalaye", "report"):
+        analysis_id = st.session_state.get("analysis_id") or ""
+        for index, (title, body) in enumerate(split_report_sections(content)):
+            if is_summary_section(title):
+                if title:
+                    st.subheader(title)
+                st.markdown(body, unsafe_allow_html=True)
+            elif st.toggle(title, key=f"report_section_{analysis_id}_{index}"):
+                with st.container(border=True):
+                    st.markdown(body, unsafe_allow_html=True)
+
+def results_header(content: str) -> None:
+    """
+    The product name, health indicator chart and risk summary above the report.
+
+    It has no widgets, so it only reruns with the whole page; the chart comes
+    from parameter_chart_png's cache rather than being redrawn.
+    """
+    with track_render("shalaye", "header"):
+        #Display Product Identification
+        detected = re.search(r'📸 Detected: (.+)', content)
+        if detected:
+            # Themed product name
+            st.markdown(f"""
+            ### Product: <span style="color: #a29bfe;">{detected.group(1)}</span>
+            ---
+            """, unsafe_allow_html=True)
+
+        # Display Parameter Breakdown
+        breakdown_text = re.search(r'🔍 Breakdown:(.+?)(?:🚨|$)', content, re.DOTALL)
+        if breakdown_text:
+            st.subheader("📊 Health Indicators")
+            scores = extract_scores(breakdown_text.group(1))
+            if scores:
+                for param, score in scores.items():
+                    # Themed score display
+                    st.markdown(f"""
+                    <div style="margin-bottom: 15px;">
+                        <div style="display: flex; justify-content: space-between; margin-bottom: 5px;">
+                            <span style="color: #F0F0F0;">{param}</span>
+                            <span style="color: #a29bfe;">{score}/5</span>
+                        </div>
+                        <div style="height: 8px; border-radius: 4px; background: linear-gradient(90deg, #6c5ce7, #a29bfe); width: {score*20}%;"></div>
+                    </div>
+                    """, unsafe_allow_html=True)
+                st.image(parameter_chart_png(tuple(scores.items())), use_container_width=True)
+            else:
+                st.info("No detailed parameter scores found in the initial analysis.")
+
+        # Display Risk Assessment
+        st.subheader("⚠️ Safety Assessment")
+        high_risks = extract_risks(content, "🚨 High-Risk:")
+        moderate_risks = extract_risks(content, "⚠️ Moderate Risk:")
+        low_risks = extract_risks(content, "✅ Low Risk:")
+
+        if high_risks:
+            st.error(f"**🚨 High-Risk Ingredients:** {', '.join(high_risks)}")
+        if moderate_risks:
+            st.warning(f"**⚠️ Moderate Risk Ingredients:** {', '.join(moderate_risks)}")
+        if low_risks:
+            st.success(f"**✅ Low Risk Ingredients:** {', '.join(low_risks)}")
+
+        if not (high_risks or moderate_risks or low_risks):
+            st.info("No specific risk categories found in the initial analysis, or all ingredients are low risk.")
+
+def use_suggestion(suggestion: str) -> None:
+    """Puts a suggested follow-up question in the question box."""
+    st.session_state.user_query = st.session_state.query_input = suggestion
+
+@st.fragment
+def followup_chat(content: str) -> None:
+    """
+    The follow-up chat: history, question box, suggestions and answers.
+
+    A fragment, so typing, picking a suggestion or asking a question reruns
+    only this part of the page, not the theme, chart and report above it.
+    """
+    with track_render("shalaye", "chat"):
+        # Display chat history; older exchanges are only sent when asked for
+        history = st.session_state.chat_history
+        earlier = len(history) - RECENT_CHAT_ENTRIES
+        if earlier > 0 and not st.toggle(f"Show {earlier} earlier question{'s' if earlier > 1 else ''}",
+                                         key=f"show_earlier_chat_{st.session_state.get('analysis_id') or ''}"):
+            history = history[earlier:]
+        for entry in history:
+            st.markdown(f"**You:** {entry['query']}")
+            st.markdown(f"**ShalayeAI:** {entry['response']}")
+            st.markdown("---")
+
+        # User input for subsequent queries
+        if "query_input" not in st.session_state:
+            st.session_state.query_input = st.session_state.user_query
+        st.session_state.user_query = st.text_area("Enter your question:", key="query_input")
+
+        # Suggested queries
+        st.subheader("Suggested Follow-up Questions")
+        query_buttons_follow_up = [
+            "Tell me more about the benefits of [Specific Ingredient from report].",
+            "Are there any alternative products with similar benefits but fewer risks?",
+            "Explain the long-term effects of consuming this product.",
+            "Is this safe for pregnant women?",
+            "I want more information about allergies.",
+        ]
+
+        # Add personalized suggestions if profile exists
+        if st.session_state.user_profile['profile_complete']:
+            personalized_suggestions = [
+                "How does this product align with my health goals?",
+                "Any specific concerns based on my health conditions?",
+                "Does this product interact with my medications?",
+            ]
+            query_buttons_follow_up = personalized_suggestions + query_buttons_follow_up
+
+        cols_follow_up = st.columns(min(len(query_buttons_follow_up), 3))
+        for i, suggestion in enumerate(query_buttons_follow_up[:6]):  # Show max 6 suggestions
+            with cols_follow_up[i % 3]:
+                st.button(suggestion, key=f"suggestion_btn_{i}", on_click=use_suggestion, args=(suggestion,))
+
+        submit_query_button = st.button("💬 Submit", type="secondary")
+
+        if submit_query_button and st.session_state.user_query:
+           with track_request("shalaye", "followup"), st.spinner(f"🤔 ShalayeAI is researching: '{st.session_state.user_query}'..."):
+                try:
+                    # Add personalization context to follow-up queries too
+                    personalized_context = get_personalized_query_context()
+                    full_follow_up_query = st.session_state.user_query + personalized_context
+
+                    ingredient_count = sum(len(extract_risks(content, label)) for label in ("🚨 High-Risk:", "⚠️ Moderate Risk:", "✅ Low Risk:"))
+                    score, reasons = score_shalaye_request(query=st.session_state.user_query, profile=st.session_state.user_profile,
+                                                           ingredient_count=ingredient_count)
+                    decision = route("followup", score, reasons)
+
+                    with streamlit_scope("followup", st.session_state.get("analysis_id")), deadline(SHALAYE_DEADLINE_SECONDS):
+                        follow_up_response = run_with_escalation(
+                            decision,
+                            lambda model_id: run_agent(
+                                create_followup_agent(model_id),
+                                full_follow_up_query,
+                                app="shalaye",
+                                agent_name="followup",
+                                images=[{"filepath": st.session_state.image_path}] if st.session_state.image_path else []
+                            ),
+                            lambda r: [] if (r.content or "").strip() else ["empty answer"],
+                        )
+                    st.session_state.chat_history.append({
+                        "query": st.session_state.user_query,
+                        "response": follow_up_response.content
+                    })
+                    st.session_state.user_query = ""
+                    # The box is cleared by dropping its state; the fragment re-creates it empty.
+                    del st.session_state.query_input
+                    st.rerun(scope="fragment")
+
+                except Exception as e:
+                    st.error(f"❌ Error during follow-up analysis: {str(e)}")
+
+def ingest_upload(upload) -> "IngestedImage":
     """
-    max_size = (720, 720) 
-    image.thumbnail(max_size)
-    return image
+    Ingests an uploaded or captured image once; reruns reuse the result.
+
+    Raises:
+        ImageRejected: If the image can't be ingested safely (see image_utils).
+    """
+    cached = st.session_state.get("ingested_image")
+    if cached is None or cached[0] != upload.file_id:
+        cached = (upload.file_id, ingest_image(upload.getvalue()))
+        st.session_state.ingested_image = cached
+    return cached[1]
 
 def initialize_user_profile():
     """Initialize user profile in session state if not exists"""
@@ -299,6 +496,7 @@ def main():
     # Handle page navigation
     if st.session_state.current_page == "profile":
         profile_setup_page()
+        warm_up_in_background()
         return
 
     # Main page content
@@ -364,8 +562,17 @@ def main():
         elif captured_image:
             image_to_process = captured_image
 
+        ingested = None
         if image_to_process:
-            st.image(image_to_process, caption="Image Ready for Analysis")
+            try:
+                ingested = ingest_upload(image_to_process)
+            except ImageRejected as e:
+                st.error(f"❌ {e}")
+                image_to_process = None
+
+        if image_to_process:
+            # The downscaled copy: showing the upload itself would decode it at full size again.
+            st.image(ingested.image, caption="Image Ready for Analysis")
            
             initial_analyze_button = st.button("⚡️ Perform Analysis", use_container_width=True, type="primary")
         else:
@@ -377,24 +584,24 @@ def main():
             st.error("Please upload an image or take a picture to perform the initial analysis.")
             return
 
-        with st.status("🔍 ShalayeAI is analyzing your product...", expanded=True) as status:
+        with track_request("shalaye", "analysis"), st.status("🔍 ShalayeAI is analyzing your product...", expanded=True) as status:
             try:
                 # Step 1: Image Processing
                 status.write("1. Optimizing and preparing image for analysis...")
                 time.sleep(1)
+                # Checked, decoded at reduced scale and downscaled when it was uploaded.
+                image = ingested.image
                 with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp_file:
-                    image = optimize_image(Image.open(image_to_process))
-                    if image.mode == 'RGBA':
-                        image = image.convert('RGB')
                     image.save(tmp_file.name, format='JPEG')
                     st.session_state.image_path = tmp_file.name
-                status.write("✅ Image prepared successfully.")
+                status.write(f"✅ Image prepared successfully ({ingested.source_size[0]}x{ingested.source_size[1]} "
+                             f"{ingested.format}, peak memory ~{ingested.peak_bytes / 2**20:.1f} MB).")
 
-                # Step 2: Agent Initialization
-                status.write("2. Initializing ShalayeAI Agent (loading models and tools)...")
-                time.sleep(0.7)
-                shalaye_agent = create_shalaye_agent()
-                status.write("✅ Agent initialized.")
+                # Step 2: Model Routing
+                status.write("2. Choosing the right model for this label...")
+                score, reasons = score_shalaye_request(image=image, profile=st.session_state.user_profile)
+                decision = route("analysis", score, reasons)
+                status.write(f"✅ Routed to {decision.model} (complexity {score:.2f}).")
 
                 # Step 3: Running Agent with LLM Call
                 if st.session_state.user_profile['profile_complete']:
@@ -409,13 +616,59 @@ def main():
                 personalized_context = get_personalized_query_context()
                 full_query = base_query + personalized_context
                 
-                response = shalaye_agent.run(full_query, images=[{"filepath": st.session_state.image_path}])
+                st.session_state.analysis_id = uuid.uuid4().hex
+                def write_report(run_on):
+                    def attempt(model_id):
+                        response = run_on(model_id)
+                        # Patch small format drifts with a cheap repair call before considering a bigger model.
+                        if has_time(REPAIR_MIN_SECONDS):
+                            try:
+                                response.content = repair_report(response.content)
+                            except Exception as e:
+                                # The unrepaired report is still usable; escalation judges it as it is.
+                                record_error("shalaye", "report_repair", e)
+                                print(f"Report repair failed, keeping the unrepaired report: {e}")
+                        else:
+                            record_timeout("shalaye", "repair", "skipped")
+                        return response
+                    return run_with_escalation(decision, attempt, lambda r: missing_report_sections(r.content))
+
+                research_progress = status.empty()
+                progress = {"total": 0, "done": 0, "reused": 0}
+                def on_event(stage, event, data):
+                    if stage == "label":
+                        progress["total"] = data["ingredients"]
+                        research_progress.write(f"🔬 Found {data['ingredients']} ingredients; researching them...")
+                    elif stage.startswith("research:") and event == "finished":
+                        progress["done"] += 1
+                        progress["reused"] += data.get("cached", False)
+                        research_progress.write(f"🔬 Researched {progress['done']}/{progress['total']} ingredients "
+                                                f"({progress['reused']} from earlier analyses).")
+                    elif stage == "report" and event == "started":
+                        status.write("✍️ Writing the report from the research...")
+
+                # Identical concurrent uploads (same image, profile and prompt) share one run.
+                request_key = request_fingerprint("analysis", image_to_process.getvalue(), full_query)
+                with streamlit_scope("analysis", st.session_state.analysis_id), deadline(SHALAYE_DEADLINE_SECONDS):
+                    from shalaye_pipeline import run_analysis
+
+                    results, shared = singleflight("shalaye_analysis").do(
+                        request_key,
+                        lambda: run_analysis(st.session_state.image_path, full_query, report_model=decision.model,
+                                             report_attempt=write_report, on_event=on_event),
+                    )
+                if shared:
+                    status.write("♻️ Joined an identical analysis that was already running.")
+                elif decision.escalations:
+                    status.write(f"↗️ Re-ran the report on {decision.model} because it was incomplete.")
+                if results[DEGRADED_KEY]:
+                    status.write(f"⏱️ {len(results[DEGRADED_KEY])} ingredients ran out of research time.")
                 status.write("✅ ShalayeAI response received.")
 
                 # Step 4: Processing Response
                 status.write("4. Extracting structured insights and preparing the full report...")
                 time.sleep(1.5)
-                st.session_state.full_report_content = response.content
+                st.session_state.full_report_content = results["report"]
                 st.session_state.initial_analysis_done = True
                 st.session_state.chat_history = []
                 status.write("✅ Report generated and ready to display.")
@@ -433,119 +686,27 @@ def main():
         if st.session_state.user_profile['profile_complete']:
             st.info("🎯 This analysis is personalized based on your health profile!")
 
-        #Display Product Identification
-        detected = re.search(r'📸 Detected: (.+)', content)
-        if detected:
-            # Themed product name
-            st.markdown(f"""
-            ### Product: <span style="color: #a29bfe;">{detected.group(1)}</span>
-            ---
-            """, unsafe_allow_html=True)
-
-        # Display Parameter Breakdown
-        breakdown_text = re.search(r'🔍 Breakdown:(.+?)(?:🚨|$)', content, re.DOTALL)
-        if breakdown_text:
-            st.subheader("📊 Health Indicators")
-            scores = extract_scores(breakdown_text.group(1))
-            if scores:
-                for param, score in scores.items():
-                    # Themed score display
-                    st.markdown(f"""
-                    <div style="margin-bottom: 15px;">
-                        <div style="display: flex; justify-content: space-between; margin-bottom: 5px;">
-                            <span style="color: #F0F0F0;">{param}</span>
-                            <span style="color: #a29bfe;">{score}/5</span>
-                        </div>
-                        <div style="height: 8px; border-radius: 4px; background: linear-gradient(90deg, #6c5ce7, #a29bfe); width: {score*20}%;"></div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                fig = plot_parameter_scores(scores)
-                st.pyplot(fig)
-            else:
-                st.info("No detailed parameter scores found in the initial analysis.")
-
-        # Display Risk Assessment
-        st.subheader("⚠️ Safety Assessment")
-        high_risks = extract_risks(content, "🚨 High-Risk:")
-        moderate_risks = extract_risks(content, "⚠️ Moderate Risk:")
-        low_risks = extract_risks(content, "✅ Low Risk:")
-
-        if high_risks:
-            st.error(f"**🚨 High-Risk Ingredients:** {', '.join(high_risks)}")
-        if moderate_risks:
-            st.warning(f"**⚠️ Moderate Risk Ingredients:** {', '.join(moderate_risks)}")
-        if low_risks:
-            st.success(f"**✅ Low Risk Ingredients:** {', '.join(low_risks)}")
+        results_header(content)
 
-        if not (high_risks or moderate_risks or low_risks):
-            st.info("No specific risk categories found in the initial analysis, or all ingredients are low risk.")
+        missing_sections = missing_report_sections(content)
+        if missing_sections:
+            st.warning("Some sections of this report didn't come through in the expected format.")
+            if st.button("🛠️ Repair missing sections", key="repair_report_btn"):
+                with st.spinner("Filling in the missing sections..."), streamlit_scope("repair", st.session_state.get("analysis_id")):
+                    try:
+                        st.session_state.full_report_content = repair_report(content)
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"❌ Error while repairing the report: {str(e)}")
 
         st.markdown("---")
         st.header("📝 Full Analysis Report")
-        st.markdown(content, unsafe_allow_html=True)
+        show_report_sections(content)
 
         st.markdown("---")
         st.header("Ask ShalayeAI More Questions!")
 
-        # Display chat history
-        for entry in st.session_state.chat_history:
-            st.markdown(f"**You:** {entry['query']}")
-            st.markdown(f"**ShalayeAI:** {entry['response']}")
-            st.markdown("---")
-
-        # User input for subsequent queries
-        st.session_state.user_query = st.text_area("Enter your question:", key="query_input", value=st.session_state.user_query)
-
-        # Suggested queries
-        st.subheader("Suggested Follow-up Questions")
-        query_buttons_follow_up = [
-            "Tell me more about the benefits of [Specific Ingredient from report].",
-            "Are there any alternative products with similar benefits but fewer risks?",
-            "Explain the long-term effects of consuming this product.",
-            "Is this safe for pregnant women?",
-            "I want more information about allergies.",
-        ]
-
-        # Add personalized suggestions if profile exists
-        if st.session_state.user_profile['profile_complete']:
-            personalized_suggestions = [
-                "How does this product align with my health goals?",
-                "Any specific concerns based on my health conditions?",
-                "Does this product interact with my medications?",
-            ]
-            query_buttons_follow_up = personalized_suggestions + query_buttons_follow_up
-
-        cols_follow_up = st.columns(min(len(query_buttons_follow_up), 3))
-        for i, suggestion in enumerate(query_buttons_follow_up[:6]):  # Show max 6 suggestions
-            with cols_follow_up[i % 3]:
-                if st.button(suggestion, key=f"suggestion_btn_{i}"):
-                    st.session_state.user_query = suggestion
-
-        submit_query_button = st.button("💬 Submit", type="secondary")
-
-        if submit_query_button and st.session_state.user_query:
-           with st.spinner(f"🤔 ShalayeAI is researching: '{st.session_state.user_query}'..."):
-                try:
-                    followup_agent = create_followup_agent()
-
-
-                    # Add personalization context to follow-up queries too
-                    personalized_context = get_personalized_query_context()
-                    full_follow_up_query = st.session_state.user_query + personalized_context
-
-                    follow_up_response = followup_agent.run(
-                        full_follow_up_query,
-                        images=[{"filepath": st.session_state.image_path}] if st.session_state.image_path else []
-                    )
-                    st.session_state.chat_history.append({
-                        "query": st.session_state.user_query,
-                        "response": follow_up_response.content
-                    })
-                    st.session_state.user_query = ""
-                    st.rerun()
-
-                except Exception as e:
-                    st.error(f"❌ Error during follow-up analysis: {str(e)}")
+        followup_chat(content)
 
     # Initial State (No analysis yet)
     elif not st.session_state.initial_analysis_done and not image_to_process:
@@ -556,6 +717,11 @@ def main():
     st.markdown("---")
     st.markdown("Built with ❤️ | [Keep in touch!](https://x.com/Aethrx0)")
 
+    # The page is on screen now; load the agent stack in the background so the
+    # first analysis doesn't pay for it.
+    warm_up_in_background()
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with track_render("shalaye", "page"):
+        main()
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""
+Local SQLite cache for memoized pipeline stage outputs.
+
+Entries are keyed by a hash of exactly the inputs a stage reads (see
+`pipeline_utils.Stage.key`), so re-running an assessment after a small profile
+edit only recomputes the stages downstream of the change. Entries expire after
+STAGE_CACHE_TTL_DAYS, and the least recently used ones are evicted once the
+cache grows past STAGE_CACHE_MAX_MB.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from metrics_utils import REGISTRY, record_cache
+from sqlite_utils import SQLiteStore
+
+DATA_DIR = os.getenv("APP_DATA_DIR", ".data")
+STAGE_CACHE_PATH = os.getenv("STAGE_CACHE_PATH", os.path.join(DATA_DIR, "stage_cache.sqlite3"))
+STAGE_CACHE_MAX_MB = float(os.getenv("STAGE_CACHE_MAX_MB", "50"))
+STAGE_CACHE_TTL_DAYS = float(os.getenv("STAGE_CACHE_TTL_DAYS", "7"))
+
+CACHE_EVICTIONS = REGISTRY.counter(
+    "stage_cache_evictions_total", "Stage cache entries removed, by reason (expired/size).", ("reason",))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stage_cache (
+    key TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stage_cache_accessed ON stage_cache (accessed_at);
+"""
+
+
+class StageCache(SQLiteStore):
+    """A size- and age-bounded key/value store for stage outputs."""
+
+    table = "stage_cache"
+    schema = _SCHEMA
+
+    def __init__(self, path: str = STAGE_CACHE_PATH, max_bytes: int = int(STAGE_CACHE_MAX_MB * 1024 * 1024),
+                 ttl_seconds: float = STAGE_CACHE_TTL_DAYS * 86400):
+        super().__init__(path, max_bytes)
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key: str, stage: str) -> tuple[bool, Any]:
+        """
+        Looks up a stage output.
+
+        Args:
+            key: The stage's input fingerprint.
+            stage: Stage name, for the hit/miss metric.
+
+        Returns:
+            (True, value) on a hit, (False, None) on a miss or an expired entry.
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value, created_at FROM stage_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM stage_cache WHERE key = ?", (key,))
+                CACHE_EVICTIONS.inc(reason="expired")
+                row = None
+            if row is not None:
+                conn.execute("UPDATE stage_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        record_cache(f"stage:{stage}", hit=row is not None)
+        if row is None:
+            return False, None
+        # Only this app writes the cache file, so unpickling it is safe.
+        return True, pickle.loads(row[0])
+
+    def put(self, key: str, stage: str, value: Any) -> None:
+        """Stores a stage output, then evicts expired and least recently used entries."""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO stage_cache (key, stage, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (key, stage, data, len(data), now, now))
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        expired = conn.execute("DELETE FROM stage_cache WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        if expired:
+            CACHE_EVICTIONS.inc(expired, reason="expired")
+        evicted = self._evict_lru(conn)
+        if evicted:
+            CACHE_EVICTIONS.inc(evicted, reason="size")
+
+    def stats(self) -> dict:
+        """Entry count and stored bytes per stage."""
+        with self._lock, self._connect() as conn:
+            rows = conn.execute("SELECT stage, COUNT(*), SUM(size) FROM stage_cache GROUP BY stage").fetchall()
+        return {stage: {"entries": count, "bytes": size} for stage, count, size in rows}
+
+
+_default: Optional[StageCache] = None
+_default_lock = threading.Lock()
+
+
+def stage_cache() -> StageCache:
+    """Returns the process-wide stage cache at STAGE_CACHE_PATH."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = StageCache()
+        return _default
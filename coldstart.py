@@ -0,0 +1,147 @@
+"""
+Cold-start helpers for the Streamlit apps.
+
+The heavy libraries (agno, google-genai, exa, matplotlib) are imported lazily by
+the apps. This module preloads them in the background once the first page has
+been painted, and doubles as an import-time profiling command that fails when an
+entry point takes longer than the budget to import:
+
+    python coldstart.py                 # profile every entry point
+    python coldstart.py --budget 0.8 app
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+
+# Modules that must never be imported while an entry point loads.
+HEAVY_MODULES = ("matplotlib", "agno", "google.genai", "exa_py")
+
+# Modules preloaded after the first render so the first analysis is warm.
+WARM_UP_MODULES = (
+    "PIL.Image",
+    "agno.agent",
+    "pydantic",
+    "agno.models.google",
+    "agno.tools.exa",
+    "matplotlib.pyplot",
+)
+
+ENTRY_POINTS = ("app", "immisense", "streamlit_app")
+
+COLD_START_BUDGET_SECONDS = float(os.getenv("COLD_START_BUDGET", "1.0"))
+
+_warm_up_lock = threading.Lock()
+_warm_up_started = False
+
+
+def _import_modules(modules):
+    import importlib
+
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception as e:
+            print(f"Warm-up import of {module} failed: {e}")
+
+
+def warm_up_in_background(modules=WARM_UP_MODULES) -> bool:
+    """
+    Imports the heavy modules on a daemon thread, once per process.
+
+    Args:
+        modules: Dotted module names to import.
+
+    Returns:
+        True if this call started the warm-up, False if it had already run.
+    """
+    global _warm_up_started
+    if os.getenv("COLDSTART_DISABLE_WARMUP"):
+        return False
+    with _warm_up_lock:
+        if _warm_up_started:
+            return False
+        _warm_up_started = True
+    threading.Thread(target=_import_modules, args=(modules,), name="coldstart-warmup", daemon=True).start()
+    return True
+
+
+# Executed in a fresh interpreter so nothing is already cached in sys.modules.
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = sorted(m for m in {heavy!r} if m in sys.modules)
+print("COLDSTART" + json.dumps({{"seconds": elapsed, "heavy": heavy}}))
+"""
+
+
+def _parse_importtime(stderr: str, top: int) -> list[tuple[str, float]]:
+    """Returns the `top` modules with the largest cumulative import time in seconds."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            rows.append((name.strip(), int(cumulative) / 1e6))
+        except ValueError:
+            continue
+    return sorted(rows, key=lambda row: row[1], reverse=True)[:top]
+
+
+def profile_entry_point(module: str, top: int = 10) -> dict:
+    """
+    Imports an entry point in a fresh interpreter and measures the cold start.
+
+    Args:
+        module: The module to import (e.g. "app").
+        top: How many of the slowest imports to report.
+
+    Returns:
+        A dict with the import 'seconds', the eagerly imported 'heavy' modules
+        and the 'slowest' imports as (module, cumulative seconds) pairs.
+    """
+    code = _PROBE.format(module=module, heavy=HEAVY_MODULES)
+    env = dict(os.environ, STREAMLIT_LOG_LEVEL="error", COLDSTART_DISABLE_WARMUP="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+    )
+    result = None
+    for line in proc.stdout.splitlines():
+        if line.startswith("COLDSTART"):
+            result = json.loads(line[len("COLDSTART"):])
+    if result is None:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+    result["slowest"] = _parse_importtime(proc.stderr, top)
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Profile the cold start of the Streamlit entry points.")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_POINTS))
+    parser.add_argument("--budget", type=float, default=COLD_START_BUDGET_SECONDS,
+                        help="Maximum import time in seconds for each entry point.")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to show.")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        result = profile_entry_point(module, args.top)
+        over_budget = result["seconds"] > args.budget
+        status = "FAIL" if over_budget or result["heavy"] else "ok"
+        print(f"[{status}] import {module}: {result['seconds']:.3f}s (budget {args.budget:.3f}s)")
+        if result["heavy"]:
+            print(f"    heavy modules imported at startup: {', '.join(result['heavy'])}")
+        for name, seconds in result["slowest"]:
+            print(f"    {seconds:8.3f}s  {name}")
+        failed = failed or status == "FAIL"
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
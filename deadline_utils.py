@@ -0,0 +1,139 @@
+"""
+End-to-end deadlines for ShalayeAI and ImmiSense requests.
+
+A request runs inside `deadline(seconds)`; the deadline is a context variable,
+so it follows the request into pipeline stages (which copy the caller's
+context) and down to every Gemini and Exa call. Nested deadlines (a stage's or
+an agent's timeout) never outlast the enclosing one. Work checks the remaining
+budget rather than being interrupted:
+
+- the shared HTTP pool (http_utils) caps each request's timeouts at what is
+  left and refuses to send once the deadline has passed;
+- `stream_agent` stops between chunks when time is up;
+- `bounded_tool_call`, an agno tool hook, gives each tool call its own slice of
+  the budget and skips further research once too little is left, so the agent
+  answers from what it already has;
+- pipeline stages with a `fallback` return a reduced output instead of failing
+  (see pipeline_utils).
+
+Everything cut short is counted per flow and stage in deadline_timeouts_total.
+"""
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+from metrics_utils import REGISTRY
+
+# Longest a single tool call (e.g. an Exa search) may take.
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "20"))
+# Time kept back from research for the model to write its answer.
+TOOL_RESERVE_SECONDS = float(os.getenv("TOOL_RESERVE_SECONDS", "15"))
+
+DEADLINE_TIMEOUTS = REGISTRY.counter(
+    "deadline_timeouts_total", "Work cut short by a deadline, by outcome (degraded/skipped/failed).",
+    ("flow", "stage", "outcome"))
+
+_current: contextvars.ContextVar[Optional["Deadline"]] = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when work would start, or continue, after its deadline."""
+
+
+class Deadline:
+    """A point in time, on the monotonic clock, by which work must finish."""
+
+    def __init__(self, seconds: float, parent: Optional["Deadline"] = None):
+        self.expires_at = time.monotonic() + seconds
+        if parent is not None:
+            self.expires_at = min(self.expires_at, parent.expires_at)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """
+    Runs the block under a deadline `seconds` from now, or the enclosing one if that is sooner.
+
+    Args:
+        seconds: The budget; None keeps the enclosing deadline (if any) unchanged.
+
+    Yields:
+        The deadline in force, or None when there is none.
+    """
+    if seconds is None:
+        yield _current.get()
+        return
+    token = _current.set(Deadline(seconds, _current.get()))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None when there is no deadline."""
+    current = _current.get()
+    return current.remaining() if current is not None else None
+
+
+def expired() -> bool:
+    """Whether the current deadline has passed; always False without one."""
+    current = _current.get()
+    return current is not None and current.expired()
+
+
+def has_time(seconds: float) -> bool:
+    """Whether at least `seconds` are left (always True without a deadline)."""
+    left = remaining()
+    return left is None or left >= seconds
+
+
+def check_deadline(what: str) -> None:
+    """
+    Raises:
+        DeadlineExceeded: If the current deadline has passed.
+    """
+    if expired():
+        raise DeadlineExceeded(f"Deadline passed before {what} could finish")
+
+
+def record_timeout(flow: str, stage: str, outcome: str) -> None:
+    """Counts work cut short by a deadline: "degraded" (reduced output), "skipped" or "failed"."""
+    DEADLINE_TIMEOUTS.inc(flow=flow, stage=stage, outcome=outcome)
+
+
+def bounded_tool_call(function_name: str, function_call: Callable, arguments: dict) -> Any:
+    """
+    agno tool hook that keeps a tool call within its share of the request's budget.
+
+    A call gets at most TOOL_TIMEOUT_SECONDS and never eats into the last
+    TOOL_RESERVE_SECONDS of the deadline. When the budget is spent the tool
+    isn't called, and a call that fails after running out of time returns a
+    note instead of failing the run; either way the agent answers without that
+    research. A call that returns is always used, however late.
+    Put it first in `tool_hooks` so it bounds the hooks after it too.
+    """
+    budget = TOOL_TIMEOUT_SECONDS
+    left = remaining()
+    if left is not None:
+        budget = min(budget, left - TOOL_RESERVE_SECONDS)
+    if budget <= 0:
+        record_timeout("tools", function_name, "skipped")
+        return "Not run: the time for research is used up. Answer with the information you already have."
+    with deadline(budget) as bound:
+        try:
+            # A call that finished is used even if the budget ran out just after: it's paid for.
+            return function_call(**arguments)
+        except Exception:
+            if not bound.expired():
+                raise
+    record_timeout("tools", function_name, "degraded")
+    return "Timed out before returning results. Answer with the information you already have."
@@ -0,0 +1,183 @@
+"""
+Local, rule-based eligibility scoring for ImmiSense.
+
+Profiles are turned into a feature vector and scored against every visa's
+weighted criteria (VISA_CRITERIA in visa_utils.py) in one NumPy pass, so a
+batch of profiles can be scored against a batch of visas at once. The result
+is deterministic; only the free-text assessment answers need an LLM, and their
+rating is blended in with `blend_scores`.
+"""
+from functools import lru_cache
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+from visa_utils import ANSWER_WEIGHT, DEFAULT_ANSWER_WEIGHT, VISA_CRITERIA
+
+FEATURES = (
+    "degree_level",
+    "years_of_experience",
+    "annual_income_usd",
+    "liquid_assets_usd",
+    "english",
+    "sponsorship",
+    "usmca_national",
+    "no_denials",
+    "no_criminal_history",
+)
+
+FEATURE_LABELS = {
+    "degree_level": "education level",
+    "years_of_experience": "professional experience",
+    "annual_income_usd": "income",
+    "liquid_assets_usd": "liquid assets",
+    "english": "English proficiency",
+    "sponsorship": "U.S. job offer or sponsor",
+    "usmca_national": "Canadian or Mexican citizenship",
+    "no_denials": "no prior visa denials",
+    "no_criminal_history": "no criminal history",
+}
+
+DEGREE_LEVELS = {"high school diploma": 1, "bachelor's degree": 2, "master's degree": 3, "phd": 4}
+USMCA_COUNTRIES = ("canada", "mexico")
+
+
+def _number(value: Any) -> float:
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _flag_clear(value: Any) -> float:
+    """1.0 when a yes/no red flag is clearly absent."""
+    if isinstance(value, str):
+        return 1.0 if value.strip().lower() == "no" else 0.0
+    return 1.0 if value is False else 0.0
+
+
+def profile_features(profile: dict) -> np.ndarray:
+    """
+    Extracts the scoring features from a profile.
+
+    Args:
+        profile: A saved ImmiSense profile or a ParsedProfile dump; missing or
+            unknown values count as not meeting the criterion.
+
+    Returns:
+        A float vector ordered like FEATURES.
+    """
+    languages = profile.get("language_proficiency") or []
+    if isinstance(languages, str):
+        languages = [languages]
+    sponsorship = str(profile.get("sponsorship_status") or "").lower()
+    values = {
+        "degree_level": DEGREE_LEVELS.get(str(profile.get("highest_degree") or "").strip().lower(), 0),
+        "years_of_experience": _number(profile.get("years_of_experience")),
+        "annual_income_usd": _number(profile.get("annual_income_usd")),
+        "liquid_assets_usd": _number(profile.get("liquid_assets_usd")),
+        "english": 1.0 if any(str(lang).strip().lower() == "english" for lang in languages) else 0.0,
+        "sponsorship": 1.0 if "have a job offer" in sponsorship else 0.0,
+        "usmca_national": 1.0 if str(profile.get("nationality") or "").strip().lower() in USMCA_COUNTRIES else 0.0,
+        "no_denials": _flag_clear(profile.get("previous_visa_denials")),
+        "no_criminal_history": _flag_clear(profile.get("criminal_history")),
+    }
+    return np.array([values[feature] for feature in FEATURES], dtype=float)
+
+
+@lru_cache(maxsize=None)
+def criteria_matrix(visas: tuple) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Builds the weight and threshold matrices for the given visas.
+
+    Returns:
+        (weights, thresholds), each of shape (len(visas), len(FEATURES)); unused
+        criteria have weight 0 and threshold 1.
+    """
+    weights = np.zeros((len(visas), len(FEATURES)))
+    thresholds = np.ones((len(visas), len(FEATURES)))
+    for row, visa in enumerate(visas):
+        for feature, (weight, threshold) in VISA_CRITERIA[visa].items():
+            column = FEATURES.index(feature)
+            weights[row, column] = weight
+            thresholds[row, column] = threshold
+    weights.setflags(write=False)
+    thresholds.setflags(write=False)
+    return weights, thresholds
+
+
+def criterion_attainment(features: np.ndarray, visas: Iterable[str]) -> np.ndarray:
+    """
+    Scores how fully each criterion is met.
+
+    Args:
+        features: Shape (n_profiles, len(FEATURES)), from `profile_features`.
+        visas: Visa categories to score against.
+
+    Returns:
+        Values in [0, 1] of shape (n_profiles, n_visas, len(FEATURES)).
+    """
+    _, thresholds = criteria_matrix(tuple(visas))
+    return np.clip(features[:, None, :] / thresholds[None, :, :], 0.0, 1.0)
+
+
+def score_profiles(profiles: list[dict], visas: Iterable[str]) -> np.ndarray:
+    """
+    Scores every profile against every visa.
+
+    Returns:
+        Rule-based scores from 0 to 100, shape (len(profiles), n_visas).
+    """
+    visas = tuple(visas)
+    weights, _ = criteria_matrix(visas)
+    features = np.stack([profile_features(profile) for profile in profiles])
+    attainment = criterion_attainment(features, visas)
+    return 100 * (attainment * weights).sum(axis=-1) / weights.sum(axis=-1)
+
+
+def score_breakdown(profile: dict, visa: str) -> dict[str, float]:
+    """Per-criterion scores (0-100) of one profile for one visa, for the criteria that visa uses."""
+    attainment = criterion_attainment(profile_features(profile)[None, :], (visa,))[0, 0]
+    return {feature: round(100 * float(attainment[FEATURES.index(feature)]), 1) for feature in VISA_CRITERIA[visa]}
+
+
+def rank_visas(profile: dict, visas: Iterable[str]) -> list[dict]:
+    """
+    Scores one profile against several visas in a single pass and ranks them.
+
+    Returns:
+        One dict per visa, best first: 'visa_category', 'score' (0-100) and
+        'gaps', the labels of the criteria not fully met, heaviest first.
+    """
+    visas = tuple(visas)
+    weights, _ = criteria_matrix(visas)
+    attainment = criterion_attainment(profile_features(profile)[None, :], visas)[0]
+    scores = 100 * (attainment * weights).sum(axis=-1) / weights.sum(axis=-1)
+    ranking = []
+    for row in np.argsort(-scores, kind="stable"):
+        unmet = [column for column in np.argsort(-weights[row], kind="stable")
+                 if weights[row, column] > 0 and attainment[row, column] < 1]
+        ranking.append({
+            "visa_category": visas[row],
+            "score": round(float(scores[row]), 1),
+            "gaps": [FEATURE_LABELS[FEATURES[column]] for column in unmet],
+        })
+    return ranking
+
+
+def blend_scores(rule_score: float, answer_score: Optional[float], visa: str) -> float:
+    """
+    Combines the rule-based score with the LLM's rating of the free-text answers.
+
+    Args:
+        rule_score: From `score_profiles`, 0-100.
+        answer_score: Mean answer rating, 0-100, or None when there were no answers.
+        visa: The visa category, which sets the answers' share.
+
+    Returns:
+        The overall score, 0-100.
+    """
+    if answer_score is None:
+        return round(float(rule_score), 1)
+    weight = ANSWER_WEIGHT.get(visa, DEFAULT_ANSWER_WEIGHT)
+    return round((1 - weight) * float(rule_score) + weight * float(answer_score), 1)
@@ -0,0 +1,190 @@
+"""
+One pooled HTTP transport for all Gemini and Exa traffic.
+
+Every Gemini model gets its own google-genai client and every ExaTools its own
+Exa client, and by default each of those opens its own connections (Exa even
+uses a new one per call). Routing them all through one httpx transport keeps
+connections alive between calls, reuses TLS sessions, multiplexes over HTTP/2
+when the optional `h2` package is installed, and caps concurrent requests per
+host. New versus reused connections and TLS handshakes are counted per host.
+Every request is also held to the caller's deadline (see deadline_utils).
+
+Imports httpx, so callers import this module lazily next to agno.
+"""
+import atexit
+import importlib.util
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional
+
+import httpx
+
+from deadline_utils import DeadlineExceeded, remaining
+from metrics_utils import REGISTRY
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+HTTP_PER_HOST_LIMIT = int(os.getenv("HTTP_PER_HOST_LIMIT", "16"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "120"))
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "Requests sent through the shared pool, by host and connection (new/reused).",
+    ("host", "connection"))
+HTTP_HANDSHAKES = REGISTRY.counter(
+    "http_tls_handshakes_total", "TLS handshakes made by the shared pool, by host.", ("host",))
+HTTP_HOST_WAIT = REGISTRY.histogram(
+    "http_host_wait_seconds", "Time a request waited for a free per-host slot.", ("host",))
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """A response body that frees its per-host slot once it is read or closed."""
+
+    def __init__(self, stream: httpx.SyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+class PooledTransport(httpx.BaseTransport):
+    """
+    Shares one connection pool between many httpx clients.
+
+    Closing a client that uses it leaves the pool open (google-genai closes its
+    clients when they are garbage collected); the pool is closed at exit.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport, per_host_limit: int = HTTP_PER_HOST_LIMIT):
+        self._transport = transport
+        self._per_host_limit = per_host_limit
+        self._slots: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(self._per_host_limit)
+            return self._slots[host]
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        budget = remaining()
+        if budget is not None:
+            if budget <= 0:
+                raise DeadlineExceeded(f"Deadline passed before the request to {host} was sent")
+            # Waiting for a connection or for the response never outlasts the deadline.
+            timeouts = request.extensions.get("timeout") or dict.fromkeys(("connect", "read", "write", "pool"))
+            request.extensions["timeout"] = {name: budget if value is None else min(value, budget)
+                                             for name, value in timeouts.items()}
+        slot = self._slot(host)
+        start = time.perf_counter()
+        acquired = slot.acquire(timeout=budget)
+        HTTP_HOST_WAIT.observe(time.perf_counter() - start, host=host)
+        if not acquired:
+            raise DeadlineExceeded(f"Deadline passed while waiting for a connection to {host}")
+        connected = []
+        outer_trace = request.extensions.get("trace")
+
+        def trace(event: str, info: dict) -> None:
+            # httpcore reports connection setup only when no pooled connection was free.
+            if event == "connection.connect_tcp.complete":
+                connected.append(True)
+            elif event == "connection.start_tls.complete":
+                HTTP_HANDSHAKES.inc(host=host)
+            if outer_trace is not None:
+                outer_trace(event, info)
+
+        request.extensions["trace"] = trace
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            slot.release()
+            raise
+        HTTP_REQUESTS.inc(host=host, connection="new" if connected else "reused")
+        return httpx.Response(status_code=response.status_code, headers=response.headers,
+                              stream=_ReleasingStream(response.stream, slot.release),
+                              extensions=response.extensions)
+
+    def close(self) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        """Closes the underlying pool."""
+        self._transport.close()
+
+
+_transport: Optional[PooledTransport] = None
+_client: Optional[httpx.Client] = None
+_lock = threading.Lock()
+
+
+def pooled_transport() -> PooledTransport:
+    """Returns the process-wide pooled transport."""
+    global _transport
+    with _lock:
+        if _transport is None:
+            limits = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                                  keepalive_expiry=HTTP_KEEPALIVE_SECONDS)
+            _transport = PooledTransport(httpx.HTTPTransport(http2=HTTP2_AVAILABLE, limits=limits))
+            atexit.register(_transport.shutdown)
+        return _transport
+
+
+def shared_client() -> httpx.Client:
+    """Returns a process-wide httpx client on the pooled transport."""
+    global _client
+    transport = pooled_transport()
+    with _lock:
+        if _client is None:
+            _client = httpx.Client(transport=transport, timeout=HTTP_TIMEOUT_SECONDS, follow_redirects=True)
+        return _client
+
+
+def gemini_client_params() -> dict:
+    """`client_params` for agno's Gemini that put its google-genai client on the pooled transport."""
+    from google.genai import types
+
+    return {"http_options": types.HttpOptions(client_args={"transport": pooled_transport()})}
+
+
+def pool_exa(tools: Any) -> Any:
+    """
+    Sends an agno ExaTools' API calls through the shared client.
+
+    exa_py posts with a bare `requests.post`, a new connection every call;
+    streamed answers still go that way.
+
+    Returns:
+        The same toolkit, for use inline: `pool_exa(ExaTools(api_key=...))`.
+    """
+    exa = tools.exa
+    original = exa.request
+
+    def request(endpoint: str, data: Any = None, method: str = "POST", params: Optional[dict] = None) -> Any:
+        if isinstance(data, dict) and data.get("stream"):
+            return original(endpoint, data, method, params)
+        from exa_py.api import ExaJSONEncoder
+
+        body = data if isinstance(data, str) else json.dumps(data, cls=ExaJSONEncoder) if data else None
+        response = shared_client().request(method.upper(), exa.base_url + endpoint, content=body,
+                                           headers=exa.headers, params=params)
+        if response.status_code >= 400:
+            raise ValueError(f"Request failed with status code {response.status_code}: {response.text}")
+        return response.json()
+
+    exa.request = request
+    return tools
@@ -0,0 +1,155 @@
+"""
+Bounded-memory ingestion of uploaded and camera images.
+
+A label photo only needs to reach the model at ANALYSIS_IMAGE_SIZE, so nothing
+is fully decoded before it has been checked:
+
+- the upload's size is checked against MAX_IMAGE_BYTES;
+- only the header is read to check the format (PNG or JPEG) and the
+  dimensions, against MAX_IMAGE_PIXELS (Pillow's own decompression-bomb
+  limit is set to the same value as a backstop);
+- JPEGs are decoded at 1/2, 1/4 or 1/8 scale when that still covers the
+  target size (`Image.draft`), so a 50 MP photo never exists in memory at full
+  size; PNG has no reduced-scale decode, so at most MAX_DECODE_PIXELS of it
+  are decoded;
+- at most MAX_CONCURRENT_DECODES images are decoded at once in the process,
+  whichever sessions they come from.
+
+The peak memory of each ingestion (the upload plus the pixel buffers alive at
+once) is estimated from the buffer sizes and recorded in
+image_ingest_peak_bytes. PIL is imported lazily, like in the rest of the app.
+"""
+import io
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from metrics_utils import REGISTRY
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+MAX_IMAGE_BYTES = int(float(os.getenv("MAX_IMAGE_MB", "15")) * 1024 * 1024)
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "60000000"))
+MAX_DECODE_PIXELS = int(os.getenv("MAX_DECODE_PIXELS", "16000000"))
+MAX_CONCURRENT_DECODES = int(os.getenv("MAX_CONCURRENT_DECODES", "2"))
+# How long an upload waits for a decode slot before it is turned away.
+DECODE_WAIT_SECONDS = float(os.getenv("DECODE_WAIT_SECONDS", "30"))
+ANALYSIS_IMAGE_SIZE = (720, 720)
+ALLOWED_FORMATS = ("JPEG", "PNG")
+
+IMAGE_PEAK_BYTES = REGISTRY.histogram(
+    "image_ingest_peak_bytes", "Estimated peak memory of one image ingestion (upload plus pixel buffers).",
+    buckets=tuple(mb * 1024 * 1024 for mb in (1, 2, 4, 8, 16, 32, 64, 128, 256)))
+IMAGE_DECODE_SECONDS = REGISTRY.histogram(
+    "image_decode_seconds", "Time to decode and downscale one image, excluding the wait for a slot.")
+IMAGE_DECODE_WAIT = REGISTRY.histogram(
+    "image_decode_wait_seconds", "Time an upload waited for a free decode slot.")
+IMAGE_REJECTIONS = REGISTRY.counter(
+    "image_rejections_total", "Uploads turned away before or during decoding, by reason.", ("reason",))
+
+_decode_slots = threading.BoundedSemaphore(MAX_CONCURRENT_DECODES)
+
+
+class ImageRejected(ValueError):
+    """Raised for an image that can't be ingested safely; the message is shown to the user."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+@dataclass
+class IngestedImage:
+    """
+    An image ready for analysis.
+
+    Attributes:
+        image: The downscaled RGB (or grayscale) image, at most ANALYSIS_IMAGE_SIZE.
+        format: "JPEG" or "PNG".
+        source_size: (width, height) of the upload.
+        decoded_size: (width, height) actually decoded; smaller than source_size
+            when a JPEG was decoded at reduced scale.
+        peak_bytes: Estimated peak memory of the ingestion.
+    """
+
+    image: "Image.Image"
+    format: str
+    source_size: tuple[int, int]
+    decoded_size: tuple[int, int]
+    peak_bytes: int
+
+
+def _reject(reason: str, message: str) -> None:
+    IMAGE_REJECTIONS.inc(reason=reason)
+    raise ImageRejected(reason, message)
+
+
+def _pixel_bytes(size: tuple[int, int], mode: str) -> int:
+    # Pillow keeps one byte per pixel for single-band 8-bit modes and four otherwise.
+    return size[0] * size[1] * (1 if mode in ("1", "L", "P") else 4)
+
+
+def ingest_image(data: bytes, max_size: tuple[int, int] = ANALYSIS_IMAGE_SIZE) -> IngestedImage:
+    """
+    Checks, decodes and downscales an uploaded image within the memory limits.
+
+    Args:
+        data: The uploaded file's bytes.
+        max_size: The size to fit the image into.
+
+    Returns:
+        The ingested image.
+
+    Raises:
+        ImageRejected: If the image is too large, not a PNG or JPEG, corrupt,
+            or no decode slot freed up in time.
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    if not data:
+        _reject("empty", "The image is empty.")
+    if len(data) > MAX_IMAGE_BYTES:
+        _reject("too_many_bytes", f"The image is {len(data) / 2**20:.1f} MB; please upload one under "
+                                  f"{MAX_IMAGE_BYTES / 2**20:.0f} MB.")
+    try:
+        # Reads the header only.
+        image = Image.open(io.BytesIO(data), formats=ALLOWED_FORMATS)
+    except Image.DecompressionBombError:
+        _reject("too_many_pixels", "The image has too many pixels to analyse.")
+    except (UnidentifiedImageError, OSError):
+        _reject("unreadable", "This file isn't a readable PNG or JPEG image.")
+    source_format, source_size = image.format, image.size
+    if source_size[0] * source_size[1] > MAX_IMAGE_PIXELS:
+        _reject("too_many_pixels", f"The image is {source_size[0]}x{source_size[1]} pixels; please upload a "
+                                   f"smaller one (at most {MAX_IMAGE_PIXELS / 1e6:.0f} megapixels).")
+    # JPEG only: switch the decoder to the smallest DCT scale still at least max_size.
+    image.draft("RGB", max_size)
+    decoded_size = image.size
+    if decoded_size[0] * decoded_size[1] > MAX_DECODE_PIXELS:
+        _reject("too_many_pixels", f"The image is {source_size[0]}x{source_size[1]} pixels; please upload a "
+                                   "smaller one or a JPEG.")
+
+    start = time.perf_counter()
+    if not _decode_slots.acquire(timeout=DECODE_WAIT_SECONDS):
+        _reject("busy", "The server is busy with other images; please try again in a moment.")
+    IMAGE_DECODE_WAIT.observe(time.perf_counter() - start)
+    start = time.perf_counter()
+    try:
+        image.load()
+        peak_bytes = len(data) + _pixel_bytes(decoded_size, image.mode)
+        image.thumbnail(max_size, Image.LANCZOS)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        peak_bytes += _pixel_bytes(image.size, image.mode)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        _reject("corrupt", "The image couldn't be decoded; it may be damaged or cut short.")
+    finally:
+        _decode_slots.release()
+    IMAGE_DECODE_SECONDS.observe(time.perf_counter() - start)
+    IMAGE_PEAK_BYTES.observe(peak_bytes)
+    return IngestedImage(image=image, format=source_format, source_size=source_size,
+                         decoded_size=decoded_size, peak_bytes=peak_bytes)
@@ -5,17 +5,19 @@ import json
 from datetime import datetime
 from dotenv import load_dotenv
 
-
-from agno.agent import Agent
-from agno.team import Team
-from agno.models.google import Gemini
-from agno.tools.exa import ExaTools
-
 from visa_utils import VISA_DESCRIPTIONS, ASSESSMENT_QUESTIONS
+from coldstart import warm_up_in_background
+from metrics_utils import start_metrics_server
+from agent_utils import track_request, streamlit_scope
+from routing_utils import IMMISENSE_TIERS, route, run_with_escalation, score_assessment
+from singleflight_utils import request_fingerprint, singleflight
+from pipeline_utils import DEGRADED_KEY, REUSED_KEY, PipelineError
+from report_store import report_store
 
 
 
 load_dotenv()
+start_metrics_server()
 
 st.set_page_config(
     page_title="ImmiSense AI",
@@ -24,115 +26,6 @@ st.set_page_config(
 )
 
 
-# --- AGENT & TEAM INITIALIZATION (WITH CACHING) ---
-@st.cache_resource
-def load_immigrify_team():
-    """
-    Initializes and returns the complete agno Team.
-    """
-    print("Initializing AI Team... (This should only run once)")
-    # Configuration
-    google_api_key = os.getenv("GOOGLE_API_KEY")
-    exa_api_key = os.getenv("EXA_API_KEY")
-
-    if not google_api_key or not exa_api_key:
-        st.error("API keys are not found. Please check your .env file.")
-        st.stop()
-    
-    coordinator_llm = Gemini(id="gemini-2.5-pro", api_key=google_api_key)
-    worker_llm = Gemini(id="gemini-2.5-flash", api_key=google_api_key)
-    exa_tools_instance = ExaTools(api_key=exa_api_key)
-
-    # --- Agent and Team definitions go here ---
-    ProfileParser = Agent(name="ProfileParser", 
-                          model=worker_llm, 
-                          role="User Profile JSON Extractor", 
-                          instructions=
-                          ["Your sole responsibility is to read the user's query and extract key information.", 
-                           "You MUST output your findings as a single, valid JSON object and nothing else.", 
-                           "The JSON object must contain keys: 'full_name', 'age', 'nationality', 'visa_category', and other relevant profile details.", 
-                           "If a value is not found, use `null`. Your entire response MUST be only the JSON object."
-                           ],
-                           retries=2,)
-    
-    VisaResearcher = Agent(name="VisaResearcher", 
-                           model=worker_llm, 
-                           tools=[exa_tools_instance], 
-                           role="Visa Requirements Specialist", 
-                           instructions=[
-                               "You will be given a specific U.S. visa category (e.g., 'H-1B').", 
-                               "Your only task is to use the search tool to find the primary eligibility requirements from official U.S. government sources (uscis.gov, travel.state.gov).", 
-                               "You MUST output the requirements as a single, valid JSON object with a single key, 'visa_requirements', which holds a list of the requirements.", 
-                               "Your entire response MUST be only the JSON object."
-                               ],
-                               retries=2,
-                               )
-    
-    ScoringEngine = Agent(name="ScoringEngine", 
-                          model=worker_llm, 
-                          role="Eligibility Scoring Analyst", 
-                          instructions=["You will receive a JSON object containing a 'user_profile' and 'visa_requirements'.", 
-                                        "Your task is to logically compare the user's profile against each requirement.", 
-                                        "You MUST output your analysis as a single, valid JSON object.", 
-                                        "The JSON object must contain keys: 'overall_score' (number 0-100), and 'score_breakdown' (an object detailing the score for each category).", 
-                                        "Your entire response MUST be only the JSON object."],
-                                        retries=2,
-                                        )
-    
-    RecommendationAgent = Agent(name="RecommendationAgent", 
-                            model=worker_llm, 
-                            role="Strategic Immigration Advisor", 
-                            instructions=["You will receive a JSON object containing 'user_profile', 'visa_requirements', and 'scoring_data'.", 
-                                          "Your task is to provide expert strategic advice based on this data.", 
-                                          "Analyze the score breakdown to identify the strongest and weakest points of the user's case.", 
-                                          "You MUST output your advice as a single, valid JSON object.", 
-                                          "The JSON object must contain these keys: 'summary' (a brief overview), 'key_considerations' (a list of strengths and weaknesses), 'actionable_steps' (a list of concrete next steps), and 'alternative_pathways' (a list of other potential visa options, if any).", 
-                                          "Your entire response MUST be only the JSON object."], 
-                                          retries=2,
-                                         )
-    
-    ReportGenerator = Agent(name="ReportGenerator", 
-                            model=coordinator_llm, role="Final Report Compiler", 
-                            instructions=["Your role is to act as a compiler. You will receive a single JSON object containing all assessment data: 'profile', 'requirements', 'scoring', and now 'recommendations'.", 
-                                          "Your final task is to synthesize all this structured information into a single, comprehensive, and well-structured user-facing report in Markdown format.", 
-                                          "The report must be written from the perspective of 'ImmiSense' and MUST include distinct sections for: Applicant Profile, Eligibility Assessment, and Strategic Recommendations.", 
-                                          "Use the data from the 'recommendations' JSON to populate the final section of the report."], 
-                                          markdown=True, 
-                                          retries=2,
-                                          stream=True)
-
-    # Team Definition
-    immigrify_team = Team(
-        name="ImmigrifyTeam",
-        mode="collaborate", # Using coordinate for predictable, sequential workflow
-        members=[ProfileParser, VisaResearcher, ScoringEngine, RecommendationAgent, ReportGenerator],
-        model=coordinator_llm,
-        instructions=[
-            "You are an expert team of immigration analysts that assesses a user's eligibility for a U.S. visa.",
-            "Your goal is to produce a comprehensive eligibility and recommendation report.",
-            "You MUST follow these steps in a strict sequence:",
-            "1. **Parse Profile:** Use the `ProfileParser` to extract the user's details into a structured JSON format.",
-            "2. **Research Requirements:** Use the `VisaResearcher`, providing it with the `visa_category` from the parsed profile, to get the official visa requirements in JSON format.",
-            "3. **Score Eligibility:** Use the `ScoringEngine`. You must provide it with both the structured profile from step 1 and the visa requirements from step 2.",
-            "4. **Generate Recommendations:** Use the `RecommendationAgent`. You must provide it with all previously gathered data (the profile, requirements, and score) to generate strategic advice in JSON format.",
-            "5. **Generate Final Report:** Use the `ReportGenerator`. You must provide it with all information from all previous steps (profile, requirements, score, and recommendations) to create the final, user-facing report.",
-            "The final output delivered to the user must be the complete, polished report from the `ReportGenerator`."
-        ],
-        enable_agentic_context=True,
-    markdown=True,
-    debug_mode=True,
-    show_members_responses=True,
-    )
-    return immigrify_team
-
-# --- Load the AI team ---
-try:
-    team = load_immigrify_team()
-except Exception as e:
-    st.error(f"Failed to initialize the AI Team. Please check your setup. Error: {e}")
-    st.stop()
-
-
 # --- UI & APP LOGIC ---
 
 # Data Dictionaries
@@ -141,12 +34,17 @@ GOAL_TO_VISA_MAPPING = {
     "Study or Conduct Research": ["F-1", "J-1", "M-1"], "Join Family in the U.S.": ["K-1", "K-3", "IR Visas", "F Visas"],
     "Invest in a U.S. Business": ["EB-5"], "Visit for a Short Period": ["B-1", "B-2"], "Transit or Specialized Travel": ["C", "I", "D"],
 }
+STAGE_LABELS = {
+    "profile": "Reading your profile", "requirements": "Looking up visa requirements",
+    "answers": "Reviewing your answers", "scoring": "Scoring your eligibility",
+    "recommendations": "Drafting recommendations", "report": "Writing your report",
+}
 
 # Session State Initialization
 if 'page' not in st.session_state:
     st.session_state.page = 'Home'
-if 'user_profile' not in st.session_state:
-    st.session_state.user_profile = {}
+if 'visa_profile' not in st.session_state:
+    st.session_state.visa_profile = {}
 if 'final_report' not in st.session_state:
     st.session_state.final_report = None
 
@@ -156,6 +54,115 @@ def go_to_profile(): st.session_state.page = 'Profile'
 def go_to_assessment():
     st.session_state.final_report = None
     st.session_state.page = 'Assessment'
+def go_to_reports(): st.session_state.page = 'Reports'
+
+
+# Pipeline Runner
+def stage_label(stage: str) -> str:
+    """Human label of a pipeline stage; per-visa stages are named like 'requirements:H-1B'."""
+    name, _, visa = stage.partition(":")
+    label = STAGE_LABELS.get(name, name)
+    return f"{label} ({visa})" if visa else label
+
+
+def run_with_progress(flow: str, request_key: str, run):
+    """
+    Runs an ImmiSense pipeline, streaming its stage progress and report into the page.
+
+    Args:
+        flow: "assessment" or "comparison"; also the single-flight group suffix.
+        request_key: Fingerprint of the request; identical concurrent requests share one run.
+        run: Called with the progress callback; returns the pipeline results.
+
+    Returns:
+        The pipeline results. Stops the script with an error if a stage fails.
+    """
+    status = st.status("Running your assessment...", expanded=True)
+    report_area = st.empty()
+    streamed = []
+
+    def show_progress(stage, event, data):
+        if event == "started":
+            status.write(f"⏳ {stage_label(stage)}...")
+        elif event == "finished" and data.get("cached"):
+            status.write(f"♻️ {stage_label(stage)} (reused, inputs unchanged)")
+        elif event == "finished" and data.get("degraded"):
+            status.write(f"⏱️ {stage_label(stage)} ran out of time; continuing with a shorter version")
+        elif event == "finished":
+            tokens = sum(data.get("tokens", {}).values())
+            spent = f", {tokens:,} tokens" if tokens else ""
+            status.write(f"✅ {stage_label(stage)} ({data['seconds']:.1f}s{spent})")
+        elif event == "token":
+            streamed.append(data["text"])
+            report_area.markdown("".join(streamed))
+        elif event == "attempt" and streamed:
+            status.write("🔁 Some sections were missing; regenerating the report with a stronger model...")
+            streamed.clear()
+            report_area.empty()
+
+    try:
+        with streamlit_scope(flow):
+            results, _ = singleflight(f"immisense_{flow}").do(request_key, lambda: run(show_progress))
+    except PipelineError as e:
+        status.update(label="Assessment failed", state="error")
+        st.error(f"The {stage_label(e.stage)} step failed: {e.__cause__}")
+        st.stop()
+    status.update(label="Assessment complete", state="complete", expanded=False)
+    # The only paint of the report when this session shared another session's run.
+    report_area.markdown(results["report"])
+    show_reused_stages(results[REUSED_KEY])
+    if results[DEGRADED_KEY]:
+        st.caption("⏱️ Parts of this report were shortened to finish in time; run it again for the full version.")
+    return results
+
+
+def show_reused_stages(stages):
+    """Notes which stages were reused from an earlier assessment with the same inputs."""
+    if stages:
+        st.caption(f"♻️ Reused from an earlier assessment: {', '.join(stage_label(s) for s in stages)}.")
+
+
+# Report Store
+def load_saved_report(key):
+    """Reads a stored report; a broken store only costs a fresh run."""
+    try:
+        return report_store().get(key)
+    except Exception as e:
+        print(f"Failed to read report {key} from the report store: {e}")
+        return None
+
+
+def save_report(key, report, **details):
+    """Stores a finished report so identical requests and My Reports can reopen it."""
+    try:
+        report_store().put(key, report, **details)
+    except Exception as e:
+        print(f"Failed to store report {key}: {e}")
+
+
+def show_saved_note(created_at):
+    """Notes that the report on screen was reopened rather than generated."""
+    if created_at:
+        saved = datetime.fromtimestamp(created_at).strftime("%B %d, %Y at %H:%M")
+        st.caption(f"📂 Reopened your saved report from {saved}; nothing was re-run.")
+
+
+def show_report(saved):
+    """Puts a stored report on screen and keeps it for later reruns."""
+    st.session_state.final_report = saved["report"]
+    st.session_state.reused_stages = None
+    st.session_state.saved_at = saved["created_at"]
+
+
+def open_report(key):
+    """Reopens a report from My Reports."""
+    saved = load_saved_report(key)
+    if saved is None:
+        st.toast("That report is no longer stored.")
+        return
+    show_report(saved)
+    st.session_state.page = 'Assessment'
+
 
 # Sidebar Navigation
 with st.sidebar:
@@ -163,6 +170,7 @@ with st.sidebar:
     st.button("🏠 Home", on_click=go_to_home, use_container_width=True)
     st.button("👤 My Profile", on_click=go_to_profile, use_container_width=True)
     st.button("🚀 Run New Assessment", on_click=go_to_assessment, use_container_width=True)
+    st.button("📚 My Reports", on_click=go_to_reports, use_container_width=True)
     st.info("💡 A complete profile enables more accurate AI analysis!")
 
 # --- Main Page Rendering Logic ---
@@ -191,20 +199,20 @@ elif st.session_state.page == 'Profile':
         st.header("Personal Factors")
         col1, col2 = st.columns(2)
         with col1:
-            full_name = st.text_input("Full Name", st.session_state.user_profile.get("full_name", ""))
-            age = st.number_input("Age", 1, 120, st.session_state.user_profile.get("age", 30))
-            language_proficiency = st.multiselect("Language Proficiency", ["English", "Spanish", "French", "German", "Mandarin", "Other"], default=st.session_state.user_profile.get("language_proficiency", []))
+            full_name = st.text_input("Full Name", st.session_state.visa_profile.get("full_name", ""))
+            age = st.number_input("Age", 1, 120, st.session_state.visa_profile.get("age", 30))
+            language_proficiency = st.multiselect("Language Proficiency", ["English", "Spanish", "French", "German", "Mandarin", "Other"], default=st.session_state.visa_profile.get("language_proficiency", []))
         with col2:
             highest_degree = st.selectbox("Highest Degree", ["Select...", "High School Diploma", "Bachelor's Degree", "Master's Degree", "PhD"], index=0)
-            field_of_study = st.text_input("Field of Study", st.session_state.user_profile.get("field_of_study", ""))
-            years_of_experience = st.number_input("Years of Professional Experience", 0, 60, st.session_state.user_profile.get("years_of_experience", 5))
+            field_of_study = st.text_input("Field of Study", st.session_state.visa_profile.get("field_of_study", ""))
+            years_of_experience = st.number_input("Years of Professional Experience", 0, 60, st.session_state.visa_profile.get("years_of_experience", 5))
         
         # FINANCIAL 
         st.header("Financial Factors")
         col3, col4 = st.columns(2)
         with col3:
-            annual_income = st.number_input("Current Annual Income (USD)", 0, 10000000, st.session_state.user_profile.get("annual_income", 50000), step=1000)
-            liquid_assets = st.number_input("Total Liquid Assets (USD)", 0, 100000000, st.session_state.user_profile.get("liquid_assets", 20000), step=1000)
+            annual_income = st.number_input("Current Annual Income (USD)", 0, 10000000, st.session_state.visa_profile.get("annual_income", 50000), step=1000)
+            liquid_assets = st.number_input("Total Liquid Assets (USD)", 0, 100000000, st.session_state.visa_profile.get("liquid_assets", 20000), step=1000)
         with col4:
             sponsorship_status = st.selectbox("Sponsorship Status", ["Select...", "Seeking sponsorship", "Have a job offer/sponsorship", "Not applicable"], index=0)
 
@@ -212,12 +220,12 @@ elif st.session_state.page == 'Profile':
         st.header("Legal & Country-Specific Factors")
         col5, col6 = st.columns(2)
         with col5:
-            nationality = st.text_input("Country of Nationality", st.session_state.user_profile.get("nationality", ""))
-            birth_country = st.text_input("Country of Birth", st.session_state.user_profile.get("birth_country", ""))
+            nationality = st.text_input("Country of Nationality", st.session_state.visa_profile.get("nationality", ""))
+            birth_country = st.text_input("Country of Birth", st.session_state.visa_profile.get("birth_country", ""))
             previous_denials = st.radio("Have you ever had a U.S. visa application denied?", ["No", "Yes"], index=0, horizontal=True)
         with col6:
-            current_location = st.text_input("Current Country of Residence", st.session_state.user_profile.get("current_location", ""))
-            current_us_status = st.text_input("Current U.S. Immigration Status (if any, otherwise type N/A)", st.session_state.user_profile.get("current_us_status", ""))
+            current_location = st.text_input("Current Country of Residence", st.session_state.visa_profile.get("current_location", ""))
+            current_us_status = st.text_input("Current U.S. Immigration Status (if any, otherwise type N/A)", st.session_state.visa_profile.get("current_us_status", ""))
             criminal_history = st.radio("Do you have a criminal history?", ["No", "Yes"], index=0, horizontal=True)
         
         submitted = st.form_submit_button("Save Complete Profile")
@@ -245,7 +253,7 @@ elif st.session_state.page == 'Profile':
                 st.error(f"Please fill out all required fields. The following fields are missing:\n\n- " + "\n- ".join(missing_fields))
             else:
                 # If validation passes, save the data
-                st.session_state.user_profile = {
+                st.session_state.visa_profile = {
                     "full_name": full_name, "age": age, "language_proficiency": language_proficiency,
                     "highest_degree": highest_degree, "field_of_study": field_of_study, "years_of_experience": years_of_experience,
                     "annual_income_usd": annual_income, "liquid_assets_usd": liquid_assets, "sponsorship_status": sponsorship_status,
@@ -254,40 +262,127 @@ elif st.session_state.page == 'Profile':
                 }
                 st.success("Your comprehensive profile has been saved successfully!")
 
-    if st.session_state.user_profile:
+    if st.session_state.visa_profile:
         st.write("---")
         st.subheader("Current Saved Profile")
-        st.json(st.session_state.user_profile)
+        st.json(st.session_state.visa_profile)
 
 elif st.session_state.page == 'Assessment':
     st.header("Complete Assessment")
     # ... The rest of the assessment and report logic remains unchanged ...
-    if not st.session_state.user_profile:
+    if not st.session_state.visa_profile:
         st.warning("Please fill out and save your profile via the 'My Profile' page first.")
         st.stop()
     if st.session_state.final_report is None:
-        st.header("Select Your Goal and Visa")
-        selected_goal = st.selectbox("What is your primary immigration goal?", list(GOAL_TO_VISA_MAPPING.keys()))
-        if selected_goal != "Select a Goal...":
-            possible_visas = GOAL_TO_VISA_MAPPING[selected_goal]
-            selected_visa = st.selectbox("Select the specific Visa Category", possible_visas)
-            description = VISA_DESCRIPTIONS.get(selected_visa, "No description available.")
-            st.info(f"**About the {selected_visa} Visa:** {description}")
-            questions = ASSESSMENT_QUESTIONS.get(selected_visa, [f"Please describe your plans and qualifications for the {selected_visa} visa."])
-            with st.form("assessment_form"):
-                st.header("Answer Assessment Questions")
-                assessment_answers = {q: st.text_area(q, key=f"q_{i}", height=150) for i, q in enumerate(questions)}
-                assessment_submitted = st.form_submit_button("Submit & Run AI Analysis")
-                if assessment_submitted:
-                    with st.spinner("Processing with our AI agent team... This may take a moment."):
-                        profile_details = "\n".join([f"- {k.replace('_', ' ').title()}: {v}" for k, v in st.session_state.user_profile.items()])
-                        answer_details = "\n".join([f"- Question: {q}\n- Answer: {a}" for q, a in assessment_answers.items()])
-                        final_user_query = f"## User Profile:\n{profile_details}\n\n## Assessment for Visa Category: {selected_visa}\n{answer_details}\n\n## Task:\nProvide a comprehensive eligibility report, score, and recommendations."
-                        final_report = team.run(final_user_query)
-                        st.session_state.final_report = final_report.content
-                        st.rerun()
+        # Cleared on submit so the report streams into a clean page without a rerun.
+        setup_area = st.empty()
+        assessment_submitted = comparison_submitted = False
+        with setup_area.container():
+            st.header("Select Your Goal and Visa")
+            selected_goal = st.selectbox("What is your primary immigration goal?", list(GOAL_TO_VISA_MAPPING.keys()))
+            if selected_goal != "Select a Goal...":
+                possible_visas = GOAL_TO_VISA_MAPPING[selected_goal]
+                compare_all = len(possible_visas) > 1 and st.toggle(
+                    f"Compare all {len(possible_visas)} visas for this goal",
+                    help="Ranks every visa for this goal against your profile in a single run. "
+                         "Run a full assessment of one visa to have your answers considered too.")
+                if compare_all:
+                    st.info(f"**Visas compared:** {', '.join(possible_visas)}")
+                    comparison_submitted = st.button(f"Compare {len(possible_visas)} Visas", type="primary")
+                else:
+                    selected_visa = st.selectbox("Select the specific Visa Category", possible_visas)
+                    description = VISA_DESCRIPTIONS.get(selected_visa, "No description available.")
+                    st.info(f"**About the {selected_visa} Visa:** {description}")
+                    questions = ASSESSMENT_QUESTIONS.get(selected_visa, [f"Please describe your plans and qualifications for the {selected_visa} visa."])
+                    with st.form("assessment_form"):
+                        st.header("Answer Assessment Questions")
+                        assessment_answers = {q: st.text_area(q, key=f"q_{i}", height=150) for i, q in enumerate(questions)}
+                        assessment_submitted = st.form_submit_button("Submit & Run AI Analysis")
+        if assessment_submitted or comparison_submitted:
+            # Imported here so the Home and Profile pages don't wait for pydantic and agno.
+            from visa_pipeline import (AssessmentRequest, ComparisonRequest, report_key, run_assessment,
+                                       run_comparison, validate_report)
+
+            setup_area.empty()
+            st.header("Your ImmiSense Report")
+            profile = st.session_state.visa_profile
+            flow = "comparison" if comparison_submitted else "assessment"
+            if comparison_submitted:
+                request = ComparisonRequest(profile=profile, goal=selected_goal, visa_categories=possible_visas)
+                title = f"{selected_goal}: {len(possible_visas)} visas compared"
+            else:
+                request = AssessmentRequest(profile=profile, visa_category=selected_visa, answers=assessment_answers)
+                title = f"{selected_visa} assessment"
+            key = report_key(request)
+            with track_request("immisense", flow):
+                saved = load_saved_report(key)
+                if saved is not None:
+                    # Same profile, visa and answers as a stored report: reopen it.
+                    show_report(saved)
+                    st.markdown(saved["report"])
+                    show_saved_note(saved["created_at"])
+                elif comparison_submitted:
+                    score, reasons = score_assessment(profile, {})
+                    decision = route(flow, score, reasons, tiers=IMMISENSE_TIERS)
+                    results = run_with_progress(
+                        flow, request_fingerprint(flow, profile, selected_goal, possible_visas),
+                        lambda on_event: run_comparison(request, report_model=decision.model, on_event=on_event),
+                    )
+                    top = results["scoring"].rankings[0]
+                    # A report shortened by the deadline isn't kept, so the next identical request runs in full.
+                    if not results[DEGRADED_KEY]:
+                        save_report(key, results["report"], profile=profile, kind=flow, title=title, score=top.score)
+                else:
+                    score, reasons = score_assessment(profile, assessment_answers)
+                    decision = route(flow, score, reasons, tiers=IMMISENSE_TIERS)
+                    results = run_with_progress(
+                        flow, request_fingerprint(flow, profile, selected_visa, assessment_answers),
+                        lambda on_event: run_assessment(
+                            request,
+                            report_model=decision.model,
+                            # Only the report stage is routed; escalate it when sections are missing.
+                            report_attempt=lambda run_on: run_with_escalation(decision, run_on, validate_report),
+                            on_event=on_event,
+                        ),
+                    )
+                    if not results[DEGRADED_KEY]:
+                        save_report(key, results["report"], profile=profile, kind=flow, title=title,
+                                    score=results["scoring"].overall_score)
+                if saved is None:
+                    # Kept for later reruns.
+                    st.session_state.final_report = results["report"]
+                    st.session_state.reused_stages = results[REUSED_KEY]
+                    st.session_state.saved_at = None
+            st.button("Start Another Assessment", key="start_another_assessment", on_click=go_to_assessment)
     else:
         st.header("Your ImmiSense Report")
         st.markdown(st.session_state.final_report)
-        if st.button("Start Another Assessment"):
-            go_to_assessment()
\ No newline at end of file
+        show_reused_stages(st.session_state.get("reused_stages"))
+        show_saved_note(st.session_state.get("saved_at"))
+        st.button("Start Another Assessment", key="start_another_assessment", on_click=go_to_assessment)
+
+elif st.session_state.page == 'Reports':
+    st.header("📚 My Reports")
+    if not st.session_state.visa_profile:
+        st.warning("Please fill out and save your profile via the 'My Profile' page to see its reports.")
+        st.stop()
+    try:
+        saved_reports = report_store().list_reports(st.session_state.visa_profile)
+    except Exception as e:
+        print(f"Failed to list stored reports: {e}")
+        saved_reports = []
+    if not saved_reports:
+        st.info("No saved reports for this profile yet. Finished assessments appear here.")
+    for saved in saved_reports:
+        col1, col2 = st.columns([5, 1])
+        with col1:
+            created = datetime.fromtimestamp(saved["created_at"]).strftime("%B %d, %Y at %H:%M")
+            score = f" · {saved['score']:.0f}/100" if saved["score"] is not None else ""
+            st.markdown(f"**{saved['title']}**{score}  \n{created}")
+        with col2:
+            st.button("Open", key=f"open_{saved['key']}", on_click=open_report, args=(saved["key"],),
+                      use_container_width=True)
+
+# The page is on screen now; preload agno and the model clients in the background
+# so the first assessment doesn't pay for the imports.
+warm_up_in_background()
\ No newline at end of file
@@ -0,0 +1,137 @@
+"""
+Tolerant parsing of the JSON objects agents return.
+
+Models asked for JSON often wrap it in code fences or a sentence of prose,
+leave trailing commas, write Python literals, put raw newlines in strings or
+stop before the closing braces. `parse_model` fixes those locally, so a
+near-valid answer doesn't cost another model call.
+"""
+import json
+import re
+from typing import Any
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+_WORD = re.compile(r"[^\W\d]\w*")
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def _drop_trailing_comma(out: list[str]) -> None:
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def _object_text(text: str) -> str:
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    start = text.find("{")
+    if start == -1:
+        raise ValueError(f"Expected a JSON object, got: {text[:200]!r}")
+    return text[start:]
+
+
+def repair_json(text: str) -> str:
+    """
+    Rewrites near-valid JSON into valid JSON.
+
+    Takes the first object in the text (inside a code fence if there is one),
+    drops what follows it, removes trailing commas, maps True/False/None to
+    their JSON literals, escapes raw newlines in strings and closes whatever
+    a truncated answer left open.
+
+    Raises:
+        ValueError: If the text has no object at all.
+    """
+    text = _object_text(text)
+    out: list[str] = []
+    closers: list[str] = []
+    in_string = escaped = False
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            out.append("\\n" if char == "\n" else char)
+        elif char == '"':
+            in_string = True
+            out.append(char)
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+            out.append(char)
+        elif char in "}]":
+            _drop_trailing_comma(out)
+            if closers:
+                out.append(closers.pop())
+            if not closers:
+                break
+        elif char.isalpha():
+            word = _WORD.match(text, i).group(0)
+            out.append(_LITERALS.get(word, word))
+            i += len(word)
+            continue
+        else:
+            out.append(char)
+        i += 1
+    if in_string:
+        out.append('"')
+    _drop_trailing_comma(out)
+    if out and out[-1] == ":":
+        out.append("null")
+    out.extend(reversed(closers))
+    return "".join(out)
+
+
+def load_json_object(content: Any) -> tuple[dict, bool]:
+    """
+    Reads the JSON object in an agent's answer.
+
+    Args:
+        content: The response content (text, possibly fenced or with prose around it).
+
+    Returns:
+        (object, repaired): repaired is True when the text needed `repair_json`.
+
+    Raises:
+        ValueError: If no JSON object can be read, even after repair.
+    """
+    text = str(content or "").strip()
+    candidate = _object_text(text)
+    try:
+        data, repaired = json.loads(candidate[:candidate.rfind("}") + 1]), False
+    except ValueError:
+        try:
+            data, repaired = json.loads(repair_json(text)), True
+        except ValueError as e:
+            raise ValueError(f"Could not read a JSON object from: {text[:200]!r} ({e})") from e
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+    return data, repaired
+
+
+def parse_model(content: Any, model: type) -> tuple[Any, str]:
+    """
+    Validates an agent's answer against a pydantic model.
+
+    Args:
+        content: The response content; already a `model` instance when the
+            agent ran with it as its response_model.
+        model: The pydantic model expected.
+
+    Returns:
+        (instance, outcome), where outcome is "schema" (the model enforced the
+        schema), "parsed" (valid JSON) or "repaired" (fixed by `repair_json`).
+
+    Raises:
+        ValueError: If the answer can't be read or doesn't match the model.
+    """
+    if isinstance(content, model):
+        return content, "schema"
+    data, repaired = load_json_object(content)
+    return model.model_validate(data), "repaired" if repaired else "parsed"
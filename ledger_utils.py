@@ -0,0 +1,350 @@
+"""
+Token and cost ledger for every agent run, kept in a local SQLite table.
+
+Each run is stored with the analysis, session, user, flow and model it belongs
+to, so the expensive paths can be found with a plain GROUP BY:
+
+    python ledger_utils.py report --by flow,model
+    python ledger_utils.py report --by analysis_id --limit 10
+    python ledger_utils.py routing
+
+Prices are USD per million tokens (and per call for tools). Override them by
+pointing LEDGER_PRICES at a JSON file with the same shape as DEFAULT_PRICES.
+"""
+import argparse
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Optional
+
+DATA_DIR = os.getenv("APP_DATA_DIR", ".data")
+LEDGER_PATH = os.getenv("LEDGER_PATH", os.path.join(DATA_DIR, "ledger.sqlite3"))
+
+# Gemini bills an image as 258 input tokens per 768x768 tile; uploads are
+# downscaled to at most 720px, so each image is a single tile. These tokens are
+# already part of input_tokens and are stored separately only for visibility.
+IMAGE_TOKENS_PER_IMAGE = 258
+
+DEFAULT_PRICES = {
+    "models": {
+        "gemini-2.0-flash": {"input": 0.10, "output": 0.40},
+        "gemini-2.5-flash": {"input": 0.30, "output": 2.50},
+        "gemini-2.5-pro": {"input": 1.25, "output": 10.00},
+    },
+    "tools": {
+        "search_exa": 0.005,
+        "find_similar": 0.005,
+        "exa_answer": 0.005,
+        "get_contents": 0.001,
+    },
+}
+
+GROUPABLE_COLUMNS = ("app", "flow", "agent", "model", "analysis_id", "session_id", "user_id")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS agent_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    app TEXT NOT NULL,
+    flow TEXT,
+    agent TEXT NOT NULL,
+    model TEXT,
+    analysis_id TEXT,
+    session_id TEXT,
+    user_id TEXT,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    image_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    tool_calls INTEGER NOT NULL DEFAULT 0,
+    latency_s REAL,
+    cost_usd REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS agent_runs_analysis ON agent_runs (analysis_id);
+CREATE INDEX IF NOT EXISTS agent_runs_created ON agent_runs (created_at);
+CREATE TABLE IF NOT EXISTS routing_decisions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    flow TEXT NOT NULL,
+    analysis_id TEXT,
+    session_id TEXT,
+    score REAL NOT NULL,
+    initial_model TEXT NOT NULL,
+    final_model TEXT NOT NULL,
+    escalations INTEGER NOT NULL DEFAULT 0,
+    reasons TEXT,
+    latency_s REAL,
+    cost_usd REAL NOT NULL DEFAULT 0
+);
+"""
+
+_write_lock = threading.Lock()
+_initialized_paths: set[str] = set()
+_prices: Optional[dict] = None
+
+# Who a run is billed to; set by the apps with `ledger_scope` around each flow.
+_scope: contextvars.ContextVar[dict] = contextvars.ContextVar("ledger_scope", default={})
+
+
+def load_prices() -> dict:
+    """Returns the price table, merging LEDGER_PRICES over DEFAULT_PRICES."""
+    global _prices
+    if _prices is None:
+        prices = json.loads(json.dumps(DEFAULT_PRICES))
+        path = os.getenv("LEDGER_PRICES")
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                overrides = json.load(f)
+            for section in ("models", "tools"):
+                prices[section].update(overrides.get(section, {}))
+        _prices = prices
+    return _prices
+
+
+@contextmanager
+def _connect(path: str = None):
+    """Opens the ledger database, creating it on first use, and commits on success."""
+    path = path or LEDGER_PATH
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10)
+    conn.row_factory = sqlite3.Row
+    try:
+        if path not in _initialized_paths:
+            conn.executescript(_SCHEMA)
+            _initialized_paths.add(path)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def ledger_scope(**fields):
+    """
+    Attributes every run inside the block to the given analysis/session/user/flow.
+
+    Nested scopes inherit and override the outer fields.
+
+    Usage:
+        with ledger_scope(flow="analysis", analysis_id=..., session_id=...):
+            run_agent(...)
+    """
+    token = _scope.set({**_scope.get(), **{k: v for k, v in fields.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def current_scope() -> dict:
+    return dict(_scope.get())
+
+
+def _metric_sum(metrics: Optional[dict], key: str) -> int:
+    value = (metrics or {}).get(key, 0)
+    return int(sum(v for v in value if isinstance(v, (int, float)))) if isinstance(value, list) else int(value or 0)
+
+
+def estimate_cost(model: Optional[str], input_tokens: int, output_tokens: int, tool_names: list[str]) -> float:
+    """
+    Prices one run with the configured price table.
+
+    Args:
+        model: The Gemini model id; unknown models are priced at zero.
+        input_tokens: Prompt tokens, including image tokens.
+        output_tokens: Generated tokens.
+        tool_names: Names of the tool calls made during the run.
+
+    Returns:
+        The cost in USD.
+    """
+    prices = load_prices()
+    model_price = prices["models"].get(model or "", {})
+    cost = input_tokens / 1e6 * model_price.get("input", 0.0) + output_tokens / 1e6 * model_price.get("output", 0.0)
+    cost += sum(prices["tools"].get(name, 0.0) for name in tool_names)
+    return cost
+
+
+def response_cost(response: Any, model: Optional[str] = None) -> float:
+    """Prices a single agno run response from its metrics and tool calls."""
+    metrics = getattr(response, "metrics", None)
+    tool_names = [tool.get("tool_name") or "unknown" for tool in (getattr(response, "tools", None) or [])]
+    return estimate_cost(model or getattr(response, "model", None), _metric_sum(metrics, "input_tokens"),
+                         _metric_sum(metrics, "output_tokens"), tool_names)
+
+
+def record_run(app: str, agent: str, response: Any, *, model: Optional[str] = None,
+               latency_s: Optional[float] = None, images: int = 0, path: str = None) -> dict:
+    """
+    Stores one agent run in the ledger, attributed to the current `ledger_scope`.
+
+    Args:
+        app: The app label ("shalaye" or "immisense").
+        agent: The agent name.
+        response: The agno RunResponse; tokens come from its metrics.
+        model: The model id; defaults to `response.model`.
+        latency_s: Wall-clock duration of the run.
+        images: Number of images sent with the run.
+        path: Ledger database path; defaults to LEDGER_PATH.
+
+    Returns:
+        The stored row as a dict.
+    """
+    metrics = getattr(response, "metrics", None)
+    tool_names = [tool.get("tool_name") or "unknown" for tool in (getattr(response, "tools", None) or [])]
+    scope = current_scope()
+    row = {
+        "created_at": time.time(),
+        "app": app,
+        "flow": scope.get("flow"),
+        "agent": agent,
+        "model": model or getattr(response, "model", None),
+        "analysis_id": scope.get("analysis_id"),
+        "session_id": scope.get("session_id"),
+        "user_id": scope.get("user_id"),
+        "input_tokens": _metric_sum(metrics, "input_tokens"),
+        "output_tokens": _metric_sum(metrics, "output_tokens"),
+        "image_tokens": images * IMAGE_TOKENS_PER_IMAGE,
+        "cached_tokens": _metric_sum(metrics, "cached_tokens"),
+        "tool_calls": len(tool_names),
+        "latency_s": latency_s,
+    }
+    row["cost_usd"] = response_cost(response, row["model"])
+    columns = ", ".join(row)
+    placeholders = ", ".join("?" for _ in row)
+    with _write_lock, _connect(path) as conn:
+        conn.execute(f"INSERT INTO agent_runs ({columns}) VALUES ({placeholders})", tuple(row.values()))
+    return row
+
+
+def record_routing(flow: str, score: float, initial_model: str, final_model: str, escalations: int,
+                   reasons: list[str], latency_s: float, cost_usd: float, path: str = None) -> None:
+    """Stores one routing decision together with the latency and cost it led to."""
+    scope = current_scope()
+    row = {
+        "created_at": time.time(), "flow": flow, "analysis_id": scope.get("analysis_id"),
+        "session_id": scope.get("session_id"), "score": score, "initial_model": initial_model,
+        "final_model": final_model, "escalations": escalations, "reasons": json.dumps(reasons),
+        "latency_s": latency_s, "cost_usd": cost_usd,
+    }
+    columns = ", ".join(row)
+    placeholders = ", ".join("?" for _ in row)
+    with _write_lock, _connect(path) as conn:
+        conn.execute(f"INSERT INTO routing_decisions ({columns}) VALUES ({placeholders})", tuple(row.values()))
+
+
+def summarize(group_by=("flow", "model"), *, since: Optional[float] = None, app: Optional[str] = None,
+              limit: Optional[int] = None, path: str = None) -> list[dict]:
+    """
+    Rolls the ledger up by the given columns, most expensive first.
+
+    Args:
+        group_by: Columns from GROUPABLE_COLUMNS to group by.
+        since: Only include runs created after this UNIX timestamp.
+        app: Only include runs of this app.
+        limit: Maximum number of groups to return.
+        path: Ledger database path.
+
+    Returns:
+        One dict per group with runs, token totals, tool calls, mean latency and cost.
+    """
+    group_by = list(group_by)
+    if not group_by or any(column not in GROUPABLE_COLUMNS for column in group_by):
+        raise ValueError(f"group_by must use columns from {GROUPABLE_COLUMNS}")
+    where, params = [], []
+    if since is not None:
+        where.append("created_at >= ?")
+        params.append(since)
+    if app is not None:
+        where.append("app = ?")
+        params.append(app)
+    columns = ", ".join(group_by)
+    sql = (
+        f"SELECT {columns}, COUNT(*) AS runs, SUM(input_tokens) AS input_tokens, "
+        "SUM(output_tokens) AS output_tokens, SUM(image_tokens) AS image_tokens, "
+        "SUM(tool_calls) AS tool_calls, AVG(latency_s) AS mean_latency_s, SUM(cost_usd) AS cost_usd "
+        f"FROM agent_runs {'WHERE ' + ' AND '.join(where) if where else ''} "
+        f"GROUP BY {columns} ORDER BY cost_usd DESC"
+    )
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    with _connect(path) as conn:
+        return [dict(row) for row in conn.execute(sql, params)]
+
+
+def summarize_routing(*, since: Optional[float] = None, path: str = None) -> list[dict]:
+    """Rolls routing decisions up by flow and initial/final model."""
+    where, params = ("WHERE created_at >= ?", [since]) if since is not None else ("", [])
+    sql = (
+        "SELECT flow, initial_model, final_model, COUNT(*) AS runs, AVG(score) AS mean_score, "
+        "SUM(escalations) AS escalations, AVG(latency_s) AS mean_latency_s, SUM(cost_usd) AS cost_usd "
+        f"FROM routing_decisions {where} GROUP BY flow, initial_model, final_model ORDER BY flow, runs DESC"
+    )
+    with _connect(path) as conn:
+        return [dict(row) for row in conn.execute(sql, params)]
+
+
+def analysis_cost(analysis_id: str, path: str = None) -> float:
+    """Returns the total cost in USD of every run of one analysis."""
+    with _connect(path) as conn:
+        row = conn.execute("SELECT SUM(cost_usd) FROM agent_runs WHERE analysis_id = ?", (analysis_id,)).fetchone()
+    return row[0] or 0.0
+
+
+def format_report(rows: list[dict], group_by, columns=("runs", "input_tokens", "output_tokens", "tool_calls")) -> str:
+    """Formats `summarize` (or `summarize_routing`) output as a fixed-width text table."""
+    headers = list(group_by) + list(columns) + ["mean_latency_s", "cost_usd"]
+    table = [headers]
+    for row in rows:
+        cells = []
+        for header in headers:
+            value = row.get(header)
+            if header == "cost_usd":
+                cells.append(f"${value or 0:.4f}")
+            elif header in ("mean_latency_s", "mean_score"):
+                cells.append(f"{value:.2f}" if value is not None else "-")
+            else:
+                cells.append("-" if value is None else str(value))
+        table.append(cells)
+    widths = [max(len(r[i]) for r in table) for i in range(len(headers))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(r, widths)).rstrip() for r in table)
+
+
+def _parse_since(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    units = {"h": 3600, "d": 86400}
+    if value[-1] in units:
+        return time.time() - float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Report token usage and cost from the ledger.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report = sub.add_parser("report", help="Roll up cost by the given columns.")
+    report.add_argument("--by", default="flow,model", help=f"Comma-separated columns from {GROUPABLE_COLUMNS}.")
+    report.add_argument("--since", help="Only runs newer than this, e.g. 24h, 7d or a UNIX timestamp.")
+    report.add_argument("--app", help="Only runs of this app.")
+    report.add_argument("--limit", type=int, help="Show at most this many groups.")
+    routing = sub.add_parser("routing", help="Show model routing decisions with their latency and cost.")
+    routing.add_argument("--since", help="Only decisions newer than this, e.g. 24h, 7d or a UNIX timestamp.")
+    args = parser.parse_args(argv)
+
+    if args.command == "routing":
+        rows = summarize_routing(since=_parse_since(args.since))
+        print(format_report(rows, ["flow", "initial_model", "final_model"], columns=("runs", "mean_score", "escalations")))
+        return 0
+
+    group_by = [column.strip() for column in args.by.split(",") if column.strip()]
+    rows = summarize(group_by, since=_parse_since(args.since), app=args.app, limit=args.limit)
+    print(format_report(rows, group_by))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
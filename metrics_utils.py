@@ -0,0 +1,311 @@
+"""
+Process-wide metrics for ShalayeAI and ImmiSense, exposed in Prometheus text format.
+
+Both apps record into the same registry. `start_metrics_server()` serves it on
+http://127.0.0.1:$METRICS_PORT/metrics (default 9464) from a daemon thread, and
+`scrape()` reads it back in-process, which is handy for checking metrics offline:
+
+    server = start_metrics_server(port=0)
+    print(scrape(server))
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """A monotonically increasing counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(Counter):
+    """A value that can go up and down."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """A cumulative histogram with fixed buckets, rendered as _bucket/_sum/_count series."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels) -> int:
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            counts, _ = self._values.get(key, ([0], 0.0))
+            return sum(counts)
+
+    def sum(self, **labels) -> float:
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            _, total = self._values.get(key, ([0], 0.0))
+            return total
+
+    def render(self) -> list[str]:
+        lines = []
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric of the process and renders them in Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labels: tuple = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS = REGISTRY.counter(
+    "app_requests_total", "User-facing requests handled, by app and flow.", ("app", "flow"))
+REQUEST_LATENCY = REGISTRY.histogram(
+    "app_request_seconds", "End-to-end latency of a user-facing request.", ("app", "flow"))
+AGENT_LATENCY = REGISTRY.histogram(
+    "agent_run_seconds", "Latency of a single agent run.", ("app", "agent"))
+AGENT_FIRST_TOKEN = REGISTRY.histogram(
+    "agent_first_token_seconds", "Time until a streamed agent run produced its first content.", ("app", "agent"))
+AGENT_TOKENS = REGISTRY.counter(
+    "agent_tokens_total", "Tokens reported by agno run metrics.", ("app", "agent", "direction"))
+STRUCTURED_OUTPUTS = REGISTRY.counter(
+    "agent_structured_outputs_total",
+    "JSON agent answers, by how they were read (schema/parsed/repaired/retried/failed).", ("app", "agent", "outcome"))
+TOOL_CALLS = REGISTRY.counter(
+    "agent_tool_calls_total", "Tool calls made by agents.", ("app", "agent", "tool", "status"))
+TOOL_LATENCY = REGISTRY.histogram(
+    "agent_tool_seconds", "Duration of agent tool calls.", ("app", "tool"))
+CACHE_REQUESTS = REGISTRY.counter(
+    "cache_requests_total", "Cache lookups, by cache and result (hit/miss).", ("cache", "result"))
+RENDER_LATENCY = REGISTRY.histogram(
+    "ui_render_seconds", "Server time of one script run ('page') or fragment rerun, by page region.",
+    ("app", "region"), buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+ERRORS = REGISTRY.counter(
+    "app_errors_total", "Errors raised while serving requests, by source and exception class.",
+    ("app", "source", "error_class"))
+
+
+def _metric_sum(metrics: Optional[dict], key: str) -> float:
+    """agno stores run metrics as lists of per-message values; this sums one of them."""
+    if not metrics or key not in metrics:
+        return 0
+    value = metrics[key]
+    return sum(v for v in value if isinstance(v, (int, float))) if isinstance(value, list) else value
+
+
+def record_agent_run(app: str, agent: str, response: Any, seconds: Optional[float] = None) -> None:
+    """
+    Records latency, token usage and tool calls of one agent run.
+
+    Args:
+        app: The app the agent belongs to ("shalaye" or "immisense").
+        agent: The agent name used as the metric label.
+        response: The agno RunResponse (or TeamRunResponse) returned by the run.
+        seconds: Wall-clock duration; defaults to the model time in the run metrics.
+    """
+    metrics = getattr(response, "metrics", None)
+    if seconds is None:
+        seconds = _metric_sum(metrics, "time")
+    AGENT_LATENCY.observe(seconds, app=app, agent=agent)
+    for direction in ("input", "output"):
+        tokens = _metric_sum(metrics, f"{direction}_tokens")
+        if tokens:
+            AGENT_TOKENS.inc(tokens, app=app, agent=agent, direction=direction)
+    for tool in getattr(response, "tools", None) or []:
+        name = tool.get("tool_name") or "unknown"
+        status = "error" if tool.get("tool_call_error") else "ok"
+        TOOL_CALLS.inc(app=app, agent=agent, tool=name, status=status)
+        tool_metrics = tool.get("metrics")
+        duration = getattr(tool_metrics, "time", None)
+        if duration is None and isinstance(tool_metrics, dict):
+            duration = tool_metrics.get("time")
+        if duration is not None:
+            TOOL_LATENCY.observe(float(duration), app=app, tool=name)
+
+
+def record_error(app: str, source: str, error: BaseException) -> None:
+    """Counts an error raised by an agent or flow, labelled by its exception class."""
+    ERRORS.inc(app=app, source=source, error_class=type(error).__name__)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Counts a cache lookup; hit rate is hits / (hits + misses) per cache."""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def track_render(app: str, region: str):
+    """
+    Times a script run or fragment rerun into ui_render_seconds.
+
+    A full run's 'page' time includes the fragments it draws; a fragment rerun
+    records only its own region, so the two compare the cost of an interaction.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        RENDER_LATENCY.observe(time.perf_counter() - start, app=app, region=region)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server_lock = threading.Lock()
+_server: Optional[ThreadingHTTPServer] = None
+# Why the default port couldn't be bound; Streamlit reruns don't retry it.
+_server_error: Optional[OSError] = None
+
+
+def start_metrics_server(host: str = METRICS_HOST, port: Optional[int] = None) -> Optional[ThreadingHTTPServer]:
+    """
+    Serves the registry on a daemon thread. Only the first call per process starts
+    a server on the default port; pass port=0 to get a fresh server on a free port.
+
+    Returns:
+        The running server, or None if the port is already taken (e.g. by the other app);
+        that is logged once and not retried.
+    """
+    global _server, _server_error
+    if port == 0:
+        server = ThreadingHTTPServer((host, 0), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        return server
+    with _server_lock:
+        if _server is None:
+            if _server_error is not None:
+                return None
+            try:
+                _server = ThreadingHTTPServer((host, METRICS_PORT if port is None else port), _MetricsHandler)
+            except OSError as e:
+                _server_error = e
+                logger.warning("Metrics server not started: %s", e)
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
+
+
+def scrape(server: ThreadingHTTPServer, timeout: float = 5.0) -> str:
+    """Fetches /metrics from a server started by `start_metrics_server`."""
+    from urllib.request import urlopen
+
+    host, port = server.server_address[:2]
+    with urlopen(f"http://{host}:{port}/metrics", timeout=timeout) as response:
+        return response.read().decode("utf-8")
+
@@ -0,0 +1,321 @@
+"""
+A small deterministic DAG executor for multi-agent pipelines.
+
+Each stage declares the stages it depends on; a stage starts as soon as all of
+its dependencies have finished, so independent stages run concurrently on a
+thread pool. Outputs are passed between stages directly, with no LLM deciding
+the order.
+
+Stage outputs also form a run-scoped artifact store: each output is kept as
+compact JSON (null and empty fields dropped), and a stage that declares the
+artifact fields it `reads` gets just those under INPUTS_KEY, ready to send to
+its agent without re-sending everything produced so far. The model tokens each
+stage spends are counted per stage.
+
+A stage may have its own `timeout` within the request's deadline (see
+deadline_utils) and a `fallback` that produces a reduced output when time runs
+out, so a slow model or search degrades the result instead of failing it.
+"""
+import contextvars
+import json
+import queue
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, Union
+
+from deadline_utils import deadline, expired, record_timeout
+from metrics_utils import REGISTRY
+from singleflight_utils import request_fingerprint
+from trace_utils import record_span
+
+STAGE_LATENCY = REGISTRY.histogram(
+    "pipeline_stage_seconds", "Wall-clock duration of a pipeline stage.", ("pipeline", "stage"))
+STAGE_TOKENS = REGISTRY.counter(
+    "pipeline_stage_tokens_total", "Model tokens used by a pipeline stage, by direction (input/output).",
+    ("pipeline", "stage", "direction"))
+
+# Results key listing the stages whose output came from the cache.
+REUSED_KEY = "_reused"
+# Stage context key holding the artifact fields the stage declared in `reads`.
+INPUTS_KEY = "_inputs"
+# Results key listing the stages that ran out of time and returned their fallback.
+DEGRADED_KEY = "_degraded"
+
+# Set inside each running stage to a function forwarding its events to the caller.
+_publisher: contextvars.ContextVar[Optional[Callable[[str, dict], None]]] = contextvars.ContextVar(
+    "pipeline_publisher", default=None)
+# Set inside each running stage to its token tally.
+_usage: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("pipeline_usage", default=None)
+
+
+@dataclass
+class Stage:
+    """
+    One node of a pipeline.
+
+    Attributes:
+        name: Unique stage name; its output is stored under this key.
+        run: Called with a dict of the pipeline inputs plus every finished stage's
+            output, keyed by stage name; returns this stage's output.
+        deps: Names of the stages that must finish first.
+        key: Optional; called with the same dict as `run`, returns exactly the
+            inputs the stage reads (JSON-serializable). With a cache, the stage is
+            skipped when an output for the same inputs is stored.
+        reads: Optional; the artifacts (dependencies or pipeline inputs) the
+            stage sends on, mapped to the fields it needs: None for the whole
+            artifact, a field name for just that value, or a tuple of names.
+            The selection is passed as `ctx[INPUTS_KEY]`.
+        timeout: Optional; seconds the stage may take, within the pipeline's deadline.
+        fallback: Optional; called with the same dict as `run` when the stage's
+            deadline passes before or while it runs, and returns a reduced output
+            without calling a model. Without one, running out of time fails the pipeline.
+        cache_as: Optional; the name the stage's cache entries are stored under,
+            `name` by default. Stages doing the same work on different inputs
+            (e.g. one per item of a fan-out) share their entries through it.
+    """
+
+    name: str
+    run: Callable[[dict], Any]
+    deps: tuple = field(default_factory=tuple)
+    key: Optional[Callable[[dict], Any]] = None
+    reads: dict[str, Union[None, str, tuple]] = field(default_factory=dict)
+    timeout: Optional[float] = None
+    fallback: Optional[Callable[[dict], Any]] = None
+    cache_as: Optional[str] = None
+
+
+class PipelineError(Exception):
+    """Raised when a stage fails; the original exception is the __cause__."""
+
+    def __init__(self, stage: str, error: BaseException):
+        super().__init__(f"Stage '{stage}' failed: {error}")
+        self.stage = stage
+
+
+def _check_graph(stages: list[Stage], inputs: dict) -> None:
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError("Stage names must be unique")
+    for reserved in (REUSED_KEY, INPUTS_KEY, DEGRADED_KEY):
+        if reserved in names:
+            raise ValueError(f"'{reserved}' is reserved")
+    known = set(names) | set(inputs)
+    for stage in stages:
+        unknown = set(stage.deps) - known
+        if unknown:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages {sorted(unknown)}")
+        undeclared = set(stage.reads) - set(stage.deps) - set(inputs)
+        if undeclared:
+            raise ValueError(f"Stage '{stage.name}' reads {sorted(undeclared)} without depending on them")
+    # Kahn's algorithm: every stage must become ready eventually.
+    done, pending = set(inputs), list(stages)
+    while pending:
+        ready = [stage for stage in pending if set(stage.deps) <= done]
+        if not ready:
+            raise ValueError(f"Pipeline has a dependency cycle among {[stage.name for stage in pending]}")
+        done |= {stage.name for stage in ready}
+        pending = [stage for stage in pending if stage not in ready]
+
+
+def publish(event: str, data: Optional[dict] = None) -> None:
+    """
+    Sends a progress event from inside a running stage to the pipeline's `on_event`.
+
+    A no-op outside a pipeline, so stage code can call it unconditionally.
+
+    Args:
+        event: Event name, e.g. "token".
+        data: Event payload.
+    """
+    publisher = _publisher.get()
+    if publisher is not None:
+        publisher(event, data or {})
+
+
+def _compact(value: Any) -> Any:
+    if isinstance(value, dict):
+        value = {k: _compact(v) for k, v in value.items()}
+        return {k: v for k, v in value.items() if v not in (None, "", [], {})}
+    if isinstance(value, (list, tuple)):
+        return [_compact(v) for v in value]
+    return value
+
+
+def to_artifact(value: Any) -> Any:
+    """A stage output as compact JSON-ready data, without null or empty fields."""
+    if hasattr(value, "model_dump"):
+        value = value.model_dump(mode="json")
+    return _compact(value)
+
+
+def select_fields(artifact: Any, fields: Union[None, str, tuple]) -> Any:
+    """Picks the declared fields of an artifact (see `Stage.reads`)."""
+    if fields is None:
+        return artifact
+    if isinstance(fields, str):
+        return artifact.get(fields)
+    return {name: artifact[name] for name in fields if name in artifact}
+
+
+def compact_json(value: Any) -> str:
+    """Minified JSON for an agent message."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def record_stage_tokens(response: Any) -> None:
+    """
+    Adds an agent run's tokens to the running stage's tally.
+
+    A no-op outside a pipeline; `agent_utils` calls it for every agent run.
+    """
+    usage = _usage.get()
+    if usage is None:
+        return
+    metrics = getattr(response, "metrics", None) or {}
+    for direction in usage:
+        usage[direction] += sum(metrics.get(f"{direction}_tokens") or [0])
+
+
+def run_pipeline(stages: list[Stage], inputs: dict, *, name: str = "pipeline", max_workers: int = 4,
+                 on_event: Optional[Callable[[str, str, dict], None]] = None, cache: Any = None) -> dict:
+    """
+    Executes the stages in dependency order, running independent stages concurrently.
+
+    Args:
+        stages: The pipeline's stages.
+        inputs: Initial values available to every stage (e.g. the request).
+        name: Pipeline name used in metrics.
+        max_workers: Maximum number of stages running at once.
+        on_event: Optional callback `(stage, event, data)`, always called from the
+            calling thread (so it may update Streamlit elements) with "started",
+            "finished" ({"seconds": ..., "cached": bool, "tokens": {"input": ...,
+            "output": ...}, "degraded": bool}) and whatever the stages `publish`.
+        cache: Optional `cache_utils.StageCache` memoizing the stages that have a `key`.
+
+    Returns:
+        The inputs plus every stage's output, keyed by stage name, under
+        REUSED_KEY the names of the stages served from the cache, and under
+        DEGRADED_KEY those that returned their fallback (never cached).
+
+    Raises:
+        PipelineError: If any stage raises (or runs out of time without a
+            fallback), as soon as it does; stages not yet started are skipped
+            and those still running are left to finish unobserved.
+    """
+    _check_graph(stages, inputs)
+    results = dict(inputs)
+    pending = list(stages)
+    running: dict[Future, tuple[Stage, float, Optional[str], dict]] = {}
+    reused, degraded = [], []
+    # Compact forms of the outputs, built the first time a stage reads them.
+    artifacts: dict[str, Any] = {}
+    # Stage events and completions arrive here from the workers, in order.
+    events: queue.Queue = queue.Queue()
+
+    def emit(stage: str, event: str, data: dict) -> None:
+        if on_event is not None:
+            on_event(stage, event, data)
+
+    def stage_inputs(stage: Stage) -> dict:
+        for source in stage.reads:
+            if source not in artifacts:
+                artifacts[source] = to_artifact(results[source])
+        return {source: select_fields(artifacts[source], fields) for source, fields in stage.reads.items()}
+
+    def run_stage(stage: Stage, snapshot: dict, usage: dict) -> tuple[Any, bool]:
+        """Returns the stage's output and whether it is the fallback."""
+        _publisher.set(lambda event, data: events.put((stage.name, event, data)))
+        _usage.set(usage)
+        started_at, start = time.time(), time.perf_counter()
+        error = None
+        try:
+            with deadline(stage.timeout):
+                if stage.fallback is not None and expired():
+                    record_timeout(name, stage.name, "skipped")
+                    return stage.fallback(snapshot), True
+                try:
+                    return stage.run(snapshot), False
+                except Exception:
+                    if not expired():
+                        raise
+                    if stage.fallback is None:
+                        record_timeout(name, stage.name, "failed")
+                        raise
+                    record_timeout(name, stage.name, "degraded")
+                    return stage.fallback(snapshot), True
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            record_span("stage", stage.name, started_at, time.perf_counter() - start, pipeline=name,
+                        tokens=dict(usage), error=error)
+
+    def memo_key(stage: Stage, snapshot: dict) -> Optional[str]:
+        if cache is None or stage.key is None:
+            return None
+        return request_fingerprint(name, stage.cache_as or stage.name, stage.key(snapshot))
+
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+    try:
+        while pending or running:
+            ready = [s for s in pending if set(s.deps) <= results.keys()]
+            while ready:
+                for stage in ready:
+                    pending.remove(stage)
+                    emit(stage.name, "started", {})
+                    snapshot = {**results, INPUTS_KEY: stage_inputs(stage)}
+                    key = memo_key(stage, snapshot)
+                    if key is not None:
+                        try:
+                            hit, value = cache.get(key, stage.cache_as or stage.name)
+                        except Exception as e:
+                            print(f"Failed to read stage {stage.name} from the cache: {e}")
+                            hit = False
+                        if hit:
+                            results[stage.name] = value
+                            reused.append(stage.name)
+                            emit(stage.name, "finished", {"seconds": 0.0, "cached": True})
+                            continue
+                    # Copy the caller's context so ledger scopes and deadlines follow the stage.
+                    usage = {"input": 0, "output": 0}
+                    future = pool.submit(contextvars.copy_context().run, run_stage, stage, snapshot, usage)
+                    running[future] = (stage, time.perf_counter(), key, usage)
+                    future.add_done_callback(lambda f: events.put((None, "done", f)))
+                # Cached stages may have unblocked others.
+                ready = [s for s in pending if set(s.deps) <= results.keys()]
+            if not running:
+                continue
+            stage_name, event, data = events.get()
+            if event != "done":
+                emit(stage_name, event, data)
+                continue
+            stage, started, key, usage = running.pop(data)
+            seconds = time.perf_counter() - started
+            STAGE_LATENCY.observe(seconds, pipeline=name, stage=stage.name)
+            for direction, tokens in usage.items():
+                if tokens:
+                    STAGE_TOKENS.inc(tokens, pipeline=name, stage=stage.name, direction=direction)
+            error = data.exception()
+            if error is not None:
+                raise PipelineError(stage.name, error) from error
+            results[stage.name], fell_back = data.result()
+            if fell_back:
+                degraded.append(stage.name)
+            elif key is not None:
+                try:
+                    cache.put(key, stage.cache_as or stage.name, results[stage.name])
+                except Exception as e:
+                    # A full disk or locked database only costs the reuse next time.
+                    print(f"Failed to cache stage {stage.name}: {e}")
+            emit(stage.name, "finished", {"seconds": seconds, "cached": False, "tokens": usage,
+                                          "degraded": fell_back})
+    except BaseException:
+        # Fail now rather than after the stages still running: queued ones never
+        # start, running ones finish in the background and their results are dropped.
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+    results[REUSED_KEY] = reused
+    results[DEGRADED_KEY] = degraded
+    return results
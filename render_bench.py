@@ -0,0 +1,124 @@
+"""
+Render benchmark of the ShalayeAI results page.
+
+Loads app.py in Streamlit's AppTest with a fixture results page (a long report
+and five chat turns), clicks a suggested follow-up question a number of times
+and reports the median time of each click and the server time of each page
+region, as recorded in ui_render_seconds:
+
+    python render_bench.py
+    python render_bench.py --clicks 20
+
+AppTest always reruns the whole script, so the click time is that of a full
+rerun; in the browser a click only reruns the chat fragment.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+REGIONS = ("page", "header", "report", "chat")
+
+REPORT = """📸 Detected: Cola
+
+🔍 Breakdown:
+- Nutritional Value: <span style="color: #FF4500;">[Score 1/5]</span>
+- Sugar Content: <span style="color: #FF4500;">[Score 1/5]</span>
+- Additives: <span style="color: #FFA500;">[Score 3/5]</span>
+
+🚨 High-Risk: Sugar
+⚠️ Moderate Risk: Caffeine, Phosphoric Acid
+✅ Low Risk: Water
+
+# Cola Report
+
+## Summary
+A sugary soft drink with caffeine.
+
+## Ingredient: Sugar
+""" + "Added sugar raises blood glucose and adds empty calories. " * 200 + """
+### Effects
+Tooth decay and weight gain when consumed often.
+
+## Ingredient: Caffeine
+""" + "Caffeine is a stimulant; most adults tolerate 400 mg a day. " * 100 + """
+## Ingredient: Phosphoric Acid
+""" + "Phosphoric acid gives the drink its tang and may affect bone density. " * 100 + """
+## Sources
+- [1] FDA
+- [2] WHO
+"""
+
+CHAT_HISTORY = [
+    {"query": f"Question {turn} about this product?", "response": f"Answer {turn}. " * 80}
+    for turn in range(1, 6)
+]
+
+
+def results_page(timeout: float = 60):
+    """
+    An AppTest of app.py showing the fixture results page, already run once.
+
+    Returns:
+        The streamlit.testing.v1.AppTest.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=timeout)
+    at.session_state.initial_analysis_done = True
+    at.session_state.full_report_content = REPORT
+    at.session_state.chat_history = [dict(entry) for entry in CHAT_HISTORY]
+    at.session_state.image_path = None
+    at.session_state.user_query = ""
+    at.session_state.analysis_id = "bench"
+    return at.run()
+
+
+def bench(clicks: int = 10) -> dict:
+    """
+    Clicks a suggested question `clicks` times on the fixture results page.
+
+    Returns:
+        'click': the median seconds of one click, and 'regions': each region's
+        mean server time per run over the clicks, from ui_render_seconds.
+    """
+    from metrics_utils import RENDER_LATENCY
+
+    at = results_page()
+    if at.exception:
+        raise RuntimeError(f"app.py failed: {at.exception[0].value}")
+    before = {region: (RENDER_LATENCY.count(app="shalaye", region=region),
+                       RENDER_LATENCY.sum(app="shalaye", region=region)) for region in REGIONS}
+    timings = []
+    for _ in range(clicks):
+        start = time.perf_counter()
+        at.button(key="suggestion_btn_2").click().run()
+        timings.append(time.perf_counter() - start)
+
+    regions = {}
+    for region, (count, total) in before.items():
+        runs = RENDER_LATENCY.count(app="shalaye", region=region) - count
+        if runs:
+            regions[region] = (RENDER_LATENCY.sum(app="shalaye", region=region) - total) / runs
+    return {"click": statistics.median(timings), "regions": regions}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the reruns of the ShalayeAI results page.")
+    parser.add_argument("--clicks", type=int, default=10, help="Number of suggestion clicks to time.")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("COLDSTART_DISABLE_WARMUP", "1")
+    sys.path.insert(0, ROOT)
+    result = bench(args.clicks)
+    print(f"suggestion click (full AppTest rerun), median of {args.clicks}: {result['click'] * 1000:.1f} ms")
+    for region, seconds in result["regions"].items():
+        print(f"    {region:<8} {seconds * 1000:8.1f} ms per run")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
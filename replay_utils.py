@@ -0,0 +1,305 @@
+"""
+Record/replay of the Gemini and Exa calls, for running the apps offline.
+
+With REPLAY_MODE=record every Gemini request (generations and the file
+uploads agno makes for audio and video) and Exa tool call goes out as
+usual and its response is appended to a cassette (a JSONL file at
+REPLAY_CASSETTE). With REPLAY_MODE=replay the same requests are answered from
+the cassette without touching the network, so the orchestration cost of both
+apps (prompt assembly, agno, parsing, rendering) can be benchmarked and
+regression-tested deterministically:
+
+    REPLAY_MODE=record streamlit run immisense.py    # click through once
+    REPLAY_MODE=replay REPLAY_LATENCY=recorded streamlit run immisense.py
+    python replay_utils.py show
+
+REPLAY_LATENCY sets how long a replayed call takes: "none" (default), the
+"recorded" durations, or a fixed number of seconds. Requests are matched on a
+hash of the model, contents and config (or tool name and arguments); identical
+requests are answered in recorded order. Cassettes hold real prompts and
+profiles, so they live under APP_DATA_DIR like the other local data.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Iterator, Optional
+
+from metrics_utils import REGISTRY
+from singleflight_utils import request_fingerprint
+
+DATA_DIR = os.getenv("APP_DATA_DIR", ".data")
+REPLAY_MODE = os.getenv("REPLAY_MODE", "off").lower()
+REPLAY_CASSETTE = os.getenv("REPLAY_CASSETTE", os.path.join(DATA_DIR, "cassettes", "default.jsonl"))
+REPLAY_LATENCY = os.getenv("REPLAY_LATENCY", "none").lower()
+
+REPLAY_INTERACTIONS = REGISTRY.counter(
+    "replay_interactions_total", "Model and tool calls seen by the replay layer, by result (recorded/replayed/missing).",
+    ("kind", "result"))
+
+
+class ReplayMissError(LookupError):
+    """Raised in replay mode when the cassette has no response for a request."""
+
+
+def _jsonable(value: Any) -> Any:
+    """A stable JSON form of a request: pydantic models by field, classes by name, bytes by digest."""
+    if isinstance(value, type):
+        return f"{value.__module__}.{value.__qualname__}"
+    if hasattr(type(value), "model_fields"):
+        return {name: _jsonable(getattr(value, name)) for name in type(value).model_fields
+                if getattr(value, name) is not None}
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, (bytes, bytearray)):
+        return "sha256:" + hashlib.sha256(value).hexdigest()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+
+class Cassette:
+    """The recorded interactions of one JSONL file, replayed per request key in recorded order."""
+
+    def __init__(self, path: str = REPLAY_CASSETTE):
+        self.path = path
+        self._entries: Optional[dict[str, list[dict]]] = None
+        self._served: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict[str, list[dict]]:
+        if self._entries is None:
+            self._entries = {}
+            if os.path.exists(self.path):
+                with open(self.path, encoding="utf-8") as f:
+                    for line in f:
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["key"], []).append(entry)
+        return self._entries
+
+    def next(self, key: str) -> Optional[dict]:
+        """The next recorded entry for a request; the last one repeats once they run out."""
+        with self._lock:
+            entries = self._load().get(key)
+            if not entries:
+                return None
+            index = min(self._served[key], len(entries) - 1)
+            self._served[key] += 1
+            return entries[index]
+
+    def record(self, entry: dict) -> None:
+        with self._lock:
+            self._load().setdefault(entry["key"], []).append(entry)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+_cassette: Optional[Cassette] = None
+_cassette_lock = threading.Lock()
+
+
+def cassette() -> Cassette:
+    """Returns the process-wide cassette at REPLAY_CASSETTE."""
+    global _cassette
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette()
+        return _cassette
+
+
+def _wait(recorded_seconds: float) -> None:
+    if REPLAY_LATENCY == "none":
+        return
+    time.sleep(recorded_seconds if REPLAY_LATENCY == "recorded" else float(REPLAY_LATENCY))
+
+
+def _replay(kind: str, key: str) -> dict:
+    entry = cassette().next(key)
+    if entry is None:
+        REPLAY_INTERACTIONS.inc(kind=kind, result="missing")
+        raise ReplayMissError(f"No recorded {kind} response for request {key[:12]} in {cassette().path}; "
+                              "record it with REPLAY_MODE=record")
+    REPLAY_INTERACTIONS.inc(kind=kind, result="replayed")
+    return entry
+
+
+class _ReplayModels:
+    """Stands in for `genai.Client.models`, which agno's Gemini uses for every generation."""
+
+    def __init__(self, real: Any = None):
+        self._real = real
+
+    @staticmethod
+    def _key(model: str, contents: Any, config: Any, stream: bool) -> str:
+        return request_fingerprint("gemini", model, stream, _jsonable(contents), _jsonable(config))
+
+    def generate_content(self, *, model: str, contents: Any, config: Any = None, **kwargs) -> Any:
+        from google.genai import types
+
+        key = self._key(model, contents, config, stream=False)
+        if self._real is None:
+            entry = _replay("gemini", key)
+            _wait(entry["seconds"])
+            return types.GenerateContentResponse.model_validate(entry["response"])
+        start = time.perf_counter()
+        response = self._real.generate_content(model=model, contents=contents, config=config, **kwargs)
+        cassette().record({"kind": "gemini", "key": key, "model": model, "seconds": time.perf_counter() - start,
+                           "response": response.model_dump(mode="json", exclude_none=True, exclude={"parsed"})})
+        REPLAY_INTERACTIONS.inc(kind="gemini", result="recorded")
+        return response
+
+    def generate_content_stream(self, *, model: str, contents: Any, config: Any = None, **kwargs) -> Iterator[Any]:
+        from google.genai import types
+
+        key = self._key(model, contents, config, stream=True)
+        if self._real is None:
+            entry = _replay("gemini", key)
+            previous = 0.0
+            for index, (offset, chunk) in enumerate(zip(entry["offsets"], entry["chunks"])):
+                if REPLAY_LATENCY == "recorded":
+                    # Keep the recorded pacing, so time to first token is replayed too.
+                    _wait(offset - previous)
+                    previous = offset
+                elif index == 0:
+                    _wait(entry["seconds"])
+                yield types.GenerateContentResponse.model_validate(chunk)
+            return
+        start = time.perf_counter()
+        chunks, offsets = [], []
+        for chunk in self._real.generate_content_stream(model=model, contents=contents, config=config, **kwargs):
+            offsets.append(time.perf_counter() - start)
+            chunks.append(chunk.model_dump(mode="json", exclude_none=True, exclude={"parsed"}))
+            yield chunk
+        cassette().record({"kind": "gemini", "key": key, "model": model, "seconds": time.perf_counter() - start,
+                           "offsets": offsets, "chunks": chunks})
+        REPLAY_INTERACTIONS.inc(kind="gemini", result="recorded")
+
+
+class _ReplayFiles:
+    """
+    Stands in for `genai.Client.files`, which agno's Gemini uses to upload local
+    audio and video and to look up large local files by their remote name.
+
+    Uploads are matched on the remote name, MIME type and a digest of the file,
+    lookups on the name; the polling `get` calls while a file is processed are
+    replayed in recorded order like any repeated request.
+    """
+
+    def __init__(self, real: Any = None):
+        self._real = real
+
+    def _call(self, key: str, operation: str, call: Callable[[], Any]) -> Any:
+        from google.genai import types
+
+        if self._real is None:
+            entry = _replay("gemini_files", key)
+            _wait(entry["seconds"])
+            return types.File.model_validate(entry["response"])
+        start = time.perf_counter()
+        response = call()
+        cassette().record({"kind": "gemini_files", "key": key, "model": f"files.{operation}",
+                           "seconds": time.perf_counter() - start,
+                           "response": response.model_dump(mode="json", exclude_none=True)})
+        REPLAY_INTERACTIONS.inc(kind="gemini_files", result="recorded")
+        return response
+
+    def get(self, *, name: str, **kwargs) -> Any:
+        key = request_fingerprint("gemini_files", "get", name)
+        return self._call(key, "get", lambda: self._real.get(name=name, **kwargs))
+
+    def upload(self, *, file: Any, config: Any = None, **kwargs) -> Any:
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "rb") as f:
+                content = f.read()
+        else:
+            content = file.read()
+            file.seek(0)
+        key = request_fingerprint("gemini_files", "upload", _jsonable(config), _jsonable(content))
+        return self._call(key, "upload", lambda: self._real.upload(file=file, config=config, **kwargs))
+
+
+class ReplayClient:
+    """
+    A `genai.Client` proxy that records or replays `models.generate_content[_stream]`
+    and `files.get/upload`, the parts of the client agno's Gemini calls synchronously.
+    """
+
+    def __init__(self, real: Any = None):
+        self.models = _ReplayModels(real.models if real is not None else None)
+        self.files = _ReplayFiles(real.files if real is not None else None)
+        self._real = real
+
+    def __getattr__(self, name: str) -> Any:
+        if self._real is None:
+            if name.startswith("_"):
+                # Keeps copy, pickle and hasattr probes working.
+                raise AttributeError(name)
+            REPLAY_INTERACTIONS.inc(kind=f"client.{name}", result="missing")
+            raise ReplayMissError(f"The Gemini client's '{name}' API isn't recorded, so it can't be used while "
+                                  "replaying (only models.generate_content[_stream] and files.get/upload are)")
+        return getattr(self._real, name)
+
+
+def wrap_model(model: Any) -> Any:
+    """
+    Routes an agno Gemini model's calls through the replay layer when REPLAY_MODE is set.
+
+    Returns:
+        The same model, for use inline: `wrap_model(Gemini(id=..., api_key=...))`.
+    """
+    if REPLAY_MODE == "record":
+        model.client = ReplayClient(model.get_client())
+    elif REPLAY_MODE == "replay":
+        model.client = ReplayClient()
+    return model
+
+
+def _tool_hook(function_name: str, function_call: Callable, arguments: dict) -> Any:
+    key = request_fingerprint("tool", function_name, _jsonable(arguments))
+    if REPLAY_MODE == "replay":
+        entry = _replay("tool", key)
+        _wait(entry["seconds"])
+        return entry["result"]
+    start = time.perf_counter()
+    result = function_call(**arguments)
+    cassette().record({"kind": "tool", "key": key, "tool": function_name, "seconds": time.perf_counter() - start,
+                       "result": result})
+    REPLAY_INTERACTIONS.inc(kind="tool", result="recorded")
+    return result
+
+
+def tool_hooks() -> Optional[list]:
+    """The agno `tool_hooks` recording or replaying tool calls (e.g. Exa), or None when REPLAY_MODE is off."""
+    return [_tool_hook] if REPLAY_MODE in ("record", "replay") else None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect a record/replay cassette.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="Summarize the recorded interactions.")
+    show.add_argument("path", nargs="?", default=REPLAY_CASSETTE)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        print(f"No cassette at {args.path}")
+        return 1
+    totals: dict[str, list[float]] = {}
+    with open(args.path, encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            name = f"{entry['kind']}:{entry.get('model') or entry.get('tool')}"
+            totals.setdefault(name, []).append(entry["seconds"])
+    for name, seconds in sorted(totals.items()):
+        print(f"{name:<40} {len(seconds):>4} calls  {sum(seconds):>8.2f}s recorded  "
+              f"{sum(seconds) / len(seconds):>6.2f}s mean")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,166 @@
+"""
+Local store of finished ImmiSense reports.
+
+Reports are keyed by a canonical hash of what produced them: the profile, the
+visa category (or goal and compared visas), the answers and the pipeline
+version (see `visa_pipeline.report_key`). Submitting an identical assessment
+again reopens the stored report instantly, and the My Reports page lists a
+profile's past reports. Bodies are zlib-compressed, and once the store grows
+past REPORT_STORE_MAX_MB the least recently opened reports are evicted.
+
+    python report_store.py list
+    python report_store.py show <key>
+"""
+import argparse
+import os
+import threading
+import time
+import zlib
+from typing import Any, Optional
+
+from metrics_utils import REGISTRY, record_cache
+from singleflight_utils import request_fingerprint
+from sqlite_utils import SQLiteStore
+
+DATA_DIR = os.getenv("APP_DATA_DIR", ".data")
+REPORT_STORE_PATH = os.getenv("REPORT_STORE_PATH", os.path.join(DATA_DIR, "reports.sqlite3"))
+REPORT_STORE_MAX_MB = float(os.getenv("REPORT_STORE_MAX_MB", "20"))
+
+REPORT_EVICTIONS = REGISTRY.counter("report_store_evictions_total", "Stored reports evicted to stay under the size limit.")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    key TEXT PRIMARY KEY,
+    profile_key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    title TEXT NOT NULL,
+    score REAL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_profile ON reports (profile_key, created_at);
+CREATE INDEX IF NOT EXISTS reports_accessed ON reports (accessed_at);
+"""
+
+_SUMMARY_COLUMNS = "key, kind, title, score, size, created_at, accessed_at"
+
+
+def profile_key(profile: Any) -> str:
+    """Fingerprint of a saved profile; reports are listed per profile."""
+    return request_fingerprint("profile", profile)
+
+
+class ReportStore(SQLiteStore):
+    """A size-bounded, compressed store of finished reports."""
+
+    table = "reports"
+    schema = _SCHEMA
+
+    def __init__(self, path: str = REPORT_STORE_PATH, max_bytes: int = int(REPORT_STORE_MAX_MB * 1024 * 1024)):
+        super().__init__(path, max_bytes)
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Opens a stored report.
+
+        Returns:
+            The summary fields (see `list_reports`) plus the Markdown 'report', or None.
+        """
+        with self._lock, self._connect() as conn:
+            row = conn.execute(f"SELECT {_SUMMARY_COLUMNS}, body FROM reports WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE reports SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        record_cache("reports", hit=row is not None)
+        if row is None:
+            return None
+        report = dict(row)
+        report["report"] = zlib.decompress(report.pop("body")).decode("utf-8")
+        return report
+
+    def put(self, key: str, report: str, *, profile: Any, kind: str, title: str,
+            score: Optional[float] = None) -> None:
+        """
+        Stores a finished report, then evicts the least recently opened ones past the size limit.
+
+        Args:
+            key: From `visa_pipeline.report_key`.
+            report: The Markdown report.
+            profile: The profile it was made for, used to list it under that profile.
+            kind: "assessment" or "comparison".
+            title: Shown in the report list, e.g. "H-1B assessment".
+            score: The overall (or best) eligibility score, if any.
+        """
+        body = zlib.compress(report.encode("utf-8"), 6)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO reports (key, profile_key, kind, title, score, body, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, profile_key(profile), kind, title, score, body, len(body), now, now))
+            evicted = self._evict_lru(conn)
+            if evicted:
+                REPORT_EVICTIONS.inc(evicted)
+
+    def list_reports(self, profile: Any = None, limit: int = 20) -> list[dict]:
+        """
+        Lists stored reports, newest first, without their bodies.
+
+        Args:
+            profile: Only the reports made for this profile; every report when None.
+            limit: Maximum number of reports.
+
+        Returns:
+            Dicts with 'key', 'kind', 'title', 'score', 'size' (compressed bytes),
+            'created_at' and 'accessed_at'.
+        """
+        query, params = f"SELECT {_SUMMARY_COLUMNS} FROM reports", []
+        if profile is not None:
+            query += " WHERE profile_key = ?"
+            params.append(profile_key(profile))
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY created_at DESC LIMIT ?", (*params, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+
+_default: Optional[ReportStore] = None
+_default_lock = threading.Lock()
+
+
+def report_store() -> ReportStore:
+    """Returns the process-wide report store at REPORT_STORE_PATH."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = ReportStore()
+        return _default
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect the stored ImmiSense reports.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    list_cmd = sub.add_parser("list", help="List stored reports, newest first.")
+    list_cmd.add_argument("--limit", type=int, default=20)
+    show = sub.add_parser("show", help="Print one report.")
+    show.add_argument("key", help="A report key or a unique prefix of one.")
+    args = parser.parse_args(argv)
+
+    store = report_store()
+    if args.command == "list":
+        for report in store.list_reports(limit=args.limit):
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(report["created_at"]))
+            score = f"{report['score']:>5.1f}" if report["score"] is not None else "    -"
+            print(f"{report['key'][:12]}  {created}  {score}  {report['size']:>7} B  {report['title']}")
+        return 0
+
+    matches = [report for report in store.list_reports(limit=10 ** 9) if report["key"].startswith(args.key)]
+    if len(matches) != 1:
+        print(f"{len(matches)} reports match '{args.key}'")
+        return 1
+    print(store.get(matches[0]["key"])["report"])
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,227 @@
+"""
+Routes each request to the cheapest Gemini tier that is expected to handle it.
+
+A request is scored locally from 0 (trivial) to 1 (hard) using cheap signals:
+how text-dense the label image is, how many ingredients are involved, what kind
+of question is asked and how complex the user's profile is. The score picks a
+starting tier; `run_with_escalation` only moves up a tier when the response fails
+validation and the request's deadline leaves time for another attempt. Every
+decision is logged with its latency and cost.
+"""
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from deadline_utils import has_time, record_timeout
+from ledger_utils import record_routing, response_cost
+from metrics_utils import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SHALAYE_TIERS = ("gemini-2.0-flash", "gemini-2.5-flash", "gemini-2.5-pro")
+IMMISENSE_TIERS = ("gemini-2.5-flash", "gemini-2.5-pro")
+
+# Score cut-offs between consecutive tiers; a score at or above the n-th value
+# starts on tier n+1.
+TIER_THRESHOLDS = tuple(float(x) for x in os.getenv("ROUTING_THRESHOLDS", "0.45,0.8").split(","))
+# An escalated attempt is only started with at least this much of the deadline left.
+ESCALATION_MIN_SECONDS = float(os.getenv("ESCALATION_MIN_SECONDS", "20"))
+
+ROUTING_DECISIONS = REGISTRY.counter(
+    "routing_decisions_total", "Requests routed to a starting model tier.", ("flow", "model"))
+ROUTING_ESCALATIONS = REGISTRY.counter(
+    "routing_escalations_total", "Escalations to a higher tier after validation failed.", ("flow", "from_model"))
+ROUTING_ESCALATION_FAILURES = REGISTRY.counter(
+    "routing_escalation_failures_total",
+    "Escalated attempts that raised, leaving the previous tier's response in place.", ("flow", "model"))
+
+COMPLEX_QUERY_PATTERNS = (
+    r"interact", r"medication", r"drug", r"pregnan", r"breastfeed", r"dosage|dose", r"long[- ]term",
+    r"condition", r"diabet", r"hypertension|blood pressure", r"kidney|liver", r"compare|alternative",
+)
+
+
+@dataclass
+class RoutingDecision:
+    """The tier chosen for one request and why."""
+
+    flow: str
+    score: float
+    tiers: tuple
+    tier: int
+    reasons: list[str] = field(default_factory=list)
+    escalations: int = 0
+
+    @property
+    def model(self) -> str:
+        return self.tiers[self.tier]
+
+
+def image_text_density(image: Any) -> float:
+    """
+    Estimates how much text a label image holds as the fraction of edge pixels.
+
+    Args:
+        image: A PIL Image (already downscaled for analysis).
+
+    Returns:
+        A value in [0, 1]; plain packaging is ~0.02, dense supplement facts ~0.2+.
+    """
+    from PIL import ImageFilter
+
+    gray = image.convert("L")
+    gray.thumbnail((256, 256))
+    edges = gray.filter(ImageFilter.FIND_EDGES)
+    histogram = edges.histogram()
+    strong = sum(histogram[48:])
+    return strong / max(1, sum(histogram))
+
+
+def query_complexity(query: str) -> float:
+    """Scores a free-text question by how many clinically sensitive topics it touches."""
+    if not query:
+        return 0.0
+    hits = sum(1 for pattern in COMPLEX_QUERY_PATTERNS if re.search(pattern, query, re.IGNORECASE))
+    return min(1.0, hits / 3)
+
+
+def health_profile_complexity(profile: Optional[dict]) -> float:
+    """Scores a ShalayeAI health profile by conditions, medications, allergies and pregnancy."""
+    if not profile or not profile.get("profile_complete"):
+        return 0.0
+    conditions = [c for c in profile.get("health_conditions", []) if c not in ("None", "")]
+    medications = [m for m in re.split(r"[,;\n]", profile.get("medications", "")) if m.strip()]
+    allergies = [a for a in re.split(r"[,;\n]", profile.get("allergies", "")) if a.strip()]
+    pregnant = profile.get("pregnancy_status") not in ("", "Not Applicable", None)
+    points = len(conditions) + len(medications) + 0.5 * len(allergies) + (2 if pregnant else 0)
+    return min(1.0, points / 5)
+
+
+def score_shalaye_request(image: Any = None, query: str = "", profile: Optional[dict] = None,
+                          ingredient_count: Optional[int] = None) -> tuple[float, list[str]]:
+    """
+    Scores a ShalayeAI analysis or follow-up request.
+
+    Args:
+        image: The downscaled label image, if any.
+        query: The user's question (empty for the standard analysis).
+        profile: The user's health profile from session state.
+        ingredient_count: Number of ingredients, when known from an earlier report.
+
+    Returns:
+        The score in [0, 1] and human-readable reasons.
+    """
+    reasons, parts = [], []
+    if image is not None:
+        density = image_text_density(image)
+        parts.append((0.45, min(1.0, density / 0.25)))
+        reasons.append(f"text density {density:.3f}")
+    if ingredient_count is not None:
+        parts.append((0.25, min(1.0, ingredient_count / 20)))
+        reasons.append(f"{ingredient_count} ingredients")
+    if query:
+        qc = query_complexity(query)
+        parts.append((0.3, qc))
+        reasons.append(f"query complexity {qc:.2f}")
+    pc = health_profile_complexity(profile)
+    parts.append((0.3, pc))
+    reasons.append(f"profile complexity {pc:.2f}")
+    total_weight = sum(weight for weight, _ in parts)
+    score = sum(weight * value for weight, value in parts) / total_weight
+    return round(score, 3), reasons
+
+
+def score_assessment(profile: dict, answers: dict) -> tuple[float, list[str]]:
+    """
+    Scores an ImmiSense assessment by profile red flags and how much free text must be weighed.
+
+    Args:
+        profile: The saved ImmiSense profile.
+        answers: Assessment question -> answer.
+
+    Returns:
+        The score in [0, 1] and human-readable reasons.
+    """
+    reasons = []
+    flags = sum(1 for key in ("previous_visa_denials", "criminal_history") if profile.get(key) == "Yes")
+    if flags:
+        reasons.append(f"{flags} legal red flag(s)")
+    words = sum(len(str(answer).split()) for answer in answers.values())
+    reasons.append(f"{words} answer words")
+    status = str(profile.get("current_us_status", "")).strip().lower()
+    in_status = status not in ("", "n/a", "na", "none")
+    if in_status:
+        reasons.append("existing U.S. status")
+    score = 0.5 * min(1.0, flags / 2) + 0.35 * min(1.0, words / 400) + (0.15 if in_status else 0.0)
+    return round(score, 3), reasons
+
+
+def route(flow: str, score: float, reasons: list[str], tiers: tuple = SHALAYE_TIERS) -> RoutingDecision:
+    """Picks the starting tier for a score using TIER_THRESHOLDS."""
+    tier = sum(1 for threshold in TIER_THRESHOLDS if score >= threshold)
+    decision = RoutingDecision(flow=flow, score=score, tiers=tiers, tier=min(tier, len(tiers) - 1), reasons=reasons)
+    ROUTING_DECISIONS.inc(flow=flow, model=decision.model)
+    return decision
+
+
+def run_with_escalation(decision: RoutingDecision, attempt: Callable[[str], Any],
+                        validate: Callable[[Any], list[str]]) -> Any:
+    """
+    Runs a request on the routed tier, escalating only when validation fails.
+
+    Args:
+        decision: The decision returned by `route`; updated in place.
+        attempt: Called with a model id; returns an agno run response.
+        validate: Returns a list of problems with a response (empty when valid).
+
+    Returns:
+        The last response: the first valid one, the top tier's, the last one
+        made before the deadline left no time to escalate, or the one before an
+        escalated attempt that raised.
+
+    Raises:
+        Whatever the first attempt raised; a failed escalation keeps the
+        earlier response instead (`decision` is moved back to its tier).
+    """
+    initial_model = decision.model
+    start = time.perf_counter()
+    cost = 0.0
+    response = None
+    while True:
+        try:
+            response = attempt(decision.model)
+        except Exception as e:
+            if response is None:
+                raise
+            # A network error, quota or deadline on the bigger model must not lose a usable answer.
+            ROUTING_ESCALATION_FAILURES.inc(flow=decision.flow, model=decision.model)
+            decision.reasons.append(f"{decision.model} failed ({type(e).__name__}: {e}); "
+                                    f"kept the {decision.tiers[decision.tier - 1]} response")
+            decision.tier -= 1
+            decision.escalations -= 1
+            break
+        cost += response_cost(response, decision.model)
+        problems = validate(response)
+        if not problems or decision.tier == len(decision.tiers) - 1:
+            break
+        if not has_time(ESCALATION_MIN_SECONDS):
+            record_timeout(decision.flow, "escalation", "skipped")
+            decision.reasons.append(f"kept {decision.model} despite {', '.join(problems)}: deadline too close")
+            break
+        ROUTING_ESCALATIONS.inc(flow=decision.flow, from_model=decision.model)
+        decision.reasons.append(f"escalated from {decision.model}: {', '.join(problems)}")
+        decision.tier += 1
+        decision.escalations += 1
+    latency = time.perf_counter() - start
+    logger.info("routing flow=%s score=%.3f model=%s->%s escalations=%d latency=%.2fs cost=$%.4f reasons=%s",
+                decision.flow, decision.score, initial_model, decision.model, decision.escalations,
+                latency, cost, "; ".join(decision.reasons))
+    try:
+        record_routing(decision.flow, decision.score, initial_model, decision.model, decision.escalations,
+                       decision.reasons, latency, cost)
+    except Exception as e:
+        print(f"Failed to record routing decision: {e}")
+    return response
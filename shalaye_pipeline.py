@@ -0,0 +1,249 @@
+"""
+The ShalayeAI analysis pipeline: the label is read first, every ingredient is
+then researched concurrently, and one last call writes the report.
+
+- LabelReader, a fast model with structured output and no tools, turns the
+  image into the product and its ingredient list;
+- an IngredientResearcher per ingredient searches the web for that ingredient
+  alone, at most RESEARCH_WORKERS at a time, so the research takes about as
+  long as the slowest ingredient rather than the sum of all of them;
+- the ShalayeAI agent, on the routed model and now without tools, writes the report in the
+  usual INSTRUCTIONS format from the label, the image and the research notes.
+
+The research stages are only known once the label has been read, so the
+extraction runs before the stage graph is built (as the compare-all-visas mode
+does with its visas). Research depends only on the ingredient and the kind of
+product, not on the product or the user's profile, so its stage cache entries
+are shared between analyses: sugar is researched once a week, not once per
+soft drink. An ingredient whose research runs out of time is reported as not
+researched; the report itself has no fallback.
+"""
+import os
+import re
+from typing import Any, Callable, Optional
+
+from pydantic import BaseModel, Field
+
+from agent_task.agent_instructions import (EXTRACTION_INSTRUCTIONS, INGREDIENT_RESEARCH_INSTRUCTIONS, INSTRUCTIONS,
+                                           agent_description)
+from agent_utils import run_agent, run_structured
+from cache_utils import stage_cache
+from deadline_utils import bounded_tool_call
+from pipeline_utils import Stage, compact_json, run_pipeline
+from replay_utils import tool_hooks, wrap_model
+
+EXTRACTION_MODEL = "gemini-2.0-flash"
+RESEARCH_MODEL = "gemini-2.0-flash"
+REPORT_MODEL = "gemini-2.0-flash"
+
+# Part of every stage cache key; bump when the prompts or the research stage change.
+PIPELINE_VERSION = "2026.10.2"
+
+# Ingredients researched at once; bounds concurrent Gemini and Exa calls per analysis.
+RESEARCH_WORKERS = int(os.getenv("RESEARCH_WORKERS", "6"))
+# Ingredients past this many (long food labels) are left to the report writer's own knowledge.
+MAX_RESEARCHED_INGREDIENTS = int(os.getenv("MAX_RESEARCHED_INGREDIENTS", "20"))
+# Most the extraction and each ingredient's research may take; the report gets whatever is left.
+STAGE_TIMEOUTS = {"extraction": 20.0, "research": 40.0}
+
+
+# --- Stage outputs ---
+
+class LabelExtraction(BaseModel):
+    """What LabelReader read off the image."""
+
+    product_name: str = ""
+    product_type: str = ""
+    ingredients: list[str] = Field(default_factory=list)
+    label_notes: list[str] = Field(default_factory=list)
+
+
+class IngredientResearch(BaseModel):
+    """One ingredient's research notes; empty when it wasn't researched in time."""
+
+    ingredient: str
+    notes: str = ""
+
+
+# --- Agents ---
+
+def _gemini(model_id: str) -> Any:
+    from agno.models.google import Gemini
+    from http_utils import gemini_client_params
+
+    return wrap_model(Gemini(id=model_id, api_key=os.getenv("GOOGLE_API_KEY"), client_params=gemini_client_params()))
+
+
+def create_label_reader() -> Any:
+    """Creates the tool-less agent that reads the product and its ingredients off the image."""
+    from agno.agent import Agent
+
+    return Agent(name="LabelReader", model=_gemini(EXTRACTION_MODEL), instructions=EXTRACTION_INSTRUCTIONS,
+                 response_model=LabelExtraction, retries=2)
+
+
+def create_ingredient_researcher() -> Any:
+    """
+    Creates an agent that researches a single ingredient with Exa.
+
+    Agents keep per-run state, so every research stage gets its own.
+    """
+    from agno.agent import Agent
+    from agno.tools.exa import ExaTools
+    from http_utils import pool_exa
+
+    return Agent(name="IngredientResearcher", model=_gemini(RESEARCH_MODEL),
+                 tools=[pool_exa(ExaTools(api_key=os.getenv("EXA_API_KEY")))],
+                 tool_hooks=[bounded_tool_call, *(tool_hooks() or [])],
+                 instructions=INGREDIENT_RESEARCH_INSTRUCTIONS, markdown=True, retries=2)
+
+
+def create_report_writer(model_id: str) -> Any:
+    """
+    Creates the agent that writes the report; it has no tools, since the research is done.
+
+    Args:
+        model_id: The Gemini model to use, as chosen by the router.
+    """
+    from agno.agent import Agent
+
+    return Agent(name="ShalayeAI", model=_gemini(model_id), description=agent_description,
+                 instructions=INSTRUCTIONS, markdown=True)
+
+
+# --- Stages ---
+
+def ingredient_key(name: str) -> str:
+    """The form of an ingredient name used to deduplicate and cache it."""
+    return re.sub(r"\s+", " ", name).strip().casefold()
+
+
+def unique_ingredients(ingredients: list[str]) -> list[str]:
+    """The ingredients in label order, without blanks or repeats."""
+    seen, unique = set(), []
+    for name in ingredients:
+        key = ingredient_key(name)
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(name.strip())
+    return unique
+
+
+def _memo(*inputs: Any) -> list:
+    return [PIPELINE_VERSION, *inputs]
+
+
+def _research_query(ingredient: str, product_type: str) -> str:
+    return f"Ingredient: {ingredient}\nProduct type: {product_type or 'unknown'}"
+
+
+def _report_query(query: str, label: LabelExtraction, research: list[IngredientResearch],
+                  unresearched: list[str]) -> str:
+    parts = [
+        query,
+        "The label has already been read and its ingredients researched; base the report on the following "
+        "instead of searching again, and cite the sources given in the research notes.",
+        "## Label\n" + compact_json(label.model_dump()),
+    ]
+    if research:
+        parts.append("## Ingredient Research\n\n" + "\n\n".join(
+            f"### {item.ingredient}\n{item.notes}" for item in research if item.notes))
+    if unresearched:
+        parts.append("Not researched (say that information on these is limited): " + ", ".join(unresearched))
+    return "\n\n".join(parts)
+
+
+def build_stages(label: LabelExtraction, query: str, images: list, report_model: str,
+                 report_attempt: Optional[Callable[[Callable[[str], Any]], Any]] = None) -> list[Stage]:
+    """
+    Wires one research stage per ingredient and the report stage that waits for all of them.
+
+    Args:
+        label: The extraction's output.
+        query: The user's request, including the profile context.
+        images: The label image, as passed to `agent.run`.
+        report_model: Starting Gemini model for the report.
+        report_attempt: Optional wrapper around the report call, given a function
+            that writes the report on a model id (used for repair and tier escalation).
+
+    Returns:
+        The pipeline stages.
+    """
+    ingredients = unique_ingredients(label.ingredients)
+    researched, skipped = ingredients[:MAX_RESEARCHED_INGREDIENTS], ingredients[MAX_RESEARCHED_INGREDIENTS:]
+    # Stage names are metric labels, so they number the ingredients instead of naming them.
+    research_stages = [f"research:{index}" for index in range(len(researched))]
+
+    def research(ingredient: str) -> Callable[[dict], IngredientResearch]:
+        def run(ctx: dict) -> IngredientResearch:
+            response = run_agent(create_ingredient_researcher(), _research_query(ingredient, label.product_type),
+                                 app="shalaye", agent_name="research")
+            return IngredientResearch(ingredient=ingredient, notes=response.content or "")
+        return run
+
+    def not_researched(ingredient: str) -> Callable[[dict], IngredientResearch]:
+        return lambda ctx: IngredientResearch(ingredient=ingredient)
+
+    def report(ctx: dict) -> str:
+        results = [ctx[stage] for stage in research_stages]
+        unresearched = [item.ingredient for item in results if not item.notes] + skipped
+        message = _report_query(query, label, results, unresearched)
+
+        def run_on(model_id: str) -> Any:
+            return run_agent(create_report_writer(model_id), message, app="shalaye", agent_name="report",
+                             images=images)
+
+        response = report_attempt(run_on) if report_attempt else run_on(report_model)
+        return response.content
+
+    return [
+        *[Stage(stage, research(ingredient), deps=("label",),
+                key=lambda ctx, ingredient=ingredient: _memo(ingredient_key(ingredient), label.product_type),
+                timeout=STAGE_TIMEOUTS["research"], fallback=not_researched(ingredient), cache_as="research")
+          for stage, ingredient in zip(research_stages, researched)],
+        Stage("report", report, deps=("label", *research_stages)),
+    ]
+
+
+def extract_label(images: list) -> LabelExtraction:
+    """
+    Reads the product and its ingredients off the label image.
+
+    Args:
+        images: The label image, as passed to `agent.run`.
+
+    Returns:
+        The extraction; `ingredients` is empty when no list is legible.
+    """
+    return run_structured(create_label_reader(), "Read this product label.", LabelExtraction, app="shalaye",
+                          agent_name="extraction", timeout=STAGE_TIMEOUTS["extraction"], images=images)
+
+
+def run_analysis(image_path: str, query: str, *, report_model: str = REPORT_MODEL,
+                 report_attempt: Optional[Callable] = None, on_event: Optional[Callable] = None,
+                 use_cache: bool = True) -> dict:
+    """
+    Runs a full product analysis within the caller's deadline.
+
+    Args:
+        image_path: Path of the prepared label image.
+        query: The user's request, including the profile context.
+        report_model: Starting Gemini model for the report.
+        report_attempt: Optional wrapper used to repair and escalate the report stage.
+        on_event: Stage progress callback, see `pipeline_utils.run_pipeline`;
+            also called with ("label", "finished", {"ingredients": n}) once the
+            extraction has found n ingredients.
+        use_cache: Reuse research of ingredients seen before.
+
+    Returns:
+        The pipeline results: 'label' (a LabelExtraction), every research
+        stage's IngredientResearch, the Markdown 'report' and the names of the
+        reused and of the degraded (timed out) stages.
+    """
+    images = [{"filepath": image_path}]
+    label = extract_label(images)
+    if on_event is not None:
+        on_event("label", "finished", {"ingredients": len(unique_ingredients(label.ingredients))})
+    return run_pipeline(build_stages(label, query, images, report_model, report_attempt), {"label": label},
+                        name="shalaye", max_workers=RESEARCH_WORKERS, on_event=on_event,
+                        cache=stage_cache() if use_cache else None)
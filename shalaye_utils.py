@@ -1,9 +1,15 @@
 import streamlit as st
 import re
-from PIL import Image
-import matplotlib.pyplot as plt
+from collections import Counter
+from functools import lru_cache
+from typing import TYPE_CHECKING
 
-def optimize_image(image: Image.Image) -> Image.Image:
+# PIL and matplotlib are imported inside the functions that need them so that
+# importing this module (and therefore the first paint of the app) stays cheap.
+if TYPE_CHECKING:
+    from PIL import Image
+
+def optimize_image(image: "Image.Image") -> "Image.Image":
     """
     Optimizes an image for analysis by resizing and converting it to JPEG.
 
@@ -13,6 +19,8 @@ def optimize_image(image: Image.Image) -> Image.Image:
     Returns:
         An optimized PIL Image object.
     """
+    from PIL import Image
+
     max_size = (720, 720)
     image.thumbnail(max_size, Image.LANCZOS) # Use LANCZOS for high-quality downsampling
     return image
@@ -28,8 +36,9 @@ def extract_scores(breakdown_text: str) -> dict:
         A dictionary with parameter names as keys and scores (0-5) as integer values.
     """
     params = {}
-    # Matches lines like "- Parameter Name: Score"
-    matches = re.findall(r'- (.*?): (\d)', breakdown_text)
+    # Matches lines like "- Parameter Name: Score", including the colored format the
+    # agent is instructed to use: "- Parameter Name: <span style="...">[Score 4/5]</span>"
+    matches = re.findall(r'^\s*[-*]\s*\**([^:\n<]+?)\**:\s*(?:<span[^>]*>)?\s*\[?\s*(?:Score\s*)?([0-5])\b', breakdown_text, re.MULTILINE)
     for param, score in matches:
         params[param.strip()] = int(score)
     return params
@@ -55,6 +64,177 @@ def extract_risks(text_block: str, risk_type: str) -> list[str]:
         return [risk for risk in risks if risk]
     return []
 
+RISK_LABELS = ["🚨 High-Risk:", "⚠️ Moderate Risk:", "✅ Low Risk:"]
+
+# The parts of the report the main page parses, in report order, with the exact
+# format the agent is asked to produce (see INSTRUCTIONS).
+REPORT_SECTIONS = {
+    "detected": "📸 Detected: [Product Name/Type]",
+    "breakdown": (
+        "🔍 Breakdown:\n"
+        "- [Parameter Name]: <span style=\"color: #FFD700;\">[Score 3/5]</span>\n"
+        "(one line per parameter: Nutritional Value, Ingredient Purity, Allergen Presence, Health Benefits, "
+        "Environmental Impact if applicable; colors #FF4500=1, #FFA500=2, #FFD700=3, #7CFC00=4, #32CD32=5)"
+    ),
+    "high_risk": "🚨 High-Risk: [item1, item2, ...] (or None)",
+    "moderate_risk": "⚠️ Moderate Risk: [item1, item2, ...] (or None)",
+    "low_risk": "✅ Low Risk: [item1, item2, ...] (or None)",
+}
+
+_RISK_SECTIONS = dict(zip(["high_risk", "moderate_risk", "low_risk"], RISK_LABELS))
+_BREAKDOWN_BLOCK = r'🔍 Breakdown:.*?(?=🚨|⚠️ Moderate Risk:|✅ Low Risk:|\n#|$)'
+
+
+def missing_report_sections(content: str) -> list[str]:
+    """
+    Validates a report against REPORT_SECTIONS.
+
+    Args:
+        content: The full analysis text from the agent.
+
+    Returns:
+        Keys of REPORT_SECTIONS that are missing or malformed; empty if the report is complete.
+    """
+    content = content or ""
+    missing = []
+    if not re.search(r'📸 Detected: (.+)', content):
+        missing.append("detected")
+    breakdown_text = re.search(_BREAKDOWN_BLOCK, content, re.DOTALL)
+    if not breakdown_text or not extract_scores(breakdown_text.group(0)):
+        missing.append("breakdown")
+    for key, label in _RISK_SECTIONS.items():
+        if label not in content:
+            missing.append(key)
+    return missing
+
+def build_repair_prompt(content: str, missing: list[str]) -> str:
+    """
+    Builds a prompt asking for only the missing sections, with the report as context.
+
+    Args:
+        content: The existing report.
+        missing: Keys returned by `missing_report_sections`.
+
+    Returns:
+        The prompt for the repair agent.
+    """
+    formats = "\n".join(REPORT_SECTIONS[key] for key in missing)
+    return (
+        "Below is a product analysis report that is missing some required sections.\n"
+        "Using ONLY the information in the report, write the missing sections and nothing else, "
+        "each in exactly this format:\n\n"
+        f"{formats}\n\n"
+        "Do not repeat any other part of the report.\n\n"
+        f"--- REPORT ---\n{content}"
+    )
+
+def splice_report_sections(content: str, repair: str, missing: list[str]) -> str:
+    """
+    Inserts the repaired sections into the report, replacing malformed ones.
+
+    Args:
+        content: The existing report.
+        repair: The repair agent's output containing the missing sections.
+        missing: The keys that were requested.
+
+    Returns:
+        The report with the repaired sections spliced in.
+    """
+    if "detected" in missing:
+        detected = re.search(r'📸 Detected: .+', repair)
+        if detected:
+            content = f"{detected.group(0)}\n\n{content}"
+    if "breakdown" in missing:
+        block = re.search(_BREAKDOWN_BLOCK, repair, re.DOTALL)
+        if block and extract_scores(block.group(0)):
+            new_block = block.group(0).strip() + "\n\n"
+            if re.search(_BREAKDOWN_BLOCK, content, re.DOTALL):
+                content = re.sub(_BREAKDOWN_BLOCK, lambda _: new_block, content, count=1, flags=re.DOTALL)
+            else:
+                detected = re.search(r'📸 Detected: .+\n?', content)
+                at = detected.end() if detected else 0
+                content = f"{content[:at]}\n{new_block}{content[at:]}"
+    risk_lines = []
+    for key, label in _RISK_SECTIONS.items():
+        if key in missing:
+            line = re.search(rf'{re.escape(label)}.*', repair)
+            if line:
+                risk_lines.append(line.group(0).strip())
+    if risk_lines:
+        block = re.search(_BREAKDOWN_BLOCK, content, re.DOTALL)
+        existing = [m.end() for label in RISK_LABELS for m in [re.search(rf'{re.escape(label)}.*', content)] if m]
+        at = max(existing) if existing else (block.end() if block else 0)
+        content = f"{content[:at]}\n" + "\n".join(risk_lines) + f"\n{content[at:]}"
+    return content
+
+_HEADING = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+# Sections shown open on the results page alongside the lead text.
+SUMMARY_TITLES = ("summary", "overview")
+
+@lru_cache(maxsize=32)
+def split_report_sections(content: str) -> tuple[tuple[str, str], ...]:
+    """
+    Splits a report into its top-level Markdown sections.
+
+    Sections start at the shallowest heading level used more than once, so a
+    report with a single '#' title and '##' sections is split at '##' and the
+    '###' subsections stay inside their section. Headings in code fences are
+    ignored. Cached, since the results page asks again on every rerun.
+
+    Args:
+        content: The full analysis text from the agent.
+
+    Returns:
+        (title, markdown) pairs in report order. The text before the first
+        section comes first with an empty title; a report without repeated
+        headings is returned whole as that lead text.
+    """
+    lines = content.splitlines()
+    headings = []
+    in_fence = False
+    for index, line in enumerate(lines):
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+            continue
+        match = None if in_fence else _HEADING.match(line)
+        if match:
+            headings.append((index, len(match.group(1)), match.group(2).strip("* ")))
+    repeated = [level for level, count in Counter(level for _, level, _ in headings).items() if count > 1]
+    if not repeated:
+        return (("", content.strip()),)
+    starts = [(index, title) for index, level, title in headings if level == min(repeated)]
+    sections = []
+    lead = "\n".join(lines[:starts[0][0]]).strip()
+    if lead:
+        sections.append(("", lead))
+    ends = [index for index, _ in starts[1:]] + [len(lines)]
+    for (start, title), end in zip(starts, ends):
+        sections.append((title, "\n".join(lines[start + 1:end]).strip()))
+    return tuple(sections)
+
+def is_summary_section(title: str) -> bool:
+    """Whether a section from `split_report_sections` is the lead text or a summary."""
+    return not title or any(word in title.lower() for word in SUMMARY_TITLES)
+
+@lru_cache(maxsize=32)
+def parameter_chart_png(scores: tuple) -> bytes:
+    """
+    Renders `plot_parameter_scores` to PNG, the way st.pyplot would.
+
+    Cached, so reruns of the results page don't redraw the chart.
+
+    Args:
+        scores: (parameter name, score) pairs.
+    """
+    import io
+    import matplotlib.pyplot as plt
+
+    fig = plot_parameter_scores(dict(scores))
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight", dpi=200)
+    plt.close(fig)
+    return buffer.getvalue()
+
 def plot_parameter_scores(scores: dict):
     """
     Generates a matplotlib bar plot of parameter scores.
@@ -65,6 +245,8 @@ def plot_parameter_scores(scores: dict):
     Returns:
         A matplotlib Figure object.
     """
+    import matplotlib.pyplot as plt
+
     plt.style.use('dark_background')
     fig, ax = plt.subplots(figsize=(8,4), facecolor='#1e1e1e')
     colors = ['#6c5ce7', '#a29bfe', '#74b9ff', '#55efc4', '#ffeaa7'] # Example colors
@@ -0,0 +1,123 @@
+"""
+Process-level single-flight deduplication of identical concurrent requests.
+
+When several sessions ask for the same analysis at the same time (same image,
+same profile, same prompt), only the first one runs it; the others wait for that
+run and receive its result, or its exception.
+"""
+import hashlib
+import json
+import threading
+from typing import Any, Callable
+
+from metrics_utils import REGISTRY
+
+SINGLEFLIGHT_CALLS = REGISTRY.counter(
+    "singleflight_calls_total", "Requests seen by a single-flight group, by role (leader/coalesced).",
+    ("group", "role"))
+SINGLEFLIGHT_IN_FLIGHT = REGISTRY.gauge(
+    "singleflight_in_flight", "Distinct requests currently running in a single-flight group.", ("group",))
+
+
+def request_fingerprint(*parts: Any) -> str:
+    """
+    Builds a canonical hash of a request.
+
+    Args:
+        *parts: Bytes (e.g. the uploaded image), strings, or JSON-serializable
+            objects (e.g. the profile); dicts are hashed with sorted keys.
+
+    Returns:
+        A hex SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray)):
+            data = bytes(part)
+        elif isinstance(part, str):
+            data = part.encode("utf-8")
+        else:
+            data = json.dumps(part, sort_keys=True, default=str).encode("utf-8")
+        # Length-prefix each part so ("ab", "c") and ("a", "bc") differ.
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time and shares its outcome with concurrent callers."""
+
+    def __init__(self, group: str):
+        self.group = group
+        self._calls: dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        """
+        Runs `fn` unless an identical call is already in flight, in which case waits for it.
+
+        Args:
+            key: The request fingerprint.
+            fn: The work to run when this caller is the leader.
+
+        Returns:
+            The result and whether it was shared from another caller's run.
+
+        Raises:
+            Whatever the leader's `fn` raised, in the leader and in every waiter.
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    SINGLEFLIGHT_IN_FLIGHT.inc(group=self.group)
+            if leader:
+                return self._lead(key, call, fn), False
+
+            SINGLEFLIGHT_CALLS.inc(group=self.group, role="coalesced")
+            call.done.wait()
+            if call.error is None:
+                return call.result, True
+            if isinstance(call.error, Exception):
+                raise call.error
+            # The leader was interrupted by a control-flow BaseException (e.g. its
+            # Streamlit session reran or stopped); that isn't our outcome, so try again.
+
+    def _lead(self, key: str, call: _Call, fn: Callable[[], Any]) -> Any:
+        SINGLEFLIGHT_CALLS.inc(group=self.group, role="leader")
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                SINGLEFLIGHT_IN_FLIGHT.dec(group=self.group)
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+_groups: dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def singleflight(group: str) -> SingleFlight:
+    """Returns the process-wide SingleFlight for a group, shared by every Streamlit session."""
+    with _groups_lock:
+        if group not in _groups:
+            _groups[group] = SingleFlight(group)
+        return _groups[group]
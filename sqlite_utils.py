@@ -0,0 +1,69 @@
+"""
+Shared plumbing for the apps' size-bounded SQLite stores (the stage cache in
+cache_utils and the report store in report_store).
+
+A store is one table keyed by `key` with a `size` and an `accessed_at` column.
+Its file and schema are created on first use, and once the table's sizes add up
+to more than `max_bytes` the least recently accessed rows are evicted.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class SQLiteStore:
+    """
+    Base class of a size-bounded SQLite store.
+
+    Subclasses set `table` and `schema` (the CREATE statements, idempotent) and
+    hold `self._lock` around each `_connect()` so one process never writes the
+    file from two threads at once.
+    """
+
+    table = ""
+    schema = ""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Opens the database, creating it on first use; commits when the block succeeds."""
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.row_factory = sqlite3.Row
+        try:
+            if not self._initialized:
+                conn.executescript(self.schema)
+                self._initialized = True
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _evict_lru(self, conn: sqlite3.Connection) -> int:
+        """
+        Evicts the least recently accessed rows while the table is over `max_bytes`.
+
+        Returns:
+            The number of rows evicted.
+        """
+        total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        # Trim to 90% so every write near the limit doesn't trigger another sweep.
+        target = total - int(self.max_bytes * 0.9)
+        freed, evicted = 0, []
+        for row in conn.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed_at"):
+            if freed >= target:
+                break
+            evicted.append((row["key"],))
+            freed += row["size"]
+        conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", evicted)
+        return len(evicted)
@@ -0,0 +1,22 @@
+"""
+ShalayeAI and ImmiSense served as pages of one multipage app.
+
+    streamlit run streamlit_app.py
+
+Both products then run in one process and share what they import: the pooled
+HTTP transport (http_utils), the response and report caches, the metrics
+server and the theme in .streamlit/config.toml, and the heavy libraries are
+warmed up once for both. `app.py` and `immisense.py` still run on their own.
+
+Each page calls `st.set_page_config` itself, so nothing here may write to the
+page before `run()`. Their session state lives side by side, which is why the
+two apps keep their keys apart (ImmiSense's profile is `visa_profile`).
+"""
+import streamlit as st
+
+pages = [
+    st.Page("app.py", title="ShalayeAI", icon="💊", url_path="shalaye", default=True),
+    st.Page("immisense.py", title="ImmiSense", icon="✈️", url_path="immisense"),
+]
+
+st.navigation(pages).run()
@@ -0,0 +1,14 @@
+"""
+Shared pytest setup: the modules live at the repository root, and every
+on-disk store goes to a temporary directory so tests never touch `.data`.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Read at import time by the stores, so it must be set before any of them is imported.
+os.environ.setdefault("APP_DATA_DIR", tempfile.mkdtemp(prefix="shalaye-tests-"))
+os.environ.setdefault("COLDSTART_DISABLE_WARMUP", "1")
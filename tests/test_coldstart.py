@@ -0,0 +1,26 @@
+"""Cold-start budget: every entry point imports fast and without the heavy libraries."""
+import pytest
+
+from coldstart import COLD_START_BUDGET_SECONDS, ENTRY_POINTS, HEAVY_MODULES, main, profile_entry_point
+
+
+@pytest.mark.parametrize("module", ENTRY_POINTS)
+def test_entry_point_imports_within_budget(module):
+    result = profile_entry_point(module)
+
+    assert result["seconds"] <= COLD_START_BUDGET_SECONDS, (
+        f"import {module} took {result['seconds']:.3f}s (budget {COLD_START_BUDGET_SECONDS:.3f}s); "
+        f"slowest imports: {result['slowest']}")
+    assert not set(result["heavy"]) & set(HEAVY_MODULES), f"{module} imports {result['heavy']} at load"
+
+
+def test_probe_reports_slowest_imports():
+    result = profile_entry_point("coldstart", top=3)
+
+    assert 0 < len(result["slowest"]) <= 3
+    assert all(seconds >= 0 for _, seconds in result["slowest"])
+
+
+def test_main_fails_over_budget(capsys):
+    assert main(["--budget", "0", "coldstart"]) == 1
+    assert "[FAIL] import coldstart" in capsys.readouterr().out
@@ -0,0 +1,67 @@
+"""Deadlines and the tool-call budget in deadline_utils."""
+import time
+
+import pytest
+
+from deadline_utils import (DEADLINE_TIMEOUTS, DeadlineExceeded, TOOL_RESERVE_SECONDS, bounded_tool_call,
+                            check_deadline, deadline, expired, has_time, remaining)
+
+
+def test_nested_deadlines_never_outlast_the_enclosing_one():
+    assert remaining() is None and not expired() and has_time(1e9)
+    with deadline(1.0):
+        with deadline(60.0) as inner:
+            assert inner.remaining() <= 1.0
+        with deadline(None) as same:
+            assert same.remaining() <= 1.0
+        with deadline(0.0):
+            assert expired()
+            with pytest.raises(DeadlineExceeded):
+                check_deadline("test")
+    assert remaining() is None
+
+
+def test_tool_runs_within_its_budget():
+    with deadline(TOOL_RESERVE_SECONDS + 5):
+        assert bounded_tool_call("search", lambda query: f"results for {query}", {"query": "aspartame"}) \
+            == "results for aspartame"
+
+
+def test_late_result_is_kept():
+    def slow_but_done():
+        # Finishes after its own budget ran out, without noticing.
+        time.sleep(0.3)
+        return "paid-for results"
+
+    before = DEADLINE_TIMEOUTS.value(flow="tools", stage="late", outcome="degraded")
+    with deadline(TOOL_RESERVE_SECONDS + 0.1):
+        assert bounded_tool_call("late", slow_but_done, {}) == "paid-for results"
+    assert DEADLINE_TIMEOUTS.value(flow="tools", stage="late", outcome="degraded") == before
+
+
+def test_failure_after_the_budget_returns_a_note():
+    def times_out():
+        time.sleep(0.2)
+        check_deadline("search")
+
+    before = DEADLINE_TIMEOUTS.value(flow="tools", stage="timeout", outcome="degraded")
+    with deadline(TOOL_RESERVE_SECONDS + 0.1):
+        assert bounded_tool_call("timeout", times_out, {}).startswith("Timed out")
+    assert DEADLINE_TIMEOUTS.value(flow="tools", stage="timeout", outcome="degraded") == before + 1
+
+
+def test_failure_within_the_budget_is_raised():
+    def broken():
+        raise ValueError("bad query")
+
+    with deadline(TOOL_RESERVE_SECONDS + 5), pytest.raises(ValueError):
+        bounded_tool_call("broken", broken, {})
+
+
+def test_spent_budget_skips_the_tool():
+    calls = []
+    with deadline(TOOL_RESERVE_SECONDS - 1):
+        note = bounded_tool_call("skipped", lambda: calls.append(1), {})
+
+    assert calls == [] and note.startswith("Not run")
+    assert DEADLINE_TIMEOUTS.value(flow="tools", stage="skipped", outcome="skipped") >= 1
@@ -0,0 +1,204 @@
+"""The pooled HTTP transport, driven against a local stand-in server."""
+import shutil
+import ssl
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from deadline_utils import DeadlineExceeded, deadline
+from http_utils import HTTP_HANDSHAKES, HTTP_HOST_WAIT, HTTP_REQUESTS, PooledTransport
+
+HOST = "127.0.0.1"
+
+
+class StandIn(ThreadingHTTPServer):
+    """Answers every GET with a small body; `/slow` waits for `release` (or `delay` seconds) first."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__((HOST, 0), _Handler)
+        self.connections: set = set()
+        self.requests = 0
+        self.active = self.max_active = 0
+        self.delay = 5.0
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        scheme = "https" if isinstance(self.socket, ssl.SSLSocket) else "http"
+        return f"{scheme}://{HOST}:{self.server_address[1]}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server: StandIn = self.server
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.requests += 1
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            if self.path == "/slow":
+                server.release.wait(server.delay)
+            body = b"ok" * 1000
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve(server: StandIn):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def server():
+    server = _serve(StandIn())
+    yield server
+    server.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def _client(per_host_limit: int = 16, **transport_args) -> httpx.Client:
+    transport = PooledTransport(httpx.HTTPTransport(**transport_args), per_host_limit=per_host_limit)
+    return httpx.Client(transport=transport, timeout=10)
+
+
+def test_connections_are_reused(server):
+    new_before = HTTP_REQUESTS.value(host=HOST, connection="new")
+    reused_before = HTTP_REQUESTS.value(host=HOST, connection="reused")
+
+    with _client() as client:
+        for _ in range(3):
+            assert client.get(server.url + "/").status_code == 200
+
+    assert len(server.connections) == 1
+    assert HTTP_REQUESTS.value(host=HOST, connection="new") == new_before + 1
+    assert HTTP_REQUESTS.value(host=HOST, connection="reused") == reused_before + 2
+
+
+def test_closing_a_client_leaves_the_pool_open(server):
+    transport = PooledTransport(httpx.HTTPTransport())
+    for _ in range(2):
+        with httpx.Client(transport=transport) as client:
+            client.get(server.url + "/")
+
+    assert len(server.connections) == 1
+    transport.shutdown()
+
+
+def test_per_host_limit_is_enforced(server):
+    waits_before = HTTP_HOST_WAIT.count(host=HOST)
+    client = _client(per_host_limit=2)
+    threads = [threading.Thread(target=client.get, args=(server.url + "/slow",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.3)
+
+    # Two requests are at the server, the other two wait for a slot in the pool.
+    assert server.active == 2
+    server.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert server.requests == 4
+    assert server.max_active == 2
+    assert HTTP_HOST_WAIT.count(host=HOST) == waits_before + 4
+    client.close()
+
+
+def test_slot_is_released_when_a_stream_closes(server):
+    client = _client(per_host_limit=1)
+    slot = client._transport._slot(HOST)
+    done = threading.Event()
+
+    with client.stream("GET", server.url + "/") as response:
+        assert response.status_code == 200
+        # The body is unread, so the only slot is still held.
+        waiting = threading.Thread(target=lambda: (client.get(server.url + "/"), done.set()))
+        waiting.start()
+        assert not done.wait(0.3)
+
+    assert done.wait(5)
+    waiting.join(5)
+    # Back to one free slot: every response released what it took.
+    assert slot.acquire(blocking=False)
+    slot.release()
+    client.close()
+
+
+def test_slot_is_released_when_a_request_fails():
+    client = _client(per_host_limit=1)
+    # Nothing listens on port 9 (discard) here.
+    with pytest.raises(httpx.ConnectError):
+        client.get(f"http://{HOST}:9/")
+
+    slot = client._transport._slot(HOST)
+    assert slot.acquire(blocking=False)
+    slot.release()
+    client.close()
+
+
+def test_deadline_caps_the_request_timeouts(server):
+    server.delay = 2.0
+    with _client() as client, deadline(0.3):
+        start = time.perf_counter()
+        with pytest.raises(httpx.ReadTimeout):
+            client.get(server.url + "/slow")
+
+    assert time.perf_counter() - start < 1.0
+
+
+def test_expired_deadline_is_not_sent(server):
+    with _client() as client, deadline(0.01):
+        time.sleep(0.05)
+        with pytest.raises(DeadlineExceeded):
+            client.get(server.url + "/")
+
+    assert server.requests == 0
+
+
+@pytest.fixture
+def tls_server(tmp_path):
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl is needed to make a certificate")
+    cert, key = tmp_path / "cert.pem", tmp_path / "key.pem"
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+                    "-addext", f"subjectAltName=IP:{HOST}", "-keyout", str(key), "-out", str(cert)],
+                   check=True, capture_output=True)
+    server = StandIn()
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    _serve(server)
+    yield server, ssl.create_default_context(cafile=str(cert))
+    server.shutdown()
+    server.server_close()
+
+
+def test_tls_handshakes_are_counted_once_per_connection(tls_server):
+    server, client_context = tls_server
+    before = HTTP_HANDSHAKES.value(host=HOST)
+
+    with _client(verify=client_context) as client:
+        for _ in range(3):
+            assert client.get(server.url + "/").status_code == 200
+
+    assert HTTP_HANDSHAKES.value(host=HOST) == before + 1
+    assert len(server.connections) == 1
@@ -0,0 +1,49 @@
+"""The tolerant JSON parsing in json_utils."""
+import json
+
+import pytest
+from pydantic import BaseModel
+
+from json_utils import load_json_object, parse_model, repair_json
+
+
+class Visa(BaseModel):
+    name: str
+    eligible: bool = False
+
+
+def test_valid_json_is_parsed_as_is():
+    assert load_json_object('Here it is: {"a": 1} Hope that helps.') == ({"a": 1}, False)
+
+
+def test_common_slips_are_repaired():
+    text = '```json\n{"a": [1, 2,], "b": True, "c": None, "d": "two\nlines",}\n```'
+    assert load_json_object(text) == ({"a": [1, 2], "b": True, "c": None, "d": "two\nlines"}, True)
+
+
+def test_truncated_object_is_closed():
+    assert json.loads(repair_json('{"a": {"b": [1, 2')) == {"a": {"b": [1, 2]}}
+    assert json.loads(repair_json('{"a": "unfinished')) == {"a": "unfinished"}
+    assert json.loads(repair_json('{"a":')) == {"a": None}
+
+
+def test_non_ascii_string_values_are_kept():
+    assert load_json_object('{"nationality": "México", "city": "Zürich",}') == (
+        {"nationality": "México", "city": "Zürich"}, True)
+
+
+@pytest.mark.parametrize("text", ['{"nationality": México}', '{"a": ü}', '{"a": Straße, "b": 1}'])
+def test_unquoted_non_ascii_word_is_a_value_error(text):
+    with pytest.raises(ValueError):
+        load_json_object(text)
+
+
+def test_no_object_is_a_value_error():
+    with pytest.raises(ValueError):
+        load_json_object("I couldn't read the label.")
+
+
+def test_parse_model_reports_how_the_answer_was_read():
+    assert parse_model(Visa(name="H-1B"), Visa) == (Visa(name="H-1B"), "schema")
+    assert parse_model('{"name": "O-1", "eligible": true}', Visa) == (Visa(name="O-1", eligible=True), "parsed")
+    assert parse_model('{"name": "O-1", "eligible": True,}', Visa) == (Visa(name="O-1", eligible=True), "repaired")
@@ -0,0 +1,103 @@
+"""The Prometheus endpoint, scraped in-process."""
+import urllib.error
+import urllib.request
+
+import pytest
+
+import metrics_utils
+from metrics_utils import REGISTRY, record_agent_run, record_cache, scrape, start_metrics_server
+
+CALLS = REGISTRY.counter("test_calls_total", "Calls made by the metrics test.", ("kind",))
+IN_FLIGHT = REGISTRY.gauge("test_in_flight", "Work in flight in the metrics test.", ("queue",))
+LATENCY = REGISTRY.histogram("test_latency_seconds", "Latency seen by the metrics test.", ("route",),
+                             buckets=(0.1, 1.0, 10.0))
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = start_metrics_server(port=0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _lines(text: str, prefix: str) -> list[str]:
+    return [line for line in text.splitlines() if line.startswith(prefix)]
+
+
+def test_counter_and_gauge(server):
+    CALLS.inc(kind="search")
+    CALLS.inc(2, kind="search")
+    IN_FLIGHT.set(5, queue="reports")
+    IN_FLIGHT.dec(queue="reports")
+
+    text = scrape(server)
+
+    assert "# HELP test_calls_total Calls made by the metrics test." in text
+    assert "# TYPE test_calls_total counter" in text
+    assert 'test_calls_total{kind="search"} 3' in text
+    assert "# TYPE test_in_flight gauge" in text
+    assert 'test_in_flight{queue="reports"} 4' in text
+
+
+def test_label_values_are_escaped(server):
+    CALLS.inc(kind='a "quoted"\\path\nnext')
+
+    text = scrape(server)
+
+    assert 'test_calls_total{kind="a \\"quoted\\"\\\\path\\nnext"} 1' in text
+    # The raw newline must not split the sample across lines.
+    assert not any(line.startswith("next") for line in text.splitlines())
+
+
+def test_histogram_buckets_are_cumulative(server):
+    for value in (0.05, 0.5, 0.5, 5.0, 50.0):
+        LATENCY.observe(value, route="report")
+
+    text = scrape(server)
+
+    assert "# TYPE test_latency_seconds histogram" in text
+    assert _lines(text, 'test_latency_seconds_bucket{route="report"') == [
+        'test_latency_seconds_bucket{route="report",le="0.1"} 1',
+        'test_latency_seconds_bucket{route="report",le="1"} 3',
+        'test_latency_seconds_bucket{route="report",le="10"} 4',
+        'test_latency_seconds_bucket{route="report",le="+Inf"} 5',
+    ]
+    assert 'test_latency_seconds_sum{route="report"} 56.05' in text
+    assert 'test_latency_seconds_count{route="report"} 5' in text
+
+
+def test_app_metrics_are_exported(server):
+    record_cache("test", hit=True)
+    record_cache("test", hit=False)
+    response = type("Response", (), {"metrics": {"input_tokens": [100, 20], "output_tokens": [30]},
+                                     "tools": [{"tool_name": "search_exa", "metrics": {"time": 0.4}}]})()
+    record_agent_run("shalaye", "test-agent", response, seconds=1.5)
+
+    text = scrape(server)
+
+    assert 'cache_requests_total{cache="test",result="hit"} 1' in text
+    assert 'cache_requests_total{cache="test",result="miss"} 1' in text
+    assert 'agent_tokens_total{app="shalaye",agent="test-agent",direction="input"} 120' in text
+    assert 'agent_tool_calls_total{app="shalaye",agent="test-agent",tool="search_exa",status="ok"} 1' in text
+    assert 'agent_run_seconds_count{app="shalaye",agent="test-agent"} 1' in text
+
+
+def test_unknown_path_is_404(server):
+    host, port = server.server_address[:2]
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(f"http://{host}:{port}/nope", timeout=5)
+    assert error.value.code == 404
+
+
+def test_taken_port_is_logged_once(server, monkeypatch, caplog):
+    monkeypatch.setattr(metrics_utils, "_server", None)
+    monkeypatch.setattr(metrics_utils, "_server_error", None)
+    taken = server.server_address[1]
+
+    # Every Streamlit rerun calls start_metrics_server again.
+    for _ in range(3):
+        assert start_metrics_server(port=taken) is None
+
+    warnings = [record for record in caplog.records if "Metrics server not started" in record.getMessage()]
+    assert len(warnings) == 1
@@ -0,0 +1,103 @@
+"""The stage DAG executor in pipeline_utils."""
+import threading
+import time
+
+import pytest
+
+from cache_utils import StageCache
+from deadline_utils import deadline
+from pipeline_utils import DEGRADED_KEY, REUSED_KEY, PipelineError, Stage, run_pipeline
+
+
+def test_runs_in_dependency_order():
+    stages = [
+        Stage("a", lambda ctx: ctx["x"] + 1, deps=("x",)),
+        Stage("b", lambda ctx: ctx["a"] * 2, deps=("a",)),
+        Stage("c", lambda ctx: ctx["a"] + ctx["b"], deps=("a", "b")),
+    ]
+
+    results = run_pipeline(stages, {"x": 1})
+
+    assert (results["a"], results["b"], results["c"]) == (2, 4, 6)
+    assert results[REUSED_KEY] == [] and results[DEGRADED_KEY] == []
+
+
+def test_independent_stages_run_concurrently():
+    barrier = threading.Barrier(2, timeout=2)
+
+    def meet(ctx):
+        barrier.wait()
+        return True
+
+    results = run_pipeline([Stage("a", meet), Stage("b", meet)], {}, max_workers=2)
+
+    assert results["a"] and results["b"]
+
+
+def test_failure_is_raised_without_waiting_for_running_stages():
+    release = threading.Event()
+    started = []
+
+    def slow(ctx):
+        release.wait(5)
+        return "slow"
+
+    def fail(ctx):
+        time.sleep(0.05)
+        raise ValueError("no profile")
+
+    stages = [
+        Stage("research", slow),
+        Stage("profile", fail),
+        Stage("after", lambda ctx: started.append("after"), deps=("profile",)),
+    ]
+    start = time.perf_counter()
+    with pytest.raises(PipelineError) as error:
+        run_pipeline(stages, {}, max_workers=2)
+    elapsed = time.perf_counter() - start
+    release.set()
+
+    assert error.value.stage == "profile"
+    assert isinstance(error.value.__cause__, ValueError)
+    assert elapsed < 1.0
+    # Stages waiting on the failed one never start.
+    time.sleep(0.1)
+    assert started == []
+
+
+def test_timed_out_stage_returns_its_fallback():
+    def slow(ctx):
+        time.sleep(0.3)
+        raise TimeoutError("too slow")
+
+    stages = [Stage("advice", slow, timeout=0.1, fallback=lambda ctx: "fallback")]
+
+    with deadline(5):
+        results = run_pipeline(stages, {})
+
+    assert results["advice"] == "fallback"
+    assert results[DEGRADED_KEY] == ["advice"]
+
+
+def test_cached_stages_are_reused(tmp_path):
+    cache = StageCache(path=str(tmp_path / "cache.sqlite3"))
+    calls = []
+
+    def research(ctx):
+        calls.append(ctx["item"])
+        return f"notes on {ctx['item']}"
+
+    def stages():
+        return [Stage("research:0", research, deps=("item",), key=lambda ctx: ctx["item"], cache_as="research")]
+
+    first = run_pipeline(stages(), {"item": "sugar"}, cache=cache)
+    second = run_pipeline(stages(), {"item": "sugar"}, cache=cache)
+
+    assert first["research:0"] == second["research:0"] == "notes on sugar"
+    assert calls == ["sugar"]
+    assert second[REUSED_KEY] == ["research:0"]
+
+
+def test_cycles_are_rejected():
+    with pytest.raises(ValueError, match="cycle"):
+        run_pipeline([Stage("a", lambda ctx: 1, deps=("b",)), Stage("b", lambda ctx: 1, deps=("a",))], {})
@@ -0,0 +1,32 @@
+"""The results page regions, timed through ui_render_seconds (see render_bench)."""
+from metrics_utils import RENDER_LATENCY
+from render_bench import REGIONS, bench, results_page
+
+
+def test_results_page_renders_every_region():
+    before = {region: RENDER_LATENCY.count(app="shalaye", region=region) for region in REGIONS}
+    at = results_page()
+
+    assert not at.exception
+    for region in REGIONS:
+        assert RENDER_LATENCY.count(app="shalaye", region=region) == before[region] + 1
+    # Only the most recent chat turns (RECENT_CHAT_ENTRIES) are sent until the earlier ones are asked for.
+    markdown = " ".join(element.value for element in at.markdown)
+    assert "Question 5" in markdown and "Question 1" not in markdown
+
+
+def test_suggestion_click_fills_the_question_box():
+    at = results_page()
+    at.button(key="suggestion_btn_2").click().run()
+
+    assert at.text_area(key="query_input").value == "Explain the long-term effects of consuming this product."
+
+
+def test_chat_rerun_is_timed_and_cheap():
+    before = RENDER_LATENCY.count(app="shalaye", region="chat")
+    result = bench(clicks=5)
+
+    assert RENDER_LATENCY.count(app="shalaye", region="chat") >= before + 5
+    # A chat rerun sends no report or chart, so it is a small share of a full page run; compared
+    # with each other rather than against wall-clock limits, which a loaded machine would break.
+    assert result["regions"]["chat"] < result["regions"]["page"] / 4
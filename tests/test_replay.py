@@ -0,0 +1,88 @@
+"""Recording Gemini and tool calls to a cassette and replaying them offline."""
+from types import SimpleNamespace
+
+import pytest
+from google.genai import types
+
+import replay_utils
+from replay_utils import Cassette, ReplayClient, ReplayMissError
+
+
+@pytest.fixture
+def cassette(tmp_path, monkeypatch):
+    cassette = Cassette(str(tmp_path / "cassette.jsonl"))
+    monkeypatch.setattr(replay_utils, "_cassette", cassette)
+    return cassette
+
+
+def _text_response(text):
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))])
+
+
+def _fake_client(uploads):
+    def upload(file, config=None):
+        uploads.append(config)
+        return types.File(name=config["name"], uri="https://files/" + config["name"], mime_type=config["mime_type"],
+                          state="ACTIVE")
+
+    return SimpleNamespace(
+        models=SimpleNamespace(generate_content=lambda model, contents, config=None: _text_response(f"hi {contents}"),
+                               generate_content_stream=lambda model, contents, config=None: iter(
+                                   [_text_response("a"), _text_response("b")])),
+        files=SimpleNamespace(get=lambda name: types.File(name=name, state="ACTIVE"), upload=upload),
+    )
+
+
+def test_generations_replay_without_the_network(cassette):
+    recorder = ReplayClient(_fake_client([]))
+    recorded = recorder.models.generate_content(model="gemini-2.0-flash", contents="label")
+    streamed = [c.text for c in recorder.models.generate_content_stream(model="gemini-2.0-flash", contents="label")]
+
+    replayer = ReplayClient()
+    assert replayer.models.generate_content(model="gemini-2.0-flash", contents="label").text == recorded.text
+    assert [c.text for c in replayer.models.generate_content_stream(model="gemini-2.0-flash",
+                                                                    contents="label")] == streamed == ["a", "b"]
+    with pytest.raises(ReplayMissError):
+        replayer.models.generate_content(model="gemini-2.0-flash", contents="another label")
+
+
+def test_file_uploads_replay(cassette, tmp_path):
+    audio = tmp_path / "note.mp3"
+    audio.write_bytes(b"ID3 fake audio")
+    config = {"name": "files/note", "display_name": "note", "mime_type": "audio/mp3"}
+    uploads = []
+    recorder = ReplayClient(_fake_client(uploads))
+    uploaded = recorder.files.upload(file=audio, config=config)
+    recorder.files.get(name="files/note")
+
+    replayer = ReplayClient()
+    replayed = replayer.files.upload(file=audio, config=config)
+
+    assert len(uploads) == 1
+    assert replayed.uri == uploaded.uri and replayed.mime_type == "audio/mp3"
+    assert replayer.files.get(name="files/note").name == "files/note"
+    audio.write_bytes(b"different audio")
+    with pytest.raises(ReplayMissError):
+        replayer.files.upload(file=audio, config=config)
+
+
+def test_unrecorded_client_apis_raise_a_replay_miss(cassette):
+    client = ReplayClient()
+
+    with pytest.raises(ReplayMissError, match="caches"):
+        client.caches
+    assert not hasattr(client, "__deepcopy__")
+
+
+def test_tool_calls_replay(cassette, monkeypatch):
+    monkeypatch.setattr(replay_utils, "REPLAY_MODE", "record")
+    hook = replay_utils.tool_hooks()[0]
+    assert hook("search_exa", lambda query: f"results for {query}", {"query": "aspartame"}) == "results for aspartame"
+
+    monkeypatch.setattr(replay_utils, "REPLAY_MODE", "replay")
+
+    def offline(**arguments):
+        raise AssertionError("the tool must not run while replaying")
+
+    assert hook("search_exa", offline, {"query": "aspartame"}) == "results for aspartame"
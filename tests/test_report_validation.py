@@ -0,0 +1,66 @@
+"""
+A report in the INSTRUCTIONS format must validate, or every analysis escalates
+to the top tier for nothing.
+"""
+from types import SimpleNamespace
+
+from routing_utils import SHALAYE_TIERS, route, run_with_escalation
+from shalaye_utils import extract_scores, missing_report_sections
+
+COMPLIANT_REPORT = """\
+📸 Detected: Cola soft drink
+
+## Summary
+A sweetened, caffeinated soft drink.
+
+🔍 Breakdown:
+- Nutritional Value: <span style="color: #FF4500;">[Score 1/5]</span>
+- Ingredient Purity: <span style="color: #FFA500;">[Score 2/5]</span>
+- Allergen Presence: <span style="color: #32CD32;">[Score 5/5]</span>
+- Health Benefits: <span style="color: #FF4500;">[Score 1/5]</span>
+- Environmental Impact: <span style="color: #FFD700;">[Score 3/5]</span>
+
+🚨 High-Risk: Sugar
+⚠️ Moderate Risk: Caffeine, Phosphoric acid
+✅ Low Risk: Carbonated water
+
+## Ingredient Analysis
+### Sugar
+...
+"""
+
+
+def test_extract_scores_reads_the_colored_format():
+    assert extract_scores(COMPLIANT_REPORT) == {
+        "Nutritional Value": 1, "Ingredient Purity": 2, "Allergen Presence": 5,
+        "Health Benefits": 1, "Environmental Impact": 3,
+    }
+
+
+def test_extract_scores_reads_plain_scores():
+    assert extract_scores("- Nutritional Value: 4/5\n* **Ingredient Purity**: 3") == {
+        "Nutritional Value": 4, "Ingredient Purity": 3}
+
+
+def test_compliant_report_validates():
+    assert missing_report_sections(COMPLIANT_REPORT) == []
+
+
+def test_missing_sections_are_reported():
+    content = COMPLIANT_REPORT.replace("📸 Detected: Cola soft drink", "").replace("⚠️ Moderate Risk:", "Moderate:")
+    assert missing_report_sections(content) == ["detected", "moderate_risk"]
+    assert missing_report_sections("") == ["detected", "breakdown", "high_risk", "moderate_risk", "low_risk"]
+
+
+def test_compliant_report_does_not_escalate():
+    decision = route("analysis", 0.0, [])
+    calls = []
+
+    def attempt(model_id):
+        calls.append(model_id)
+        return SimpleNamespace(content=COMPLIANT_REPORT, metrics={})
+
+    run_with_escalation(decision, attempt, lambda r: missing_report_sections(r.content))
+
+    assert calls == [SHALAYE_TIERS[0]]
+    assert decision.escalations == 0
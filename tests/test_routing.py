@@ -0,0 +1,56 @@
+"""Tier escalation in routing_utils."""
+from types import SimpleNamespace
+
+import pytest
+
+from routing_utils import ROUTING_ESCALATION_FAILURES, SHALAYE_TIERS, route, run_with_escalation
+
+
+def _response(content):
+    return SimpleNamespace(content=content, metrics={})
+
+
+def _validate(response):
+    return [] if response.content == "good" else ["incomplete"]
+
+
+def test_escalates_until_valid():
+    decision = route("analysis", 0.0, [])
+    answers = iter(["bad", "good"])
+
+    response = run_with_escalation(decision, lambda model: _response(next(answers)), _validate)
+
+    assert response.content == "good"
+    assert decision.model == SHALAYE_TIERS[1]
+    assert decision.escalations == 1
+
+
+def test_failed_escalation_keeps_the_earlier_response():
+    decision = route("analysis", 0.0, [])
+    calls = []
+
+    def attempt(model):
+        calls.append(model)
+        if len(calls) > 1:
+            raise ConnectionError("quota exceeded")
+        return _response("bad")
+
+    before = ROUTING_ESCALATION_FAILURES.value(flow="analysis", model=SHALAYE_TIERS[1])
+    response = run_with_escalation(decision, attempt, _validate)
+
+    assert response.content == "bad"
+    assert calls == list(SHALAYE_TIERS[:2])
+    assert decision.model == SHALAYE_TIERS[0]
+    assert decision.escalations == 0
+    assert "ConnectionError" in decision.reasons[-1]
+    assert ROUTING_ESCALATION_FAILURES.value(flow="analysis", model=SHALAYE_TIERS[1]) == before + 1
+
+
+def test_failed_first_attempt_raises():
+    decision = route("analysis", 0.0, [])
+
+    def attempt(model):
+        raise TimeoutError("deadline")
+
+    with pytest.raises(TimeoutError):
+        run_with_escalation(decision, attempt, _validate)
@@ -0,0 +1,64 @@
+"""The SQLite-backed stage cache and report store."""
+import time
+
+from cache_utils import CACHE_EVICTIONS, StageCache
+from report_store import ReportStore
+
+
+def test_stage_cache_round_trip(tmp_path):
+    cache = StageCache(path=str(tmp_path / "cache.sqlite3"))
+
+    assert cache.get("k", "profile") == (False, None)
+    cache.put("k", "profile", {"age": 30})
+
+    assert cache.get("k", "profile") == (True, {"age": 30})
+    assert cache.stats()["profile"]["entries"] == 1
+
+
+def test_stage_cache_expires_entries(tmp_path):
+    cache = StageCache(path=str(tmp_path / "cache.sqlite3"), ttl_seconds=0.05)
+    cache.put("k", "profile", "value")
+    time.sleep(0.1)
+
+    assert cache.get("k", "profile") == (False, None)
+
+
+def test_stage_cache_evicts_least_recently_used(tmp_path):
+    cache = StageCache(path=str(tmp_path / "cache.sqlite3"), max_bytes=3000)
+    before = CACHE_EVICTIONS.value(reason="size")
+    for key in ("a", "b", "c"):
+        cache.put(key, "report", "x" * 900)
+        time.sleep(0.01)
+    cache.get("a", "report")
+    time.sleep(0.01)
+    cache.put("d", "report", "x" * 900)
+
+    # "b" was the least recently used once "a" was read again.
+    assert cache.get("b", "report") == (False, None)
+    assert cache.get("a", "report")[0] and cache.get("d", "report")[0]
+    assert CACHE_EVICTIONS.value(reason="size") > before
+
+
+def test_report_store_round_trip_and_listing(tmp_path):
+    store = ReportStore(path=str(tmp_path / "reports.sqlite3"))
+    store.put("r1", "# H-1B", profile={"name": "A"}, kind="assessment", title="H-1B assessment", score=71.5)
+    store.put("r2", "# O-1", profile={"name": "B"}, kind="assessment", title="O-1 assessment")
+
+    report = store.get("r1")
+    assert report["report"] == "# H-1B" and report["score"] == 71.5
+    assert [r["key"] for r in store.list_reports(profile={"name": "A"})] == ["r1"]
+    assert store.get("missing") is None
+
+
+def test_report_store_evicts_least_recently_opened(tmp_path):
+    store = ReportStore(path=str(tmp_path / "reports.sqlite3"), max_bytes=3200)
+    body = "".join(chr(0x4e00 + (i * 7919) % 20000) for i in range(400))  # barely compressible
+    for key in ("a", "b", "c"):
+        store.put(key, body, profile={}, kind="assessment", title=key)
+        time.sleep(0.01)
+    store.get("a")
+    time.sleep(0.01)
+    store.put("d", body, profile={}, kind="assessment", title="d")
+
+    assert store.get("b") is None
+    assert store.get("a") is not None and store.get("d") is not None
@@ -0,0 +1,59 @@
+"""Sampled request traces in trace_utils."""
+import json
+import os
+import time
+
+from pydantic import BaseModel
+
+import trace_utils
+from trace_utils import TRACES, record_agent_span, record_span, trace
+
+PROFILE_PROMPT = "Analyse this label.\n- Allergies: peanuts\n- Medications: warfarin\n- Activity Level: high"
+
+
+class Answer(BaseModel):
+    product: str
+    allergies: str
+
+
+def _stored(trace_id: str, timeout: float = 5.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if os.path.exists(trace_utils.TRACE_PATH):
+            for record in trace_utils.load_traces():
+                if record["trace_id"] == trace_id:
+                    return record
+        time.sleep(0.02)
+    raise AssertionError(f"trace {trace_id} was not written")
+
+
+def test_sampled_out_trace_is_not_redacted(monkeypatch):
+    calls = []
+    monkeypatch.setattr(trace_utils, "TRACE_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(trace_utils, "redact", lambda value: calls.append(value) or value)
+    before = TRACES.value(outcome="sampled_out")
+
+    with trace("shalaye.analysis"):
+        record_span("agent", "ShalayeAI", time.time(), 0.1, input=PROFILE_PROMPT, output="report")
+
+    assert TRACES.value(outcome="sampled_out") == before + 1
+    assert calls == []
+
+
+def test_kept_trace_is_redacted_and_clipped_when_written(monkeypatch):
+    monkeypatch.setattr(trace_utils, "TRACE_SAMPLE_RATE", 1.0)
+    response = type("Response", (), {"content": Answer(product="Cola", allergies="peanuts"), "metrics": {}})()
+
+    with trace("shalaye.analysis", user_profile={"allergies": "peanuts"}) as current:
+        record_agent_span("ShalayeAI", time.time(), 0.1, PROFILE_PROMPT, response, model="gemini-2.0-flash")
+        record_span("stage", "report", time.time(), 0.2, input=None, output="x" * (trace_utils.MAX_FIELD_CHARS + 10))
+        # Until the trace is written its spans hold the raw payloads.
+        assert current.spans[0]["input"] == PROFILE_PROMPT
+
+    record = _stored(current.trace_id)
+    agent, stage = record["spans"]
+    assert "peanuts" not in agent["input"] and "warfarin" not in agent["input"]
+    assert "- Activity Level: high" in agent["input"]
+    assert json.loads(agent["output"]) == {"product": "Cola", "allergies": trace_utils.REDACTED}
+    assert record["attrs"] == {"user_profile": trace_utils.REDACTED}
+    assert stage["output"].endswith("... [10 more chars]")
@@ -0,0 +1,313 @@
+"""
+Sampled, structured traces of agent calls, written off the request path.
+
+Each user-facing request (see `agent_utils.track_request`) opens a trace; every
+agent call and pipeline stage inside it adds a span with its input, output,
+latency, tokens and attempt number. When the request ends the trace is kept if
+it was sampled (TRACE_SAMPLE_RATE), failed, or took longer than
+TRACE_SLOW_SECONDS, then handed to a background thread that appends it to a
+rotating JSONL file. Spans hold their raw input and output until then: the
+personal profile fields are redacted, and long payloads clipped, on the writer
+thread and only for the traces that are kept, so a sampled-out request pays for
+neither.
+
+    python trace_utils.py list --slow 30
+    python trace_utils.py show <trace_id> [--full]
+"""
+import argparse
+import atexit
+import contextvars
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Optional
+
+from metrics_utils import REGISTRY
+
+DATA_DIR = os.getenv("APP_DATA_DIR", ".data")
+TRACE_PATH = os.getenv("TRACE_PATH", os.path.join(DATA_DIR, "traces", "traces.jsonl"))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "60"))
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(5 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "5"))
+TRACE_QUEUE_SIZE = 1000
+MAX_FIELD_CHARS = 4000
+
+# Profile fields of both apps that identify the user or describe their health.
+DEFAULT_REDACT_FIELDS = (
+    "full_name", "age", "nationality", "birth_country", "current_residence", "annual_income_usd",
+    "liquid_assets_usd", "previous_visa_denials", "criminal_history", "current_us_status",
+    "age_range", "gender", "weight_kg", "height_cm", "bmi", "allergies", "health_conditions",
+    "medications", "pregnancy_status", "user_profile",
+)
+REDACT_FIELDS = tuple(
+    field.strip() for field in os.getenv("TRACE_REDACT_FIELDS", ",".join(DEFAULT_REDACT_FIELDS)).split(",") if field.strip()
+)
+# How the prompts spell those fields out as "- Label: value" lines.
+_EXTRA_LABELS = ("Allergies/Intolerances", "Medications/Supplements", "Annual Income (USD)", "Liquid Assets (USD)")
+_LABEL_LINE = re.compile(
+    r"^(\s*-\s*(?:%s)\s*:)[^\n]*" % "|".join(
+        sorted({re.escape(f.replace("_", " ")) for f in REDACT_FIELDS} | {re.escape(l) for l in _EXTRA_LABELS},
+               key=len, reverse=True)),
+    re.IGNORECASE | re.MULTILINE,
+)
+REDACTED = "[redacted]"
+
+TRACES = REGISTRY.counter(
+    "traces_total", "Finished request traces, by outcome (kept/sampled_out/dropped).", ("outcome",))
+
+_current: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+
+
+def redact(value: Any) -> Any:
+    """
+    Masks the personal profile fields in a span payload.
+
+    Dicts and lists are walked by key; strings that hold JSON are redacted as
+    JSON, and other strings have their "- Label: value" profile lines masked.
+    """
+    if isinstance(value, dict):
+        return {k: REDACTED if str(k).lower() in REDACT_FIELDS else redact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        stripped = value.strip()
+        if stripped[:1] in "{[":
+            try:
+                return json.dumps(redact(json.loads(stripped)), ensure_ascii=False)
+            except ValueError:
+                pass
+        return _LABEL_LINE.sub(lambda m: f"{m.group(1)} {REDACTED}", value)
+    return value
+
+
+def _clip(value: Any) -> Any:
+    if value is None or isinstance(value, (int, float, bool)):
+        return value
+    text = value if isinstance(value, str) else json.dumps(value, default=str, ensure_ascii=False)
+    return text if len(text) <= MAX_FIELD_CHARS else text[:MAX_FIELD_CHARS] + f"... [{len(text) - MAX_FIELD_CHARS} more chars]"
+
+
+class Trace:
+    """The spans of one request; shared by every thread working on it."""
+
+    def __init__(self, name: str, attrs: dict):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self.spans: list[dict] = []
+        self._attempts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, kind: str, name: str, start: float, seconds: float, **fields) -> None:
+        with self._lock:
+            attempt = self._attempts[name] = self._attempts.get(name, 0) + 1
+            self.spans.append({
+                "kind": kind,
+                "name": name,
+                "offset_s": round(start - self.start, 3),
+                "seconds": round(seconds, 3),
+                "attempt": attempt,
+                **fields,
+            })
+
+
+@contextmanager
+def trace(name: str, **attrs):
+    """
+    Opens a trace for one request; spans recorded inside it (on any thread that
+    inherited this context) are attached to it.
+
+    Args:
+        name: The request's name, e.g. "immisense.assessment".
+        **attrs: Extra attributes stored with the trace.
+    """
+    current = Trace(name, attrs)
+    token = _current.set(current)
+    error = None
+    try:
+        yield current
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        _current.reset(token)
+        _finish(current, error)
+
+
+def record_span(kind: str, name: str, start: float, seconds: float, *, input: Any = None, output: Any = None,
+                **fields) -> None:
+    """
+    Adds a span to the current trace, if any.
+
+    Args:
+        kind: "agent" or "stage".
+        name: The agent or stage name.
+        start: `time.time()` when the call started.
+        seconds: Its duration.
+        input: The message sent; redacted and truncated if the trace is kept.
+        output: The response content; redacted and truncated if the trace is kept.
+        **fields: Small extras such as model, tokens or error.
+    """
+    current = _current.get()
+    if current is None:
+        return
+    current.add_span(kind, name, start, seconds, input=input, output=output, **fields)
+
+
+def record_agent_span(name: str, start: float, seconds: float, message: Any, response: Any = None, *,
+                      model: Optional[str] = None, error: Optional[BaseException] = None, **fields) -> None:
+    """Adds a span for one agent run, taking the output and token counts from its RunResponse."""
+    if _current.get() is None:
+        return
+    metrics = getattr(response, "metrics", None) or {}
+    tokens = {direction: sum(metrics.get(f"{direction}_tokens") or [0])
+              for direction in ("input", "output", "cached")}
+    record_span("agent", name, start, seconds, input=message, output=getattr(response, "content", None),
+                model=model, tokens=tokens, error=repr(error) if error is not None else None, **fields)
+
+
+def _finish(current: Trace, error: Optional[BaseException]) -> None:
+    if not current.spans:
+        return
+    seconds = time.time() - current.start
+    keep = error is not None or seconds >= TRACE_SLOW_SECONDS or random.random() < TRACE_SAMPLE_RATE
+    if not keep:
+        TRACES.inc(outcome="sampled_out")
+        return
+    record = {
+        "trace_id": current.trace_id,
+        "name": current.name,
+        "started_at": round(current.start, 3),
+        "seconds": round(seconds, 3),
+        "error": repr(error) if error is not None else None,
+        "attrs": current.attrs,
+        "spans": sorted(current.spans, key=lambda span: span["offset_s"]),
+    }
+    try:
+        _writer().put_nowait(logging.makeLogRecord({"trace": record}))
+    except queue.Full:
+        # Never block a request on tracing.
+        TRACES.inc(outcome="dropped")
+        return
+    TRACES.inc(outcome="kept")
+
+
+def _payload(value: Any) -> Any:
+    if hasattr(value, "model_dump"):
+        # A response_model instance; dump it so its fields can be redacted.
+        value = value.model_dump(mode="json")
+    return _clip(redact(value))
+
+
+class _TraceFormatter(logging.Formatter):
+    """Redacts, clips and serializes a kept trace; runs on the writer thread."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        trace = record.trace
+        spans = [{**span, "input": _payload(span["input"]), "output": _payload(span["output"])}
+                 for span in trace["spans"]]
+        return json.dumps({**trace, "attrs": redact(trace["attrs"]), "spans": spans}, default=str, ensure_ascii=False)
+
+
+_queue: Optional[queue.Queue] = None
+_queue_lock = threading.Lock()
+
+
+def _writer() -> queue.Queue:
+    """Starts the background JSONL writer on first use and returns its queue."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            os.makedirs(os.path.dirname(TRACE_PATH) or ".", exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                TRACE_PATH, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUPS, encoding="utf-8")
+            handler.setFormatter(_TraceFormatter())
+            _queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+            listener = logging.handlers.QueueListener(_queue, handler)
+            listener.start()
+            # Flush what is still queued when the server shuts down.
+            atexit.register(listener.stop)
+    return _queue
+
+
+def load_traces(path: str = TRACE_PATH) -> list[dict]:
+    """Reads every stored trace, oldest first (rotated files are path.N ... path.1, then path)."""
+    backups = sorted((p for p in glob.glob(f"{path}.*") if p.rsplit(".", 1)[1].isdigit()),
+                     key=lambda p: int(p.rsplit(".", 1)[1]), reverse=True)
+    traces = []
+    for file in backups + [path]:
+        if not os.path.exists(file):
+            continue
+        with open(file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    traces.append(json.loads(line))
+                except ValueError:
+                    continue
+    return traces
+
+
+def format_trace(record: dict, full: bool = False) -> str:
+    """Renders a trace as a waterfall of its spans."""
+    lines = [f"{record['trace_id']}  {record['name']}  {record['seconds']:.2f}s"
+             f"{'  ERROR ' + record['error'] if record.get('error') else ''}"]
+    total = max(record["seconds"], 1e-6)
+    for span in record["spans"]:
+        left = int(40 * span["offset_s"] / total)
+        width = max(1, int(40 * span["seconds"] / total))
+        bar = " " * left + "#" * min(width, 40 - left)
+        tokens = span.get("tokens") or {}
+        extras = " ".join(f"{k}={v}" for k, v in (("model", span.get("model")), ("in", tokens.get("input")),
+                                                   ("out", tokens.get("output")), ("error", span.get("error"))) if v)
+        attempt = f" #{span['attempt']}" if span["attempt"] > 1 else ""
+        lines.append(f"  {span['kind']:<5} {span['name'] + attempt:<22} |{bar:<40}| {span['seconds']:>7.2f}s  {extras}".rstrip())
+        if full:
+            for label in ("input", "output"):
+                if span.get(label) is not None:
+                    body = str(span[label]).replace("\n", "\n        ")
+                    lines.append(f"      {label}: {body}")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect the stored agent traces.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    list_cmd = sub.add_parser("list", help="List traces, newest first.")
+    list_cmd.add_argument("--slow", type=float, default=0.0, help="Only traces at least this many seconds long.")
+    list_cmd.add_argument("--name", help="Only traces with this name, e.g. immisense.assessment.")
+    list_cmd.add_argument("--limit", type=int, default=20)
+    show = sub.add_parser("show", help="Replay one trace as a span waterfall.")
+    show.add_argument("trace_id", help="A trace id or a unique prefix of one.")
+    show.add_argument("--full", action="store_true", help="Also print each span's input and output.")
+    args = parser.parse_args(argv)
+
+    traces = load_traces()
+    if args.command == "list":
+        selected = [t for t in traces if t["seconds"] >= args.slow and (not args.name or t["name"] == args.name)]
+        for record in sorted(selected, key=lambda t: t["started_at"], reverse=True)[:args.limit]:
+            started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record["started_at"]))
+            print(f"{record['trace_id']}  {started}  {record['seconds']:>8.2f}s  {len(record['spans']):>3} spans  "
+                  f"{record['name']}{'  ERROR' if record.get('error') else ''}")
+        return 0
+
+    matches = [t for t in traces if t["trace_id"].startswith(args.trace_id)]
+    if len(matches) != 1:
+        print(f"{len(matches)} traces match '{args.trace_id}'")
+        return 1
+    print(format_trace(matches[0], full=args.full))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,206 @@
+"""
+Local index of U.S. visa requirements, one entry per category in VISA_DESCRIPTIONS.
+
+Requirements change rarely, so instead of searching uscis.gov and
+travel.state.gov on every assessment, the pipeline reads them from this index.
+Entries are filled by a refresh job and carry their sources and fetch time:
+
+    python visa_index.py refresh              # every missing or stale category
+    python visa_index.py refresh --all        # every category
+    python visa_index.py refresh H-1B O-1     # just these
+    python visa_index.py show
+
+An entry older than VISA_INDEX_TTL_DAYS is still served, and a background
+refresh is started for it; only a category with no entry at all is researched
+live during an assessment.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from metrics_utils import REGISTRY, record_cache
+from visa_utils import VISA_DESCRIPTIONS
+
+DATA_DIR = os.getenv("APP_DATA_DIR", ".data")
+VISA_INDEX_PATH = os.getenv("VISA_INDEX_PATH", os.path.join(DATA_DIR, "visa_index.json"))
+VISA_INDEX_TTL_DAYS = float(os.getenv("VISA_INDEX_TTL_DAYS", "30"))
+
+# Bump when the entry shape changes; an index with another version is ignored.
+INDEX_VERSION = 1
+
+INDEX_REFRESHES = REGISTRY.counter(
+    "visa_index_refreshes_total", "Visa index entries refreshed, by trigger and result.", ("trigger", "result"))
+
+_lock = threading.Lock()
+_refreshing: set[str] = set()
+
+
+def _load() -> dict:
+    try:
+        with open(VISA_INDEX_PATH, encoding="utf-8") as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if index.get("version") != INDEX_VERSION:
+        return {}
+    return index.get("entries", {})
+
+
+def _save(entries: dict) -> None:
+    os.makedirs(os.path.dirname(VISA_INDEX_PATH) or ".", exist_ok=True)
+    tmp_path = f"{VISA_INDEX_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": INDEX_VERSION, "entries": entries}, f, indent=2, sort_keys=True)
+    # Atomic so a reader never sees a half-written index.
+    os.replace(tmp_path, VISA_INDEX_PATH)
+
+
+def is_stale(entry: dict, ttl_days: float = VISA_INDEX_TTL_DAYS) -> bool:
+    """Whether an entry's fetched_at is older than the TTL."""
+    fetched_at = datetime.fromisoformat(entry["fetched_at"])
+    return (datetime.now(timezone.utc) - fetched_at).total_seconds() > ttl_days * 86400
+
+
+def get_entry(visa_category: str) -> Optional[dict]:
+    """
+    Reads one category from the index.
+
+    Returns:
+        The entry ({'visa_category', 'requirements', 'sources', 'fetched_at',
+        'revision'}) or None if the category hasn't been fetched.
+    """
+    return _load().get(visa_category)
+
+
+def put_entry(visa_category: str, requirements: list, sources: list) -> dict:
+    """
+    Stores freshly fetched requirements, bumping the entry's revision.
+
+    Returns:
+        The stored entry.
+    """
+    with _lock:
+        entries = _load()
+        previous = entries.get(visa_category, {})
+        entry = {
+            "visa_category": visa_category,
+            "requirements": requirements,
+            "sources": sources,
+            "fetched_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": previous.get("revision", 0) + 1,
+        }
+        entries[visa_category] = entry
+        _save(entries)
+    return entry
+
+
+def fetch_requirements(visa_category: str) -> dict:
+    """
+    Researches one category with the VisaResearcher agent and stores the result.
+
+    Returns:
+        The stored entry.
+    """
+    from visa_pipeline import VisaRequirements, build_agents
+    from agent_utils import run_structured
+
+    researcher = build_agents()["VisaResearcher"]
+    result = run_structured(researcher, f"Visa category: {visa_category}", VisaRequirements, app="immisense",
+                            agent_name="VisaIndexRefresh")
+    return put_entry(visa_category, result.visa_requirements, result.sources)
+
+
+def refresh(visa_category: str, trigger: str = "manual") -> Optional[dict]:
+    """Refreshes one category, logging and counting failures instead of raising."""
+    try:
+        entry = fetch_requirements(visa_category)
+    except Exception as e:
+        INDEX_REFRESHES.inc(trigger=trigger, result="error")
+        print(f"Failed to refresh visa index entry for {visa_category}: {e}")
+        return None
+    INDEX_REFRESHES.inc(trigger=trigger, result="ok")
+    return entry
+
+
+def refresh_in_background(visa_category: str) -> bool:
+    """
+    Starts a refresh of one category on a daemon thread unless one is already running.
+
+    Returns:
+        True if this call started the refresh.
+    """
+    with _lock:
+        if visa_category in _refreshing:
+            return False
+        _refreshing.add(visa_category)
+
+    def worker():
+        try:
+            refresh(visa_category, trigger="ttl")
+        finally:
+            with _lock:
+                _refreshing.discard(visa_category)
+
+    threading.Thread(target=worker, name=f"visa-index-{visa_category}", daemon=True).start()
+    return True
+
+
+def lookup(visa_category: str) -> Optional[dict]:
+    """
+    Reads a category for an assessment, scheduling a background refresh when it is stale.
+
+    Returns:
+        The entry, or None when the category must be researched live.
+    """
+    entry = get_entry(visa_category)
+    record_cache("visa_index", hit=entry is not None)
+    if entry is not None and is_stale(entry):
+        refresh_in_background(visa_category)
+    return entry
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Maintain the local visa requirements index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    refresh_cmd = sub.add_parser("refresh", help="Fetch requirements for missing or stale categories.")
+    refresh_cmd.add_argument("categories", nargs="*", help="Categories to refresh (default: missing or stale ones).")
+    refresh_cmd.add_argument("--all", action="store_true", help="Refresh every category, even fresh ones.")
+    sub.add_parser("show", help="List the indexed categories with their age and sources.")
+    args = parser.parse_args(argv)
+
+    entries = _load()
+    if args.command == "show":
+        for category in VISA_DESCRIPTIONS:
+            entry = entries.get(category)
+            if entry is None:
+                print(f"{category:<10} missing")
+                continue
+            state = "stale" if is_stale(entry) else "fresh"
+            print(f"{category:<10} {state:<6} rev {entry['revision']:<3} {entry['fetched_at']}  "
+                  f"{len(entry['requirements'])} requirements, sources: {', '.join(entry['sources']) or '-'}")
+        return 0
+
+    unknown = [category for category in args.categories if category not in VISA_DESCRIPTIONS]
+    if unknown:
+        parser.error(f"unknown visa categories: {', '.join(unknown)}")
+    categories = args.categories or [
+        category for category in VISA_DESCRIPTIONS
+        if args.all or category not in entries or is_stale(entries[category])
+    ]
+    failed = 0
+    for category in categories:
+        start = time.perf_counter()
+        entry = refresh(category)
+        if entry is None:
+            failed += 1
+            continue
+        print(f"{category}: {len(entry['requirements'])} requirements (rev {entry['revision']}, {time.perf_counter() - start:.1f}s)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,626 @@
+"""
+The ImmiSense assessment pipeline: the profile and the visa requirements are
+prepared concurrently, then scoring, RecommendationAgent and ReportGenerator
+run in order. Each stage has a typed input and output.
+
+The profile stage is local for structured profiles from the Profile page and
+only calls ProfileParser for free-text ones. Requirements come from the local
+visa index (visa_index.py); VisaResearcher only runs for a category that has
+never been indexed. Scoring is rule-based (eligibility_utils.py), with
+AnswerAssessor rating only the free-text answers.
+
+Each agent stage declares the fields of earlier outputs it reads and sends
+only those, as minified JSON; the same selection is its stage cache key.
+Agents that answer in JSON do so against the stage's output model: enforced by
+Gemini's structured output where the agent has no tools, and otherwise read
+with the local repair parser (json_utils.py).
+
+Every run has an overall deadline and the agent stages their own timeouts
+within it. A stage that runs out of time falls back to what can be built
+locally: no requirements or answer ratings, recommendations read off the score
+breakdown (without alternative pathways) and a report assembled from the
+stage outputs. Only the profile stage has no fallback.
+"""
+import os
+import re
+from typing import Any, Callable, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+import visa_index
+from agent_utils import run_structured, stream_agent
+from deadline_utils import bounded_tool_call, deadline
+from eligibility_utils import FEATURE_LABELS, blend_scores, rank_visas, score_breakdown, score_profiles
+from metrics_utils import REGISTRY
+from cache_utils import stage_cache
+from replay_utils import tool_hooks, wrap_model
+from pipeline_utils import INPUTS_KEY, Stage, compact_json, publish, run_pipeline
+from singleflight_utils import request_fingerprint
+from visa_utils import missing_assessment_sections
+
+WORKER_MODEL = "gemini-2.5-flash"
+REPORT_MODEL = "gemini-2.5-pro"
+
+# Part of every stage cache key; bump when prompts, agents or stage logic change
+# so outputs from the old pipeline are not reused.
+PIPELINE_VERSION = "2026.10.3"
+
+# Concurrent stages in the compare-all-visas mode; bounds parallel research calls.
+COMPARISON_WORKERS = int(os.getenv("COMPARISON_WORKERS", "6"))
+
+# Time budget of one assessment or comparison, end to end.
+IMMISENSE_DEADLINE_SECONDS = float(os.getenv("IMMISENSE_DEADLINE_SECONDS", "180"))
+# Most an agent stage may take of it; the report stage gets whatever is left.
+STAGE_TIMEOUTS = {"profile": 45.0, "requirements": 60.0, "answers": 45.0, "recommendations": 45.0}
+
+# Form placeholders that mean "not provided".
+EMPTY_VALUES = ("", "n/a", "na", "none", "null", "select...")
+
+# Keys saved by the Profile page; a profile with all of them is normalized locally.
+PROFILE_FORM_FIELDS = (
+    "full_name", "age", "language_proficiency", "highest_degree", "field_of_study", "years_of_experience",
+    "annual_income_usd", "liquid_assets_usd", "sponsorship_status", "nationality", "birth_country",
+    "previous_visa_denials", "current_residence", "current_us_status", "criminal_history",
+)
+
+# What RecommendationAgent sees of the profile; the applicant's name doesn't
+# change the advice, so leaving it out also keeps renamed profiles cached.
+ADVICE_PROFILE_FIELDS = tuple(field for field in PROFILE_FORM_FIELDS if field != "full_name")
+
+PROFILE_NORMALIZATIONS = REGISTRY.counter(
+    "profile_normalizations_total", "Assessment profiles normalized, by source (local/llm).", ("source",))
+
+
+# --- Stage outputs ---
+
+class ParsedProfile(BaseModel):
+    """
+    The applicant profile as the downstream agents see it.
+
+    Built locally from the Profile page form; the ProfileParser agent only fills
+    it in when the profile isn't structured. Extra keys the agent extracts are kept.
+    """
+
+    model_config = ConfigDict(extra="allow")
+
+    full_name: Optional[str] = None
+    age: Optional[int] = Field(None, ge=0, le=120)
+    nationality: Optional[str] = None
+    visa_category: Optional[str] = None
+    language_proficiency: list[str] = Field(default_factory=list)
+    highest_degree: Optional[str] = None
+    field_of_study: Optional[str] = None
+    years_of_experience: Optional[int] = Field(None, ge=0)
+    annual_income_usd: Optional[int] = Field(None, ge=0)
+    liquid_assets_usd: Optional[int] = Field(None, ge=0)
+    sponsorship_status: Optional[str] = None
+    birth_country: Optional[str] = None
+    previous_visa_denials: Optional[bool] = None
+    current_residence: Optional[str] = None
+    current_us_status: Optional[str] = None
+    criminal_history: Optional[bool] = None
+
+    @field_validator("full_name", "nationality", "visa_category", "highest_degree", "field_of_study",
+                     "sponsorship_status", "birth_country", "current_residence", "current_us_status",
+                     mode="before")
+    @classmethod
+    def _blank_to_none(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            value = value.strip()
+            if value.lower() in EMPTY_VALUES:
+                return None
+        return value
+
+    @field_validator("language_proficiency", mode="before")
+    @classmethod
+    def _split_languages(cls, value: Any) -> Any:
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [part.strip() for part in re.split(r"[,;/]", value) if part.strip()]
+        return value
+
+    @field_validator("previous_visa_denials", "criminal_history", mode="before")
+    @classmethod
+    def _yes_no(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            answer = value.strip().lower()
+            if answer in EMPTY_VALUES:
+                return None
+            return answer in ("yes", "y", "true")
+        return value
+
+
+class ProfileExtraction(ParsedProfile):
+    """ProfileParser's response schema; Gemini's structured output can't express open-ended keys."""
+
+    model_config = ConfigDict(extra="ignore")
+
+    other_details: list[str] = Field(default_factory=list)
+
+
+class VisaRequirements(BaseModel):
+    visa_requirements: list[Any] = Field(default_factory=list)
+    sources: list[str] = Field(default_factory=list)
+
+
+class AnswerRatings(BaseModel):
+    answer_scores: list[float] = Field(default_factory=list)
+    notes: list[str] = Field(default_factory=list)
+
+
+class AnswerAssessment(BaseModel):
+    """Mean rating of the free-text answers (0-100), None when the visa has no questions."""
+
+    answer_score: Optional[float] = None
+    notes: list[str] = Field(default_factory=list)
+
+
+class ScoringResult(BaseModel):
+    overall_score: float
+    score_breakdown: dict[str, Any] = Field(default_factory=dict)
+
+
+class Recommendations(BaseModel):
+    summary: str = ""
+    key_considerations: list[str] = Field(default_factory=list)
+    actionable_steps: list[str] = Field(default_factory=list)
+    alternative_pathways: list[str] = Field(default_factory=list)
+
+
+class AssessmentRequest(BaseModel):
+    """Pipeline input, straight from the Profile and Assessment pages."""
+
+    profile: Union[dict, str]
+    visa_category: str
+    answers: dict[str, str] = Field(default_factory=dict)
+
+
+class VisaRanking(BaseModel):
+    visa_category: str
+    score: float
+    gaps: list[str] = Field(default_factory=list)
+
+
+class ComparisonResult(BaseModel):
+    rankings: list[VisaRanking]
+
+
+class ComparisonRequest(BaseModel):
+    """Input of the compare-all-visas mode: one profile against every visa of a goal."""
+
+    profile: Union[dict, str]
+    goal: str
+    visa_categories: list[str]
+
+
+# --- Agents ---
+
+def build_agents(report_model: str = REPORT_MODEL, worker_model: str = WORKER_MODEL) -> dict:
+    """
+    Creates the five pipeline agents.
+
+    Agents keep per-run state, so a fresh set is built for every assessment
+    rather than sharing one between concurrent sessions.
+
+    Args:
+        report_model: Gemini model for the ReportGenerator (chosen by the router).
+        worker_model: Gemini model for the other agents.
+
+    Returns:
+        Agent name -> agno Agent.
+    """
+    from agno.agent import Agent
+    from agno.models.google import Gemini
+    from agno.tools.exa import ExaTools
+    from http_utils import gemini_client_params, pool_exa
+
+    google_api_key = os.getenv("GOOGLE_API_KEY")
+    worker_llm = wrap_model(Gemini(id=worker_model, api_key=google_api_key, client_params=gemini_client_params()))
+    report_llm = wrap_model(Gemini(id=report_model, api_key=google_api_key, client_params=gemini_client_params()))
+    exa_tools_instance = pool_exa(ExaTools(api_key=os.getenv("EXA_API_KEY")))
+
+    ProfileParser = Agent(name="ProfileParser",
+                          model=worker_llm,
+                          role="User Profile JSON Extractor",
+                          instructions=
+                          ["Your sole responsibility is to read the user's query and extract key information.",
+                           "Fill in every profile field you can find; put other relevant profile details in 'other_details'.",
+                           "If a value is not found, use `null`."
+                           ],
+                           response_model=ProfileExtraction,
+                           retries=2,)
+
+    # Gemini can't combine tool calls with structured output, so this one is
+    # asked for JSON in the prompt and read with the repair parser.
+    VisaResearcher = Agent(name="VisaResearcher",
+                           model=worker_llm,
+                           tools=[exa_tools_instance],
+                           tool_hooks=[bounded_tool_call, *(tool_hooks() or [])],
+                           role="Visa Requirements Specialist",
+                           instructions=[
+                               "You will be given a specific U.S. visa category (e.g., 'H-1B').",
+                               "Your only task is to use the search tool to find the primary eligibility requirements from official U.S. government sources (uscis.gov, travel.state.gov).",
+                               "You MUST output the requirements as a single, valid JSON object with two keys: 'visa_requirements', which holds a list of the requirements, and 'sources', a list of the URLs you used.",
+                               "Your entire response MUST be only the JSON object."
+                               ],
+                               retries=2,
+                               )
+
+    AnswerAssessor = Agent(name="AnswerAssessor",
+                           model=worker_llm,
+                           role="Assessment Answer Rater",
+                           instructions=["You will receive a JSON object containing 'visa_category', its 'requirements' and 'answers', a list of question/answer pairs written by the applicant.",
+                                         "Rate how strongly each answer shows that the applicant meets the requirements, from 0 (no support or a disqualifying fact) to 100 (fully meets them).",
+                                         "Give 'answer_scores' (one number per answer, in the same order) and 'notes' (a list of short observations)."],
+                                         response_model=AnswerRatings,
+                                         retries=2,
+                                         )
+
+    RecommendationAgent = Agent(name="RecommendationAgent",
+                            model=worker_llm,
+                            role="Strategic Immigration Advisor",
+                            instructions=["You will receive a JSON object containing the applicant's 'profile', the visa's 'requirements', and 'scoring' (the overall score and its breakdown, including notes on the applicant's written answers).",
+                                          "Your task is to provide expert strategic advice based on this data.",
+                                          "Analyze the score breakdown to identify the strongest and weakest points of the user's case.",
+                                          "Give a 'summary' (a brief overview), 'key_considerations' (strengths and weaknesses), 'actionable_steps' (concrete next steps), and 'alternative_pathways' (other potential visa options, if any)."],
+                                          response_model=Recommendations,
+                                          retries=2,
+                                         )
+
+    ReportGenerator = Agent(name="ReportGenerator",
+                            model=report_llm, role="Final Report Compiler",
+                            instructions=["Your role is to act as a compiler. You will receive a single JSON object containing all assessment data: 'profile', 'requirements', 'scoring', and now 'recommendations'.",
+                                          "Your final task is to synthesize all this structured information into a single, comprehensive, and well-structured user-facing report in Markdown format.",
+                                          "The report must be written from the perspective of 'ImmiSense' and MUST include distinct sections for: Applicant Profile, Eligibility Assessment, and Strategic Recommendations.",
+                                          "Use the data from the 'recommendations' JSON to populate the final section of the report."],
+                                          markdown=True,
+                                          retries=2,
+                                          )
+
+    ComparisonWriter = Agent(name="ComparisonWriter",
+                             model=report_llm, role="Visa Pathway Comparison Writer",
+                             instructions=["You will receive a JSON object with the applicant's 'profile', their 'goal', a 'scoring' ranking of U.S. visa categories scored against the profile (best first, with the unmet criteria as 'gaps'), and each visa's requirements under 'requirements:<visa>'.",
+                                           "Write the narrative part of an ImmiSense comparison report in Markdown, starting at a '## Recommended Pathways' heading; a ranking table is already shown above it.",
+                                           "Recommend the one to three most promising visas and explain why, say what holds back the lower-ranked ones, and list concrete next steps for the top choice.",
+                                           "Do not change the scores or the order of the ranking."],
+                                           markdown=True,
+                                           retries=2,
+                                           )
+
+    return {agent.name: agent for agent in
+            (ProfileParser, VisaResearcher, AnswerAssessor, RecommendationAgent, ReportGenerator, ComparisonWriter)}
+
+
+# --- Stages ---
+
+def normalize_profile(profile: Any, visa_category: Optional[str]) -> Optional[ParsedProfile]:
+    """
+    Builds the ParsedProfile straight from the Profile page's form data.
+
+    Args:
+        profile: The saved profile from `st.session_state.visa_profile`.
+        visa_category: The visa being assessed (None when comparing several).
+
+    Returns:
+        The normalized profile, or None if the profile isn't the structured form
+        data (e.g. free text), in which case the ProfileParser agent is needed.
+    """
+    if not isinstance(profile, dict) or not all(key in profile for key in PROFILE_FORM_FIELDS):
+        return None
+    try:
+        return ParsedProfile.model_validate({**profile, "visa_category": visa_category})
+    except ValidationError:
+        return None
+
+
+def _memo(*inputs: Any) -> list:
+    """A stage cache key: the inputs a stage reads plus the pipeline version."""
+    return [PIPELINE_VERSION, *inputs]
+
+
+def _call(agents: dict, agent_name: str, message: str, output_model: type[BaseModel]) -> Any:
+    return run_structured(agents[agent_name], message, output_model, app="immisense")
+
+
+def _prepare_profile(agents: dict, request: AssessmentRequest, visa_category: Optional[str]) -> ParsedProfile:
+    profile = normalize_profile(request.profile, visa_category)
+    if profile is not None:
+        PROFILE_NORMALIZATIONS.inc(source="local")
+        return profile
+    PROFILE_NORMALIZATIONS.inc(source="llm")
+    profile = _call(agents, "ProfileParser", _profile_query(request), ProfileExtraction)
+    profile.visa_category = visa_category
+    return profile
+
+
+def _load_requirements(agents: dict, visa_category: str) -> VisaRequirements:
+    entry = visa_index.lookup(visa_category)
+    if entry is not None:
+        return VisaRequirements(visa_requirements=entry["requirements"], sources=entry["sources"])
+    # Not indexed yet: research it now and keep the result for later assessments.
+    requirements = _call(agents, "VisaResearcher", f"Visa category: {visa_category}", VisaRequirements)
+    visa_index.put_entry(visa_category, requirements.visa_requirements, requirements.sources)
+    return requirements
+
+
+def _profile_query(request: AssessmentRequest) -> str:
+    if isinstance(request.profile, dict):
+        profile_details = "\n".join([f"- {k.replace('_', ' ').title()}: {v}" for k, v in request.profile.items()])
+    else:
+        profile_details = request.profile
+    answer_details = "\n".join([f"- Question: {q}\n- Answer: {a}" for q, a in request.answers.items()])
+    return f"## User Profile:\n{profile_details}\n\n## Assessment for Visa Category: {request.visa_category}\n{answer_details}"
+
+
+def _fallback_requirements(ctx: dict) -> VisaRequirements:
+    # Scoring works from the local criteria; the report just lists no requirements.
+    return VisaRequirements()
+
+
+def _fallback_answers(ctx: dict) -> AnswerAssessment:
+    # An unrated answer leaves the overall score to the profile alone.
+    return AnswerAssessment()
+
+
+def _fallback_recommendations(ctx: dict) -> Recommendations:
+    """Advice read off the score breakdown, for when RecommendationAgent runs out of time."""
+    scoring: ScoringResult = ctx["scoring"]
+    criteria = scoring.score_breakdown.get("criteria", {})
+    met = [FEATURE_LABELS.get(name, name) for name, score in criteria.items() if score >= 100]
+    gaps = sorted((score, FEATURE_LABELS.get(name, name)) for name, score in criteria.items() if score < 100)
+    return Recommendations(
+        summary=f"Your profile scores {scoring.overall_score:.0f}/100 for the {ctx['request'].visa_category} visa. "
+                "Detailed advice wasn't ready in time, so this summary is based on the score breakdown alone.",
+        key_considerations=[f"Strength: {label}" for label in met]
+                           + [f"Gap: {label} ({score:.0f}/100)" for score, label in gaps],
+        actionable_steps=[f"Strengthen the {label} part of your case." for _, label in gaps],
+    )
+
+
+def _bullets(items: Any) -> str:
+    if isinstance(items, dict):
+        items = [f"{key.replace('_', ' ').title()}: {value}" for key, value in items.items()]
+    return "\n".join(f"- {item}" for item in items or []) or "- None provided"
+
+
+def _fallback_report(ctx: dict) -> str:
+    """A plain report assembled from the stage outputs, for when the ReportGenerator runs out of time."""
+    inputs = ctx[INPUTS_KEY]
+    scoring = inputs.get("scoring", {})
+    recommendations = inputs.get("recommendations", {})
+    sections = [
+        f"# ImmiSense Assessment: {ctx['request'].visa_category}",
+        "## Applicant Profile", _bullets(inputs.get("profile")),
+        "## Eligibility Assessment", f"**Overall score: {scoring.get('overall_score', 0):.0f}/100**",
+        _bullets(scoring.get("score_breakdown", {}).get("criteria")),
+        "### Requirements", _bullets(inputs.get("requirements")),
+        "## Strategic Recommendations", recommendations.get("summary", ""),
+        "### Key Considerations", _bullets(recommendations.get("key_considerations")),
+        "### Actionable Steps", _bullets(recommendations.get("actionable_steps")),
+    ]
+    if recommendations.get("alternative_pathways"):
+        sections += ["### Alternative Pathways", _bullets(recommendations["alternative_pathways"])]
+    sections.append("_The full written report wasn't ready in time; this version lists the assessment data directly._")
+    return "\n\n".join(sections)
+
+
+def build_stages(agents: dict, report_attempt: Optional[Callable[[Callable[[str], Any]], Any]] = None) -> list[Stage]:
+    """
+    Wires the agents into the assessment DAG.
+
+    Args:
+        agents: Output of `build_agents`.
+        report_attempt: Optional wrapper around the report call, given a function
+            that runs the ReportGenerator on a model id (used for tier escalation).
+
+    Returns:
+        The pipeline stages.
+    """
+    def call(agent_name: str, message: str, output_model: type[BaseModel]) -> Any:
+        return _call(agents, agent_name, message, output_model)
+
+    def parse_profile(ctx: dict) -> ParsedProfile:
+        return _prepare_profile(agents, ctx["request"], ctx["request"].visa_category)
+
+    def research_requirements(ctx: dict) -> VisaRequirements:
+        return _load_requirements(agents, ctx["request"].visa_category)
+
+    def answered(ctx: dict) -> list[tuple[str, str]]:
+        # Only the free-text answers need the model; blank answers count as 0.
+        return [(q, a) for q, a in ctx["request"].answers.items() if str(a).strip()]
+
+    def answers_payload(ctx: dict) -> dict:
+        return {
+            "visa_category": ctx["request"].visa_category,
+            **ctx[INPUTS_KEY],
+            "answers": [{"question": q, "answer": a} for q, a in answered(ctx)],
+        }
+
+    def rate_answers(ctx: dict) -> AnswerAssessment:
+        request: AssessmentRequest = ctx["request"]
+        answers = answered(ctx)
+        if not answers:
+            return AnswerAssessment(answer_score=0.0 if request.answers else None)
+        ratings = call("AnswerAssessor", compact_json(answers_payload(ctx)), AnswerRatings)
+        if len(ratings.answer_scores) != len(answers):
+            raise ValueError(f"Expected {len(answers)} answer scores, got {len(ratings.answer_scores)}")
+        scores = [min(100.0, max(0.0, s)) for s in ratings.answer_scores]
+        return AnswerAssessment(answer_score=sum(scores) / len(request.answers), notes=ratings.notes)
+
+    def score(ctx: dict) -> ScoringResult:
+        request: AssessmentRequest = ctx["request"]
+        profile = ctx["profile"].model_dump()
+        answers: AnswerAssessment = ctx["answers"]
+        profile_score = float(score_profiles([profile], (request.visa_category,))[0, 0])
+        breakdown = {"criteria": score_breakdown(profile, request.visa_category), "profile_score": round(profile_score, 1)}
+        if answers.answer_score is not None:
+            breakdown["answers_score"] = round(answers.answer_score, 1)
+            breakdown["answer_notes"] = answers.notes
+        return ScoringResult(overall_score=blend_scores(profile_score, answers.answer_score, request.visa_category),
+                             score_breakdown=breakdown)
+
+    def recommend(ctx: dict) -> Recommendations:
+        # The raw answers stay out: AnswerAssessor's notes in the scoring carry what matters.
+        return call("RecommendationAgent", compact_json(ctx[INPUTS_KEY]), Recommendations)
+
+    def report(ctx: dict) -> str:
+        payload = compact_json(ctx[INPUTS_KEY])
+        generator = agents["ReportGenerator"]
+
+        def run_on(model_id: str) -> Any:
+            generator.model.id = model_id
+            # An escalated attempt starts over; listeners drop what was streamed so far.
+            publish("attempt", {"model": model_id})
+            return stream_agent(generator, payload, lambda text: publish("token", {"text": text}), app="immisense")
+
+        response = report_attempt(run_on) if report_attempt else run_on(generator.model.id)
+        return response.content
+
+    # Requirements aren't memoized: the visa index is already their cache.
+    return [
+        Stage("profile", parse_profile, deps=("request",),
+              key=lambda ctx: _memo(ctx["request"].profile, ctx["request"].visa_category),
+              timeout=STAGE_TIMEOUTS["profile"]),
+        Stage("requirements", research_requirements, deps=("request",),
+              timeout=STAGE_TIMEOUTS["requirements"], fallback=_fallback_requirements),
+        Stage("answers", rate_answers, deps=("requirements",), reads={"requirements": "visa_requirements"},
+              key=lambda ctx: _memo(answers_payload(ctx), len(ctx["request"].answers)),
+              timeout=STAGE_TIMEOUTS["answers"], fallback=_fallback_answers),
+        # Local and takes microseconds, so not worth a cache round trip.
+        Stage("scoring", score, deps=("profile", "answers")),
+        Stage("recommendations", recommend, deps=("profile", "requirements", "scoring"),
+              reads={"profile": ADVICE_PROFILE_FIELDS, "requirements": "visa_requirements", "scoring": None},
+              key=lambda ctx: _memo(ctx[INPUTS_KEY]),
+              timeout=STAGE_TIMEOUTS["recommendations"], fallback=_fallback_recommendations),
+        Stage("report", report, deps=("profile", "requirements", "scoring", "recommendations"),
+              reads={"profile": None, "requirements": "visa_requirements", "scoring": None, "recommendations": None},
+              key=lambda ctx: _memo(ctx[INPUTS_KEY]), fallback=_fallback_report),
+    ]
+
+
+def run_assessment(request: AssessmentRequest, *, report_model: str = REPORT_MODEL,
+                   report_attempt: Optional[Callable] = None, on_event: Optional[Callable] = None,
+                   use_cache: bool = True) -> dict:
+    """
+    Runs a full assessment.
+
+    Args:
+        request: The profile, visa category and answers.
+        report_model: Starting Gemini model for the ReportGenerator.
+        report_attempt: Optional wrapper used to escalate the report stage.
+        on_event: Stage progress callback, see `pipeline_utils.run_pipeline`. The
+            report stage also sends "attempt" ({"model": ...}) when a generation
+            starts and "token" ({"text": ...}) for each streamed chunk.
+        use_cache: Reuse stage outputs whose inputs haven't changed.
+
+    Returns:
+        The pipeline results: 'request', 'profile', 'requirements', 'answers',
+        'scoring', 'recommendations', the Markdown 'report' and the names of the
+        reused and of the degraded (timed out) stages.
+    """
+    agents = build_agents(report_model=report_model)
+    with deadline(IMMISENSE_DEADLINE_SECONDS):
+        return run_pipeline(build_stages(agents, report_attempt), {"request": request},
+                            name="immisense", on_event=on_event, cache=stage_cache() if use_cache else None)
+
+
+def format_ranking_table(comparison: ComparisonResult) -> str:
+    """Renders the ranking as the Markdown table that opens a comparison report."""
+    lines = ["| Rank | Visa | Profile match | Gaps |", "| --- | --- | --- | --- |"]
+    for rank, row in enumerate(comparison.rankings, start=1):
+        gaps = ", ".join(row.gaps) if row.gaps else "None"
+        lines.append(f"| {rank} | {row.visa_category} | {row.score:.0f}/100 | {gaps} |")
+    return "\n".join(lines)
+
+
+def build_comparison_stages(agents: dict, visa_categories: list[str]) -> list[Stage]:
+    """
+    Wires the compare-all-visas DAG: the profile is prepared once, each visa's
+    requirements are loaded concurrently, every visa is scored in one NumPy
+    pass, and ComparisonWriter explains the ranking.
+
+    Args:
+        agents: Output of `build_agents`.
+        visa_categories: The visas to compare.
+
+    Returns:
+        The pipeline stages.
+    """
+    requirement_stages = [f"requirements:{visa}" for visa in visa_categories]
+
+    def parse_profile(ctx: dict) -> ParsedProfile:
+        request: ComparisonRequest = ctx["request"]
+        query_request = AssessmentRequest(profile=request.profile, visa_category=", ".join(request.visa_categories))
+        return _prepare_profile(agents, query_request, None)
+
+    def requirements_for(visa: str) -> Callable[[dict], VisaRequirements]:
+        return lambda ctx: _load_requirements(agents, visa)
+
+    def score(ctx: dict) -> ComparisonResult:
+        rankings = rank_visas(ctx["profile"].model_dump(), visa_categories)
+        return ComparisonResult(rankings=[VisaRanking(**row) for row in rankings])
+
+    def ranking_table(ctx: dict) -> str:
+        heading = f"# ImmiSense Visa Comparison: {ctx['request'].goal}\n\n"
+        return heading + format_ranking_table(ctx["scoring"]) + "\n\n"
+
+    def report(ctx: dict) -> str:
+        table = ranking_table(ctx)
+        publish("token", {"text": table})
+        payload = compact_json({"goal": ctx["request"].goal, **ctx[INPUTS_KEY]})
+        response = stream_agent(agents["ComparisonWriter"], payload,
+                                lambda text: publish("token", {"text": text}), app="immisense")
+        return table + (response.content or "")
+
+    def fallback_report(ctx: dict) -> str:
+        top = ctx["scoring"].rankings[:3]
+        lines = [f"- **{row.visa_category}** ({row.score:.0f}/100): "
+                 + (f"to work on: {', '.join(row.gaps)}" if row.gaps else "no gaps found") for row in top]
+        return (ranking_table(ctx) + "## Recommended Pathways\n\n" + "\n".join(lines)
+                + "\n\n_The written comparison wasn't ready in time; these are the top-ranked visas._")
+
+    return [
+        Stage("profile", parse_profile, deps=("request",), key=lambda ctx: _memo(ctx["request"].profile, None),
+              timeout=STAGE_TIMEOUTS["profile"]),
+        *[Stage(stage, requirements_for(visa), deps=("request",), timeout=STAGE_TIMEOUTS["requirements"],
+                fallback=_fallback_requirements)
+          for stage, visa in zip(requirement_stages, visa_categories)],
+        Stage("scoring", score, deps=("profile",)),
+        Stage("report", report, deps=("profile", "scoring", *requirement_stages),
+              reads={"profile": None, "scoring": "rankings",
+                     **{stage: "visa_requirements" for stage in requirement_stages}},
+              key=lambda ctx: _memo(ctx["request"].goal, ctx[INPUTS_KEY]), fallback=fallback_report),
+    ]
+
+
+def run_comparison(request: ComparisonRequest, *, report_model: str = REPORT_MODEL,
+                   on_event: Optional[Callable] = None, use_cache: bool = True) -> dict:
+    """
+    Compares every visa of a goal in roughly the wall time of one assessment.
+
+    Args:
+        request: The profile, goal and visas to compare.
+        report_model: Gemini model for the ComparisonWriter.
+        on_event: Stage progress callback, as for `run_assessment`.
+        use_cache: Reuse stage outputs whose inputs haven't changed.
+
+    Returns:
+        The pipeline results, including 'scoring' (a ComparisonResult) and the
+        Markdown 'report'.
+    """
+    agents = build_agents(report_model=report_model)
+    with deadline(IMMISENSE_DEADLINE_SECONDS):
+        return run_pipeline(build_comparison_stages(agents, request.visa_categories), {"request": request},
+                            name="immisense_comparison", max_workers=COMPARISON_WORKERS, on_event=on_event,
+                            cache=stage_cache() if use_cache else None)
+
+
+def report_key(request: Union[AssessmentRequest, ComparisonRequest]) -> str:
+    """Key of a request's report in `report_store`; a new PIPELINE_VERSION starts fresh reports."""
+    return request_fingerprint(type(request).__name__, PIPELINE_VERSION, request.model_dump())
+
+
+def validate_report(response: Any) -> list[str]:
+    """Escalation check for the report stage."""
+    return missing_assessment_sections(getattr(response, "content", response))
@@ -149,4 +149,56 @@ ASSESSMENT_QUESTIONS = {
 "Is your name on the manifest of the vessel or aircraft?",
 "Can you demonstrate that your entry to the U.S. is solely for the purpose of performing your duties as a crewmember?"
 ]
-}
\ No newline at end of file
+}
+
+
+# Rule-based eligibility criteria per visa: feature -> (weight, threshold).
+# A feature scores min(value / threshold, 1), so the threshold is the level at
+# which a criterion is fully met. Features are defined in eligibility_utils.FEATURES;
+# degree_level is 1 = high school, 2 = bachelor's, 3 = master's, 4 = PhD.
+CLEAN_RECORD = {"no_denials": (1, 1), "no_criminal_history": (2, 1)}
+VISA_CRITERIA = {
+    "H-1B": {"degree_level": (3, 2), "sponsorship": (3, 1), "years_of_experience": (1, 2), "english": (1, 1), **CLEAN_RECORD},
+    "L-1": {"sponsorship": (3, 1), "years_of_experience": (3, 1), "degree_level": (1, 2), **CLEAN_RECORD},
+    "O-1": {"degree_level": (2, 4), "years_of_experience": (3, 10), "annual_income_usd": (2, 150000), "sponsorship": (2, 1), **CLEAN_RECORD},
+    "TN": {"usmca_national": (5, 1), "degree_level": (3, 2), "sponsorship": (3, 1), **CLEAN_RECORD},
+    "H-2A/H-2B": {"sponsorship": (4, 1), "years_of_experience": (1, 1), **CLEAN_RECORD},
+    "P Visas": {"years_of_experience": (3, 5), "sponsorship": (3, 1), "annual_income_usd": (1, 50000), **CLEAN_RECORD},
+    "R-1": {"sponsorship": (4, 1), "years_of_experience": (2, 2), **CLEAN_RECORD},
+
+    "EB-1": {"degree_level": (2, 4), "years_of_experience": (3, 10), "annual_income_usd": (2, 200000), **CLEAN_RECORD},
+    "EB-2": {"degree_level": (4, 3), "years_of_experience": (2, 5), "sponsorship": (3, 1), **CLEAN_RECORD},
+    "EB-3": {"degree_level": (2, 2), "years_of_experience": (2, 2), "sponsorship": (4, 1), **CLEAN_RECORD},
+    "EB-5": {"liquid_assets_usd": (6, 800000), **CLEAN_RECORD},
+
+    "F-1": {"degree_level": (2, 1), "liquid_assets_usd": (3, 40000), "english": (2, 1), **CLEAN_RECORD},
+    "J-1": {"degree_level": (2, 1), "english": (2, 1), "sponsorship": (2, 1), "liquid_assets_usd": (1, 15000), **CLEAN_RECORD},
+    "M-1": {"degree_level": (1, 1), "liquid_assets_usd": (3, 25000), "english": (1, 1), **CLEAN_RECORD},
+
+    "K-1": {"no_denials": (2, 1), "no_criminal_history": (3, 1)},
+    "K-3": {"no_denials": (2, 1), "no_criminal_history": (3, 1)},
+    "IR Visas": {"no_denials": (1, 1), "no_criminal_history": (3, 1)},
+    "F Visas": {"no_denials": (1, 1), "no_criminal_history": (3, 1)},
+
+    "B-1": {"annual_income_usd": (3, 30000), "liquid_assets_usd": (2, 10000), "no_denials": (3, 1), "no_criminal_history": (2, 1)},
+    "B-2": {"annual_income_usd": (3, 30000), "liquid_assets_usd": (2, 10000), "no_denials": (3, 1), "no_criminal_history": (2, 1)},
+
+    "C": {"liquid_assets_usd": (1, 2000), "no_denials": (2, 1), "no_criminal_history": (2, 1)},
+    "I": {"sponsorship": (3, 1), "years_of_experience": (2, 2), **CLEAN_RECORD},
+    "D": {"sponsorship": (4, 1), "years_of_experience": (1, 1), **CLEAN_RECORD},
+}
+
+# Share of the overall score that comes from the free-text answers. Family
+# visas hinge on the relationship, which only the answers describe.
+ANSWER_WEIGHT = {"O-1": 0.5, "EB-1": 0.5, "P Visas": 0.5, "K-1": 0.7, "K-3": 0.7, "IR Visas": 0.7, "F Visas": 0.7}
+DEFAULT_ANSWER_WEIGHT = 0.4
+
+
+# Sections the ReportGenerator is instructed to include in every report.
+REPORT_SECTIONS = ["Applicant Profile", "Eligibility Assessment", "Strategic Recommendations"]
+
+
+def missing_assessment_sections(report: str) -> list[str]:
+    """Returns the required report sections that do not appear in the report."""
+    report = (report or "").lower()
+    return [section for section in REPORT_SECTIONS if section.lower() not in report]